@@ -0,0 +1,192 @@
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from disk_cache import CACHE_DIR
+from vector_store import LocalVectorStore, DIMENSION
+from tracing import count
+
+ANSWER_CACHE_DIR = os.getenv("ANSWER_CACHE_DIR", os.path.join(CACHE_DIR, "answers"))
+# Cosine similarity between two questions for one's answer to be reused for the other
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400"))
+# Time-sensitive questions ("latest", "today", a year...) go stale much faster
+ANSWER_CACHE_FRESH_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_FRESH_TTL_SECONDS", "900"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "5000"))
+# Nearest past questions checked per lookup, so an expired neighbour cannot hide a fresh one
+ANSWER_CACHE_CANDIDATES = 5
+
+class AnswerCache:
+    """
+    Semantic cache of final answers keyed by the question's embedding.
+
+    A lookup queries a LocalVectorStore of past questions; the closest match
+    above ANSWER_CACHE_THRESHOLD that is still within its TTL returns the
+    stored answer and reward, and expired matches are dropped on the way. Entries also record their source URLs, so re-ingesting
+    a page drops every answer built from it. The oldest entries are evicted
+    beyond ANSWER_CACHE_SIZE. Hit and miss counters are kept in the same
+    SQLite file, so stats() covers every worker sharing the cache.
+    """
+
+    def __init__(self, path=ANSWER_CACHE_DIR, max_entries=ANSWER_CACHE_SIZE, threshold=ANSWER_CACHE_THRESHOLD):
+        os.makedirs(path, exist_ok=True)
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self._vectors = LocalVectorStore(path, DIMENSION)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(path, "answers.sqlite3"), timeout=30,
+                                   check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "id TEXT PRIMARY KEY, query TEXT NOT NULL, answer TEXT NOT NULL, reward REAL, "
+            "ttl REAL NOT NULL, created REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS answers_created ON answers (created)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS sources (url TEXT NOT NULL, answer_id TEXT NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS sources_url ON sources (url)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def _count(self, name, amount=1):
+        self._db.execute(
+            "INSERT INTO counters (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            (name, amount)
+        )
+
+    def lookup(self, query_embedding):
+        """Return {"query", "answer", "reward", "similarity", "age_seconds"} for a fresh close match, else None."""
+        if self.max_entries <= 0:
+            return None
+        matches = self._vectors.query(vector=query_embedding, top_k=ANSWER_CACHE_CANDIDATES)["matches"]
+        matches = [match for match in matches if match["score"] >= self.threshold]
+        with self._lock:
+            stale = []
+            found = None
+            for match in matches:
+                row = self._db.execute(
+                    "SELECT query, answer, reward, ttl, created FROM answers WHERE id = ?", (match["id"],)
+                ).fetchone()
+                if row is None or time.time() - row[4] > row[3]:
+                    stale.append((match["id"], row is not None))
+                    continue
+                found = (match, row)
+                break
+            if stale:
+                self._remove([answer_id for answer_id, _ in stale])
+
+            if found is None:
+                self._count("expired" if any(expired for _, expired in stale) else "misses")
+                count("cache_misses", cache="answer")
+                return None
+
+            self._count("hits")
+            count("cache_hits", cache="answer")
+            match, (query, answer, reward, _, created) = found
+            return {
+                "query": query,
+                "answer": answer,
+                "reward": reward,
+                "similarity": round(match["score"], 4),
+                "age_seconds": round(time.time() - created, 1)
+            }
+
+    def store(self, query, query_embedding, answer, reward, urls, fresh=False):
+        """Remember an answer; `urls` are the sources it was built from, `fresh` selects the short TTL."""
+        if self.max_entries <= 0 or not answer:
+            return
+        answer_id = hashlib.sha1(query.strip().lower().encode("utf-8")).hexdigest()
+        ttl = ANSWER_CACHE_FRESH_TTL_SECONDS if fresh else ANSWER_CACHE_TTL_SECONDS
+        self._vectors.upsert(vectors=[{"id": answer_id, "values": list(query_embedding), "metadata": {}}])
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO answers (id, query, answer, reward, ttl, created) VALUES (?, ?, ?, ?, ?, ?)",
+                    (answer_id, query, answer, reward, ttl, time.time())
+                )
+                self._db.execute("DELETE FROM sources WHERE answer_id = ?", (answer_id,))
+                self._db.executemany(
+                    "INSERT INTO sources (url, answer_id) VALUES (?, ?)",
+                    [(url, answer_id) for url in set(urls) if url]
+                )
+                (total,) = self._db.execute("SELECT COUNT(*) FROM answers").fetchone()
+                overflow = total - self.max_entries
+                evicted = []
+                if overflow > 0:
+                    evicted = [r[0] for r in self._db.execute(
+                        "SELECT id FROM answers ORDER BY created ASC LIMIT ?", (overflow,)
+                    ).fetchall()]
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            if evicted:
+                self._count("evictions", len(evicted))
+                self._remove(evicted)
+
+    def invalidate_urls(self, urls):
+        """Drop every cached answer that used one of these (re-ingested) pages."""
+        urls = [url for url in set(urls) if url]
+        if not urls:
+            return 0
+        with self._lock:
+            placeholders = ",".join("?" * len(urls))
+            ids = [r[0] for r in self._db.execute(
+                f"SELECT DISTINCT answer_id FROM sources WHERE url IN ({placeholders})", urls
+            ).fetchall()]
+            if ids:
+                self._count("invalidations", len(ids))
+                self._remove(ids)
+        if ids:
+            print(f"Answer cache: invalidated {len(ids)} answers built from re-ingested pages", file=sys.stderr)
+        return len(ids)
+
+    def _remove(self, ids):
+        placeholders = ",".join("?" * len(ids))
+        self._db.execute(f"DELETE FROM answers WHERE id IN ({placeholders})", ids)
+        self._db.execute(f"DELETE FROM sources WHERE answer_id IN ({placeholders})", ids)
+        self._vectors.delete(ids=ids)
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._db.execute("SELECT name, value FROM counters").fetchall())
+            (entries,) = self._db.execute("SELECT COUNT(*) FROM answers").fetchone()
+        lookups = counters.get("hits", 0) + counters.get("misses", 0) + counters.get("expired", 0)
+        return {
+            "entries": entries,
+            "hits": counters.get("hits", 0),
+            "misses": counters.get("misses", 0),
+            "expired": counters.get("expired", 0),
+            "evictions": counters.get("evictions", 0),
+            "invalidations": counters.get("invalidations", 0),
+            "hit_rate": round(counters.get("hits", 0) / lookups, 4) if lookups else 0.0
+        }
+
+_shared = None
+_shared_lock = threading.Lock()
+
+def get_answer_cache():
+    """The AnswerCache shared by everything in this process, opened on first use."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = AnswerCache()
+        return _shared
+
+def invalidate_cached_answers(urls):
+    """Drop cached answers built from pages that were just (re)written to the index."""
+    if ANSWER_CACHE_SIZE <= 0 or not urls:
+        return 0
+    return get_answer_cache().invalidate_urls(urls)
+
+if __name__ == "__main__":
+    # python answer_cache.py stats
+    if len(sys.argv) == 2 and sys.argv[1] == "stats":
+        print(json.dumps(AnswerCache().stats(), indent=2))
+    else:
+        print("Usage: python answer_cache.py stats", file=sys.stderr)
+        sys.exit(1)
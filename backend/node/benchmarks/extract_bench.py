@@ -0,0 +1,128 @@
+import argparse
+import html
+import json
+import os
+import statistics
+import sys
+import time
+from bs4 import BeautifulSoup
+
+# Micro-benchmark of HTML-to-text extraction over the pages in scraped_data.json.
+# The file only keeps the extracted text, so each document is rebuilt as a page
+# with the usual weight around it (head scripts and styles, a navigation menu,
+# cookie banner, sidebar, comments and footer) and then extracted by:
+#   legacy     - the old scrape_webpage path: html.parser, decompose(), get_text()
+#   selectolax / lxml / bs4 - html_extract.extract_text with that backend
+# --html-dir benchmarks saved .html files instead of the synthesized pages.
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+NODE_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, NODE_DIR)
+
+from html_extract import extract_text, available_backends, EXTRACT_MAX_WORDS
+
+DATA_PATH = os.path.join(NODE_DIR, "scraped_data.json")
+
+def synthesize_page(doc, boilerplate_links=60):
+    words = doc["content"].split()
+    paragraphs = "\n".join(
+        f"<p>{html.escape(' '.join(words[i:i + 60]))}</p>" for i in range(0, len(words), 60)
+    )
+    links = "".join(f'<li><a href="/section/{i}">Section {i}</a></li>' for i in range(boilerplate_links))
+    comments = "".join(
+        f'<div class="comment"><span class="author">user{i}</span><p>Great article, thanks for sharing!</p></div>'
+        for i in range(boilerplate_links // 3)
+    )
+    return (
+        f"<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>{html.escape(doc.get('title') or '')}</title>"
+        f"<style>{'body {{ margin: 0 }} .nav a {{ color: #333 }} ' * 50}</style>"
+        f"<script>{'window.dataLayer = window.dataLayer || []; ' * 100}</script></head><body>"
+        f"<header class=\"site-header\"><nav class=\"nav\"><ul>{links}</ul></nav></header>"
+        f"<div class=\"cookie-banner\">We use cookies to improve your experience. <button>Accept</button></div>"
+        f"<div class=\"layout\"><aside class=\"sidebar\"><ul>{links}</ul></aside>"
+        f"<article><h1>{html.escape(doc.get('title') or '')}</h1>{paragraphs}"
+        f"<div class=\"share-buttons\"><a>Share</a><a>Tweet</a></div></article>"
+        f"<section id=\"comments\">{comments}</section></div>"
+        f"<footer class=\"site-footer\"><ul>{links}</ul><p>Copyright</p></footer>"
+        f"<script>{'trackPageView(); ' * 100}</script></body></html>"
+    ).encode("utf-8")
+
+def legacy_extract(page):
+    soup = BeautifulSoup(page, "html.parser")
+    for tag in soup(["script", "style", "noscript", "iframe"]):
+        tag.decompose()
+    return soup.get_text(separator=" ", strip=True)
+
+def load_pages(html_dir, boilerplate_links):
+    if html_dir:
+        pages = []
+        for name in sorted(os.listdir(html_dir)):
+            if name.endswith((".html", ".htm")):
+                with open(os.path.join(html_dir, name), "rb") as f:
+                    pages.append(f.read())
+        return pages
+    with open(DATA_PATH, "r", encoding="utf-8") as f:
+        return [synthesize_page(doc, boilerplate_links) for doc in json.load(f)]
+
+def bench(extract, pages, repeats):
+    """Best-of-repeats seconds per page, plus the extracted word count."""
+    seconds = []
+    words = 0
+    for page in pages:
+        best = None
+        for _ in range(repeats):
+            start = time.perf_counter()
+            text = extract(page)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        seconds.append(best)
+        words += len(text.split())
+    total_bytes = sum(len(page) for page in pages)
+    ordered = sorted(seconds)
+    return {
+        "total_ms": round(sum(seconds) * 1000, 2),
+        "p50_ms": round(statistics.median(seconds) * 1000, 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))] * 1000, 3),
+        "mb_per_second": round(total_bytes / sum(seconds) / 1e6, 2),
+        "avg_words": round(words / len(pages), 1)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="HTML extraction micro-benchmark.")
+    parser.add_argument("--repeats", type=int, default=5, help="Runs per page; the fastest is kept")
+    parser.add_argument("--backends", default=",".join(["legacy"] + available_backends()))
+    parser.add_argument("--max-words", type=int, default=EXTRACT_MAX_WORDS,
+                        help="Early-stop limit for html_extract (0 reads the whole page)")
+    parser.add_argument("--boilerplate-links", type=int, default=60, help="Menu size of the synthesized pages")
+    parser.add_argument("--html-dir", help="Benchmark the .html files in this directory instead")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    pages = load_pages(args.html_dir, args.boilerplate_links)
+    if not pages:
+        sys.exit("No pages to benchmark")
+    max_words = args.max_words or float("inf")
+    results = {
+        "pages": len(pages),
+        "avg_kb": round(sum(len(page) for page in pages) / len(pages) / 1024, 1),
+        "max_words": args.max_words,
+        "backends": {}
+    }
+    for name in args.backends.split(","):
+        if name == "legacy":
+            extract = legacy_extract
+        else:
+            extract = lambda page, name=name: extract_text(page, backend=name, max_words=max_words)
+        results["backends"][name] = bench(extract, pages, args.repeats)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    stop = f"early stop at {args.max_words} words" if args.max_words else "no early stop"
+    print(f"{results['pages']} pages, {results['avg_kb']} KB on average, {stop}")
+    print(f"{'backend':<12}{'total ms':>10}{'p50 ms':>9}{'p95 ms':>9}{'MB/s':>8}{'words':>9}")
+    for name, row in results["backends"].items():
+        print(f"{name:<12}{row['total_ms']:>10}{row['p50_ms']:>9}{row['p95_ms']:>9}{row['mb_per_second']:>8}{row['avg_words']:>9}")
+
+if __name__ == "__main__":
+    main()
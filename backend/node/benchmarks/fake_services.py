@@ -0,0 +1,182 @@
+import html
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-ins for the paid services, so the pipeline can be benchmarked offline:
+#   Serper  - POST /search ranks scraped_data.json documents by term overlap with the query
+#   pages   - GET /page/<n> serves each document's content as a small HTML page
+#   Groq    - POST /openai/v1/chat/completions returns canned answers (streamed or not)
+#             and judge JSON, after a configurable delay
+NODE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_PATH = os.path.join(NODE_DIR, "scraped_data.json")
+
+def _terms(text):
+    return set(re.findall(r"[a-z0-9]+", text.lower()))
+
+def _page_html(doc):
+    words = doc["content"].split()
+    paragraphs = "\n".join(
+        f"<p>{html.escape(' '.join(words[i:i + 60]))}</p>" for i in range(0, len(words), 60)
+    )
+    return (
+        f"<html><head><title>{html.escape(doc.get('title') or '')}</title>"
+        f"<script>var tracking = true;</script></head>"
+        f"<body><nav>Home | About | Contact</nav><article>{paragraphs}</article>"
+        f"<footer>Copyright</footer></body></html>"
+    ).encode("utf-8")
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass  # keep benchmark output clean
+
+    def _send(self, status, body, content_type="application/json", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        match = re.fullmatch(r"/page/(\d+)", self.path)
+        services = self.server.services
+        if not match or int(match.group(1)) >= len(services.documents):
+            return self._send(404, b"not found", "text/plain")
+        time.sleep(services.page_latency)
+        n = int(match.group(1))
+        self._send(200, services.pages[n], "text/html; charset=utf-8", {"ETag": f'"page-{n}"'})
+
+    def do_POST(self):
+        services = self.server.services
+        if self.path == "/search":
+            time.sleep(services.serper_latency)
+            request = self._read_json()
+            return self._send(200, json.dumps({"organic": services.search(request.get("q", ""), request.get("num", 5))}).encode())
+        if self.path.endswith("/chat/completions"):
+            return self._chat(services, self._read_json())
+        self._send(404, b"not found", "text/plain")
+
+    def _chat(self, services, request):
+        services.count("groq_calls")
+        prompt = request["messages"][-1]["content"]
+        if request.get("response_format", {}).get("type") == "json_object":
+            content = json.dumps({
+                "rag_scores": {"faithfulness": 8, "completeness": 7, "clarity": 8},
+                "llm_scores": {"faithfulness": 6, "completeness": 6, "clarity": 7},
+                "winner": "RAG",
+                "justification": "Canned judgement from the benchmark stub."
+            })
+        else:
+            # Echo a slice of the prompt so answers vary with the retrieved context
+            content = " ".join(prompt.split()[-services.answer_words:])
+        created = int(time.time())
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        time.sleep(services.groq_latency)
+
+        if not request.get("stream"):
+            return self._send(200, json.dumps({
+                "id": completion_id, "object": "chat.completion", "created": created, "model": request["model"],
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": len(prompt.split()), "completion_tokens": len(content.split()),
+                          "total_tokens": len(prompt.split()) + len(content.split())}
+            }).encode())
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def chunk(delta, finish_reason=None):
+            event = {
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": request["model"],
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }
+            write(f"data: {json.dumps(event)}\n\n")
+
+        def write(text):
+            data = text.encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        for word in content.split():
+            chunk({"content": word + " "})
+            time.sleep(services.token_interval)
+        chunk({}, "stop")
+        write("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+class FakeServices:
+    """
+    Start the fake Serper, page and Groq servers on one local port.
+
+    Use as a context manager; env() returns the variables that point the
+    pipeline scripts at it.
+    """
+
+    def __init__(self, data_path=DATA_PATH, serper_latency=0.05, page_latency=0.05,
+                 groq_latency=0.5, token_interval=0.01, answer_words=120):
+        with open(data_path, "r", encoding="utf-8") as f:
+            self.documents = json.load(f)
+        self.pages = [_page_html(doc) for doc in self.documents]
+        self._doc_terms = [_terms(f"{doc.get('title', '')} {doc.get('snippet', '')} {doc['content']}") for doc in self.documents]
+        self.serper_latency = serper_latency
+        self.page_latency = page_latency
+        self.groq_latency = groq_latency
+        self.token_interval = token_interval
+        self.answer_words = answer_words
+        self.counters = {}
+        self._counter_lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.services = self
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def count(self, name):
+        with self._counter_lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    def search(self, query, num):
+        self.count("serper_calls")
+        query_terms = _terms(query)
+        ranked = sorted(range(len(self.documents)), key=lambda i: -len(query_terms & self._doc_terms[i]))
+        return [
+            {
+                "title": self.documents[i].get("title"),
+                "link": f"{self.url}/page/{i}",
+                "snippet": self.documents[i].get("snippet", ""),
+                "position": rank + 1
+            }
+            for rank, i in enumerate(ranked[:num])
+        ]
+
+    def env(self):
+        return {
+            "SERPER_URL": f"{self.url}/search",
+            "GROQ_BASE_URL": self.url,
+            "GROQ_API_KEY": "benchmark",
+        }
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,342 @@
+import argparse
+import contextlib
+import json
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Offline end-to-end benchmark. Serper, the scraped pages and Groq are served by
+# fake_services.py, the vector index is a LocalVectorStore in a temp directory,
+# and every cache and log the scripts write is redirected there too. Sections:
+#   ingest     - embed_and_upload.py over scraped_data.json (docs/s, peak RSS)
+#   query      - rag_query.run_query in-process, per-stage latency and time to first token
+#   compare    - rag_query_compare.run_comparison in-process, its per-stage timings
+#   evaluate   - comprehensive_evaluation on its own
+#   throughput - N warm `--worker` processes driven concurrently, for each N in --concurrency
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+NODE_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, NODE_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from fake_services import FakeServices, DATA_PATH
+
+def summarize(values):
+    """p50/p95/p99/mean in seconds for a list of durations."""
+    if not values:
+        return None
+    values = np.asarray(values, dtype=np.float64)
+    return {
+        "count": int(values.size),
+        "p50": round(float(np.percentile(values, 50)), 4),
+        "p95": round(float(np.percentile(values, 95)), 4),
+        "p99": round(float(np.percentile(values, 99)), 4),
+        "mean": round(float(values.mean()), 4)
+    }
+
+def summarize_stages(runs):
+    """Turn a list of {stage: seconds} dicts into {stage: summary}."""
+    stages = sorted({name for run in runs for name in run})
+    return {name: summarize([run[name] for run in runs if name in run]) for name in stages}
+
+def own_peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+def process_peak_rss_mb(pid):
+    """Peak RSS of a running child (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+def benchmark_queries(count):
+    """Queries from scraped_data.json: the original search queries, then questions about each title."""
+    with open(DATA_PATH, "r", encoding="utf-8") as f:
+        documents = json.load(f)
+    queries = list(dict.fromkeys(doc["query"] for doc in documents))
+    queries += [f"What does '{doc['title']}' say?" for doc in documents if doc.get("title")]
+    return [queries[i % len(queries)] for i in range(count)]
+
+class StageTimer:
+    """Wraps pipeline functions so each call adds its duration to the current run."""
+
+    def __init__(self):
+        self.current = {}
+
+    def wrap(self, name, fn):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.current[name] = self.current.get(name, 0.0) + time.perf_counter() - start
+        return timed
+
+def bench_ingest(workdir, env):
+    data_path = os.path.join(workdir, "scraped_data.json")
+    shutil.copy(DATA_PATH, data_path)
+    with open(data_path, "r", encoding="utf-8") as f:
+        documents = len(json.load(f))
+
+    log_path = os.path.join(workdir, "embed_and_upload.log")
+    start = time.perf_counter()
+    with open(log_path, "wb") as log:
+        process = subprocess.Popen(
+            [sys.executable, os.path.join(NODE_DIR, "embed_and_upload.py"), "--data", data_path, "--restart"],
+            cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT
+        )
+        peak = None
+        if hasattr(os, "wait4"):
+            # wait4 also reports the child's peak RSS
+            _, status, usage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+            peak = round(usage.ru_maxrss / 1024, 1)
+        else:
+            process.wait()
+    seconds = time.perf_counter() - start
+    if process.returncode != 0:
+        with open(log_path, "r", encoding="utf-8", errors="replace") as f:
+            raise RuntimeError(f"embed_and_upload.py failed:\n{f.read()[-2000:]}")
+    return {
+        "documents": documents,
+        "seconds": round(seconds, 3),
+        "documents_per_second": round(documents / seconds, 2),
+        "peak_rss_mb": peak
+    }
+
+def bench_query(queries, stream):
+    import rag_query
+
+    resources = rag_query.load_resources()
+    timer = StageTimer()
+    for name, attr in (("search", "search_serper"), ("scrape", "scrape_many"), ("ingest", "ingest_documents"),
+                       ("generate", "generate_answer"), ("reward", "compute_reward")):
+        setattr(rag_query, attr, timer.wrap(name, getattr(rag_query, attr)))
+    resources["index"].query = timer.wrap("retrieve", resources["index"].query)
+    resources["answer_cache"].lookup = timer.wrap("answer_cache", resources["answer_cache"].lookup)
+
+    runs = []
+    for query in queries:
+        timer.current = {}
+        start = time.perf_counter()
+        first_token = []
+
+        def emit(message):
+            if message["type"] in ("answer_delta", "final_answer") and not first_token:
+                first_token.append(time.perf_counter() - start)
+
+        with contextlib.redirect_stdout(sys.stderr):
+            rag_query.run_query(query, resources, emit, stream=stream)
+        timer.current["total"] = time.perf_counter() - start
+        if first_token:
+            timer.current["time_to_first_token"] = first_token[0]
+        runs.append(timer.current)
+    return summarize_stages(runs)
+
+def bench_compare(queries, defer_evaluation):
+    import rag_query_compare
+
+    resources = rag_query_compare.load_resources()
+    runs, answers = [], []
+    for query in queries:
+        result = rag_query_compare.run_comparison(query, resources, defer_evaluation=defer_evaluation)
+        runs.append(result["timings"])
+        answers.append((query, result["rag_answer"], result["llm_answer"]))
+    return summarize_stages(runs), answers
+
+def bench_evaluate(answers):
+    from comprehensive_evaluate import comprehensive_evaluation
+
+    runs = []
+    for query, rag_answer, llm_answer in answers:
+        start = time.perf_counter()
+        evaluation = comprehensive_evaluation(query, rag_answer, llm_answer)
+        timings = dict(evaluation.get("timings", {}))
+        timings["total"] = time.perf_counter() - start
+        runs.append(timings)
+    return summarize_stages(runs)
+
+def _start_worker(script, workdir, env):
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(NODE_DIR, script), "--worker"], cwd=workdir, env=env,
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, encoding="utf-8"
+    )
+    for line in process.stdout:
+        if json.loads(line).get("type") == "ready":
+            return process
+    raise RuntimeError(f"{script} worker exited before it was ready")
+
+def bench_throughput(script, queries, levels, workdir, env, defer_evaluation):
+    """Drive `level` warm workers with `level` concurrent clients over the worker protocol."""
+    results = {}
+    for level in levels:
+        workers = [_start_worker(script, workdir, env) for _ in range(level)]
+        pending = queue.Queue()
+        for i, query in enumerate(queries):
+            pending.put((str(i), query))
+        latencies, errors = [], []
+        lock = threading.Lock()
+
+        def client(process):
+            while True:
+                try:
+                    request_id, query = pending.get_nowait()
+                except queue.Empty:
+                    return
+                start = time.perf_counter()
+                request = {"id": request_id, "query": query, "defer_evaluation": defer_evaluation}
+                process.stdin.write(json.dumps(request) + "\n")
+                process.stdin.flush()
+                for line in process.stdout:
+                    frame = json.loads(line)
+                    if frame.get("type") in ("done", "error"):
+                        break
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+                    if frame.get("type") == "error":
+                        errors.append(frame.get("error"))
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=client, args=(process,)) for process in workers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        peaks = [process_peak_rss_mb(process.pid) for process in workers]
+        for process in workers:
+            process.stdin.close()
+            process.wait()
+        results[str(level)] = {
+            "requests": len(queries),
+            "errors": len(errors),
+            "first_error": errors[0] if errors else None,
+            "seconds": round(elapsed, 3),
+            "requests_per_second": round(len(queries) / elapsed, 3),
+            "latency": summarize(latencies),
+            "worker_peak_rss_mb": max((p for p in peaks if p is not None), default=None)
+        }
+        print(f"{script} x{level}: {results[str(level)]['requests_per_second']} req/s", file=sys.stderr)
+    return results
+
+def compare_to_baseline(results, baseline, tolerance):
+    """Print every p95 that got more than `tolerance` slower than in the baseline run."""
+    def p95s(node, path=()):
+        if isinstance(node, dict):
+            if "p95" in node:
+                yield path, node["p95"]
+            for key, value in node.items():
+                yield from p95s(value, path + (key,))
+
+    old = dict(p95s(baseline))
+    regressions = []
+    for path, value in p95s(results):
+        before = old.get(path)
+        if before and value > before * (1 + tolerance):
+            regressions.append({"metric": "/".join(path), "baseline_p95": before, "p95": value})
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the RAG pipeline against local fakes.")
+    parser.add_argument("--queries", type=int, default=10, help="Requests per section and concurrency level")
+    parser.add_argument("--concurrency", default="1,2,4", help="Worker counts for the throughput section")
+    parser.add_argument("--sections", default="ingest,query,compare,evaluate,throughput")
+    parser.add_argument("--groq-latency", type=float, default=0.5, help="Seconds before the Groq stub answers")
+    parser.add_argument("--token-interval", type=float, default=0.01, help="Seconds between streamed tokens")
+    parser.add_argument("--serper-latency", type=float, default=0.05)
+    parser.add_argument("--page-latency", type=float, default=0.05)
+    parser.add_argument("--stream", action="store_true", help="Stream the answer in the query section")
+    parser.add_argument("--warm-caches", action="store_true",
+                        help="Leave the search, page and answer caches on (default: every request runs the full pipeline)")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", help="Earlier results JSON to check for p95 regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p95 slowdown against the baseline")
+    args = parser.parse_args()
+    # The run happens inside a temp directory, so resolve user paths first
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    sections = set(args.sections.split(","))
+    levels = [int(level) for level in args.concurrency.split(",")]
+    queries = benchmark_queries(args.queries)
+
+    workdir = tempfile.mkdtemp(prefix="mars-bench-")
+    services = FakeServices(serper_latency=args.serper_latency, page_latency=args.page_latency,
+                            groq_latency=args.groq_latency, token_interval=args.token_interval)
+    with services:
+        # Everything the scripts read or write points at the fakes and the temp directory.
+        # Set before the pipeline modules are imported, since they read it at import time.
+        os.environ.update(services.env())
+        os.environ.update({
+            "VECTOR_BACKEND": "local",
+            "LOCAL_INDEX_DIR": os.path.join(workdir, "index"),
+            "MARS_CACHE_DIR": os.path.join(workdir, "cache"),
+            "EVAL_QUEUE_PATH": os.path.join(workdir, "eval_queue.sqlite3"),
+            "REWARD_LOG_PATH": os.path.join(workdir, "reward_log.jsonl"),
+            "REWARD_LEGACY_FILE": os.path.join(workdir, "reward_memory.json"),
+            "RL_POLICY_FILE": os.path.join(workdir, "rl_policy.json"),
+            "RETRIEVAL_LOG_PATH": os.path.join(workdir, "retrieval_decisions.jsonl"),
+            "TRACE_LOG_PATH": os.path.join(workdir, "traces.jsonl"),
+        })
+        if not args.warm_caches:
+            os.environ.update({"SEARCH_CACHE_SIZE": "0", "PAGE_CACHE_SIZE": "0", "ANSWER_CACHE_SIZE": "0"})
+        env = dict(os.environ)
+        os.chdir(workdir)
+
+        results = {
+            "config": {**vars(args), "queries": len(queries)},
+            "timestamp": time.time()
+        }
+        try:
+            if "ingest" in sections:
+                results["ingest"] = bench_ingest(workdir, env)
+            if "query" in sections:
+                results["query"] = bench_query(queries, args.stream)
+            answers = []
+            if "compare" in sections:
+                results["compare"], answers = bench_compare(queries, defer_evaluation="evaluate" not in sections)
+            if "evaluate" in sections:
+                if not answers:
+                    answers = [(query, f"Answer about {query}.", f"Another answer about {query}.") for query in queries]
+                results["evaluate"] = bench_evaluate(answers)
+            if "throughput" in sections:
+                results["throughput"] = {
+                    script: bench_throughput(script, queries, levels, workdir, env, "evaluate" not in sections)
+                    for script in ("rag_query.py", "rag_query_compare.py")
+                }
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        results["peak_rss_mb"] = own_peak_rss_mb()
+        results["fake_service_calls"] = dict(services.counters)
+
+    if baseline:
+        with open(baseline, "r", encoding="utf-8") as f:
+            results["regressions"] = compare_to_baseline(results, json.load(f), args.tolerance)
+
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+    if results.get("regressions"):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
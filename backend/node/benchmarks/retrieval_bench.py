@@ -0,0 +1,158 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+
+# Latency and footprint of hybrid retrieval at a given corpus size. Chunks come
+# from scraped_data.json, repeated with shuffled words until --chunks is
+# reached. They are indexed into a LocalVectorStore plus LexicalIndex in a temp
+# directory, and the document titles are used as queries. Vectors are random
+# unit vectors: this measures speed, not ranking quality, and needs no
+# embedding model. --pinecone-shaped puts PineconeShapedIndex in front of the
+# store, so the hybrid path runs against the result types of the default setup.
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+NODE_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, NODE_DIR)
+
+from chunking import chunk_text
+from hybrid_index import HybridIndex, lexical_text
+from lexical_index import LexicalIndex
+from vector_store import LocalVectorStore, DIMENSION
+
+DATA_PATH = os.path.join(NODE_DIR, "scraped_data.json")
+
+class ScoredVector:
+    """Like Pinecone's match type: match["id"] and match.id work, but it is not a mapping."""
+
+    def __init__(self, **fields):
+        self.__dict__["_fields"] = fields
+
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+    def __getattr__(self, name):
+        try:
+            return self._fields[name]
+        except KeyError:
+            # Pinecone raises ApiAttributeError, an AttributeError, for unset fields
+            raise AttributeError(name) from None
+
+class PineconeShapedIndex:
+    """LocalVectorStore with Pinecone's result types and without clear()."""
+
+    def __init__(self, store):
+        self.store = store
+
+    def upsert(self, vectors, **kwargs):
+        return self.store.upsert(vectors=vectors, **kwargs)
+
+    def delete(self, ids=None, delete_all=False, **kwargs):
+        return self.store.delete(ids=ids, delete_all=delete_all, **kwargs)
+
+    def fetch(self, ids, **kwargs):
+        return self.store.fetch(ids=ids, **kwargs)
+
+    def describe_index_stats(self):
+        return self.store.describe_index_stats()
+
+    def query(self, vector, top_k=10, include_metadata=False, **kwargs):
+        matches = self.store.query(vector=vector, top_k=top_k, include_metadata=include_metadata, **kwargs)["matches"]
+        return ScoredVector(matches=[
+            ScoredVector(**{key: value for key, value in match.items() if key != "metadata" or include_metadata})
+            for match in matches
+        ])
+
+def percentiles(values):
+    values = np.asarray(values) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "mean_ms": round(float(values.mean()), 3)
+    }
+
+def load_corpus(total, seed):
+    """(chunk_id, metadata) pairs for `total` chunks, and the document titles."""
+    with open(DATA_PATH, "r", encoding="utf-8") as f:
+        documents = json.load(f)
+    base = [(doc.get("title") or "", chunk) for doc in documents for chunk in chunk_text(doc["content"])]
+    rng = random.Random(seed)
+    chunks = []
+    for n in range(total):
+        title, text = base[n % len(base)]
+        if n >= len(base):
+            words = text.split()
+            rng.shuffle(words)
+            text = " ".join(words)
+        chunks.append((f"chunk-{n}", {"title": title, "text": text}))
+    return chunks, [doc.get("title") or "" for doc in documents]
+
+def main():
+    parser = argparse.ArgumentParser(description="Hybrid retrieval latency benchmark.")
+    parser.add_argument("--chunks", type=int, default=20000, help="Corpus size in chunks")
+    parser.add_argument("--batch", type=int, default=100, help="Chunks per upsert, like one ingestion")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--alpha", type=float, default=0.5)
+    parser.add_argument("--pinecone-shaped", action="store_true",
+                        help="Return Pinecone-style match objects instead of dicts from the vector store")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="retrieval-bench-")
+    try:
+        lexical = LexicalIndex(os.path.join(workdir, "lexical"))
+        store = LocalVectorStore(os.path.join(workdir, "vectors"), DIMENSION)
+        if args.pinecone_shaped:
+            store = PineconeShapedIndex(store)
+        index = HybridIndex(store, lexical, alpha=args.alpha)
+        rng = np.random.default_rng(0)
+
+        chunks, titles = load_corpus(args.chunks, seed=0)
+        lexical_seconds = sum(
+            upsert(index, chunks[start:start + args.batch], rng) for start in range(0, len(chunks), args.batch)
+        )
+
+        queries = [titles[i % len(titles)] for i in range(args.queries)]
+        timings = {"vector": [], "lexical": [], "hybrid": []}
+        for query in queries:
+            vector = rng.normal(size=DIMENSION).tolist()
+            for name, run in (
+                ("vector", lambda: index.index.query(vector=vector, top_k=args.top_k, include_metadata=True)),
+                ("lexical", lambda: lexical.search(query, top_k=args.top_k)),
+                ("hybrid", lambda: index.query(vector=vector, top_k=args.top_k, include_metadata=True, text=query)),
+            ):
+                start = time.perf_counter()
+                run()
+                timings[name].append(time.perf_counter() - start)
+
+        results = {
+            "chunks": args.chunks,
+            "pinecone_shaped": args.pinecone_shaped,
+            "lexical_index": {**lexical.stats(), "chunks_per_second": round(args.chunks / lexical_seconds, 1)},
+            "query": {name: percentiles(values) for name, values in timings.items()}
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+
+def upsert(index, batch, rng):
+    """Upsert one batch into both sides; returns the seconds spent on the lexical side."""
+    index.index.upsert(vectors=[
+        {"id": chunk_id, "values": rng.normal(size=DIMENSION).tolist(), "metadata": metadata}
+        for chunk_id, metadata in batch
+    ])
+    start = time.perf_counter()
+    index.lexical.upsert([(chunk_id, lexical_text(metadata)) for chunk_id, metadata in batch])
+    return time.perf_counter() - start
+
+if __name__ == "__main__":
+    main()
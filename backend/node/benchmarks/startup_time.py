@@ -0,0 +1,61 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Measures the cost of `import comprehensive_evaluate` in a fresh interpreter.
+#   lazy  - import only, which is all a request that skips evaluation pays now
+#   eager - import plus preload_models(), i.e. what every import used to cost
+NODE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SNIPPET = """
+import json, time
+start = time.perf_counter()
+import comprehensive_evaluate
+imported = time.perf_counter()
+if {preload}:
+    comprehensive_evaluate.preload_models()
+ready = time.perf_counter()
+print(json.dumps({{"import_seconds": imported - start, "ready_seconds": ready - start}}))
+"""
+
+def measure(preload, repeats):
+    runs = []
+    for _ in range(repeats):
+        completed = subprocess.run(
+            [sys.executable, "-c", SNIPPET.format(preload=preload)],
+            cwd=NODE_DIR, capture_output=True, text=True, check=True
+        )
+        runs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+    return {
+        "import_seconds": round(statistics.median(r["import_seconds"] for r in runs), 3),
+        "ready_seconds": round(statistics.median(r["ready_seconds"] for r in runs), 3),
+        "runs": runs
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup-time benchmark for comprehensive_evaluate.")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    lazy = measure(False, args.repeats)
+    eager = measure(True, args.repeats)
+    results = {
+        "lazy": lazy,
+        "eager": eager,
+        "import_speedup": round(eager["ready_seconds"] / max(lazy["import_seconds"], 1e-6), 1)
+    }
+
+    print(f"lazy import:          {lazy['import_seconds']:.3f}s")
+    print(f"eager (import+load):  {eager['ready_seconds']:.3f}s")
+    print(f"speedup for requests that skip evaluation: {results['import_speedup']}x")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
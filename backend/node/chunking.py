@@ -0,0 +1,44 @@
+import os
+
+# MiniLM truncates its input at 256 word pieces, so windows are kept comfortably below that.
+CHUNK_WORDS = int(os.getenv("CHUNK_WORDS", "160"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "32"))
+MAX_CHUNKS_PER_DOCUMENT = int(os.getenv("MAX_CHUNKS_PER_DOCUMENT", "40"))
+
+def chunk_text(text, chunk_words=CHUNK_WORDS, overlap=CHUNK_OVERLAP, max_chunks=MAX_CHUNKS_PER_DOCUMENT):
+    """Split text into overlapping windows of roughly `chunk_words` words."""
+    words = text.split()
+    if not words:
+        return []
+
+    step = max(1, chunk_words - overlap)
+    chunks = []
+    for start in range(0, len(words), step):
+        chunks.append(" ".join(words[start:start + chunk_words]))
+        if start + chunk_words >= len(words) or len(chunks) >= max_chunks:
+            break
+    return chunks
+
+def chunk_document(doc_id, content, metadata, max_chunks=MAX_CHUNKS_PER_DOCUMENT):
+    """
+    Split a document into chunk records ready for embedding.
+
+    Each chunk gets the ID "<doc_id>#<n>" and carries the parent's metadata plus
+    its own text, so retrieval can return the matching passage rather than the
+    search snippet.
+    """
+    chunks = chunk_text(content, max_chunks=max_chunks)
+    return [
+        {
+            "id": f"{doc_id}#{i}",
+            "text": chunk,
+            "metadata": {
+                **metadata,
+                "parent_id": doc_id,
+                "chunk_index": i,
+                "chunk_count": len(chunks),
+                "text": chunk
+            }
+        }
+        for i, chunk in enumerate(chunks)
+    ]
@@ -1,12 +1,11 @@
 import json
 import sys
-from sentence_transformers import SentenceTransformer, util
-from bert_score import score as bert_scorer
-from transformers import pipeline
-from groq import Groq
+import threading
+from embedding_service import EmbeddingService, cosine_similarity
+from tracing import span, count, count_tokens, bind
 import dotenv
-import torch
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 print(f"[{datetime.now()}] comprehensive_evaluate.py: Script version check - Function 'check_factual_accuracy' should be defined.", file=sys.stderr)
@@ -15,34 +14,81 @@ print(f"[{datetime.now()}] comprehensive_evaluate.py: Script version check - Fun
 dotenv.load_dotenv()
 GROQ_API_KEY = dotenv.get_key(dotenv.find_dotenv(), "GROQ_API_KEY")
 
-# ======== INITIALIZE MODELS ========
-semantic_model = SentenceTransformer("all-MiniLM-L6-v2")
-qa_pipeline = pipeline("question-answering", model="deepset/roberta-base-squad2")
-groq_client = Groq(api_key=GROQ_API_KEY)
+# ======== LAZY MODEL HANDLES ========
+# Models are loaded on first use, so importing this module is cheap and a request
+# that skips evaluation never pays for them. torch, transformers and bert_score
+# are only imported inside the loaders.
+_models = {}
+_model_lock = threading.Lock()
+
+def _get_model(name, loader):
+    model = _models.get(name)
+    if model is None:
+        with _model_lock:
+            model = _models.get(name)
+            if model is None:
+                start = time.time()
+                model = loader()
+                _models[name] = model
+                count("model_load_seconds", time.time() - start, model=name)
+                print(f"[{datetime.now()}] Loaded {name} in {time.time() - start:.2f} seconds", file=sys.stderr)
+    return model
+
+def set_semantic_model(embedder):
+    """Reuse an EmbeddingService the caller already loaded instead of loading a second MiniLM."""
+    _models["semantic_model"] = embedder
+
+def get_semantic_model():
+    # Shares the on-disk embedding cache with the RAG scripts
+    return _get_model("semantic_model", EmbeddingService)
+
+def get_qa_pipeline():
+    def load():
+        from transformers import pipeline
+        return pipeline("question-answering", model="deepset/roberta-base-squad2")
+    return _get_model("qa_pipeline", load)
+
+def get_bert_scorer():
+    def load():
+        # A single BERTScorer keeps roberta-large loaded across calls
+        from bert_score import BERTScorer
+        return BERTScorer(lang="en", rescale_with_baseline=True)
+    return _get_model("bert_scorer", load)
+
+def get_groq_client():
+    def load():
+        from groq import Groq
+        return Groq(api_key=GROQ_API_KEY)
+    return _get_model("groq_client", load)
+
+def preload_models():
+    """Load every evaluation model now, e.g. in the background of a long-lived worker."""
+    get_semantic_model()
+    get_qa_pipeline()
+    get_bert_scorer()
+    get_groq_client()
 
 def calculate_semantic_similarity_between_answers(answer1, answer2):
     """Calculates semantic similarity between two answers."""
     if not answer1 or not answer2:
         return 0.0
-    emb1 = semantic_model.encode(answer1, convert_to_tensor=True)
-    emb2 = semantic_model.encode(answer2, convert_to_tensor=True)
-    similarity = util.pytorch_cos_sim(emb1, emb2).item()
+    emb1, emb2 = get_semantic_model().encode([answer1, answer2])
+    similarity = cosine_similarity(emb1, emb2)
     return round(float(similarity), 3)
 
 def calculate_semantic_similarity_to_query(answer, query):
     """Calculates semantic similarity between an answer and the original query."""
     if not answer or not query:
         return 0.0
-    emb_answer = semantic_model.encode(answer, convert_to_tensor=True)
-    emb_query = semantic_model.encode(query, convert_to_tensor=True)
-    similarity = util.pytorch_cos_sim(emb_answer, emb_query).item()
+    emb_answer, emb_query = get_semantic_model().encode([answer, query])
+    similarity = cosine_similarity(emb_answer, emb_query)
     return round(float(similarity), 3)
 
 def calculate_bert_score(candidate, reference):
     """Calculates BERTScore between a candidate and reference answer."""
     if not candidate or not reference:
         return {"precision": 0.0, "recall": 0.0, "f1": 0.0}
-    P, R, F1 = bert_scorer([candidate], [reference], lang="en", rescale_with_baseline=True)
+    P, R, F1 = get_bert_scorer().score([candidate], [reference])
     return {"precision": round(P.item(), 3), "recall": round(R.item(), 3), "f1": round(F1.item(), 3)}
 
 def check_factual_accuracy(query, answer):
@@ -51,9 +97,34 @@ def check_factual_accuracy(query, answer):
     """
     if not query or not answer:
         return 0.0
-    result = qa_pipeline(question=query, context=answer)
+    result = get_qa_pipeline()(question=query, context=answer)
     return round(result['score'], 3)
 
+def calculate_semantic_similarities(query, rag_answer, llm_answer):
+    """
+    Embeds the query and both answers in one batch and returns
+    (RAG vs LLM similarity, RAG vs query similarity).
+    """
+    if not rag_answer:
+        return 0.0, 0.0
+    emb_query, emb_rag, emb_llm = get_semantic_model().encode([query or "", rag_answer, llm_answer or ""])
+    rag_llm = round(float(cosine_similarity(emb_rag, emb_llm)), 3) if llm_answer else 0.0
+    rag_query = round(float(cosine_similarity(emb_rag, emb_query)), 3) if query else 0.0
+    return rag_llm, rag_query
+
+def check_factual_accuracy_batch(query, answers):
+    """Runs the QA check for several answers as a single pipeline batch."""
+    scores = [0.0] * len(answers)
+    valid = [i for i, answer in enumerate(answers) if query and answer]
+    if not valid:
+        return scores
+    results = get_qa_pipeline()(question=[query] * len(valid), context=[answers[i] for i in valid])
+    if isinstance(results, dict):
+        results = [results]
+    for i, result in zip(valid, results):
+        scores[i] = round(result['score'], 3)
+    return scores
+
 def get_judge_evaluation(query, rag_answer, llm_answer):
     """Uses a powerful LLM to act as a judge and provide detailed scores."""
     prompt = f"""
@@ -88,12 +159,13 @@ Then, declare a winner ("RAG", "LLM", or "Tie") and provide a brief justificatio
 }}
 """
     try:
-        response = groq_client.chat.completions.create(
+        response = get_groq_client().chat.completions.create(
             model="llama-3.3-70b-versatile",
             messages=[{"role": "user", "content": prompt}],
             temperature=0.1,
             response_format={"type": "json_object"}
         )
+        count_tokens(response, "judge")
         return json.loads(response.choices[0].message.content)
     except Exception as e:
         return {"rag_scores": {}, "llm_scores": {}, "winner": "Error", "justification": str(e)}
@@ -114,41 +186,51 @@ def calculate_reward(evaluation_results):
     )
     return round(reward, 3)
 
+# The judge is a network call; it runs here while the local models work in the caller's thread
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="evaluate")
+
+def _timed(timings, name, fn, *args):
+    start = time.time()
+    with span(f"evaluate.{name}"):
+        result = fn(*args)
+    elapsed = time.time() - start
+    timings[name] = round(elapsed, 3)
+    print(f"[{datetime.now()}] {name} took {elapsed:.2f} seconds", file=sys.stderr)
+    return result
+
 def comprehensive_evaluation(query, rag_answer, llm_answer):
-    """Performs a comprehensive evaluation of two answers."""
+    """
+    Performs a comprehensive evaluation of two answers.
+
+    The judge request is started first and overlaps with the local metrics,
+    which run back to back so they do not compete for CPU: one embedding batch
+    for both similarities, BERTScore, and one QA batch for both answers.
+    """
+    with span("evaluate"):
+        return _comprehensive_evaluation(query, rag_answer, llm_answer)
+
+def _comprehensive_evaluation(query, rag_answer, llm_answer):
     print(f"[{datetime.now()}] Starting comprehensive_evaluation", file=sys.stderr)
-    
-    # Semantic Similarity (between RAG and LLM answers)
-    semantic_start_time = time.time()
-    semantic_similarity_rag_llm = calculate_semantic_similarity_between_answers(rag_answer, llm_answer)
-    semantic_end_time = time.time()
-    print(f"[{datetime.now()}] Semantic Similarity (RAG vs LLM) took {semantic_end_time - semantic_start_time:.2f} seconds", file=sys.stderr)
-
-    # Semantic Similarity (RAG answer vs Query)
-    semantic_rag_query_start_time = time.time()
-    semantic_similarity_rag_query = calculate_semantic_similarity_to_query(rag_answer, query)
-    semantic_rag_query_end_time = time.time()
-    print(f"[{datetime.now()}] Semantic Similarity (RAG vs Query) took {semantic_rag_query_end_time - semantic_rag_query_start_time:.2f} seconds", file=sys.stderr)
-    
+    start_time = time.time()
+    timings = {}
+
+    # Judge Evaluation (network-bound, runs concurrently)
+    judge_future = _executor.submit(bind(_timed), timings, "judge", get_judge_evaluation, query, rag_answer, llm_answer)
+
+    # Semantic Similarity (RAG vs LLM answers, RAG answer vs Query) in one embedding batch
+    semantic_similarity_rag_llm, semantic_similarity_rag_query = _timed(
+        timings, "semantic_similarity", calculate_semantic_similarities, query, rag_answer, llm_answer)
+
     # BERTScore (RAG vs. LLM)
-    bert_start_time = time.time()
-    bert_score_rag_vs_llm = calculate_bert_score(rag_answer, llm_answer)
-    bert_end_time = time.time()
-    print(f"[{datetime.now()}] BERTScore took {bert_end_time - bert_start_time:.2f} seconds", file=sys.stderr)
-    
-    # Factual Accuracy
-    factual_start_time = time.time()
-    factual_accuracy_rag = check_factual_accuracy(query, rag_answer)
-    factual_accuracy_llm = check_factual_accuracy(query, llm_answer)
-    factual_end_time = time.time()
-    print(f"[{datetime.now()}] Factual Accuracy took {factual_end_time - factual_start_time:.2f} seconds", file=sys.stderr)
-    
-    # Judge Evaluation
-    judge_start_time = time.time()
-    judge_evaluation = get_judge_evaluation(query, rag_answer, llm_answer)
-    judge_end_time = time.time()
-    print(f"[{datetime.now()}] Judge Evaluation took {judge_end_time - judge_start_time:.2f} seconds", file=sys.stderr)
-    
+    bert_score_rag_vs_llm = _timed(timings, "bert_score", calculate_bert_score, rag_answer, llm_answer)
+
+    # Factual Accuracy for both answers in one QA batch
+    factual_accuracy_rag, factual_accuracy_llm = _timed(
+        timings, "factual_accuracy", check_factual_accuracy_batch, query, [rag_answer, llm_answer])
+    timings["local_metrics"] = round(time.time() - start_time, 3)
+
+    judge_evaluation = judge_future.result()
+
     # Combine all scores
     evaluation_results = {
         "semantic_similarity_rag_llm": semantic_similarity_rag_llm,
@@ -164,6 +246,8 @@ def comprehensive_evaluation(query, rag_answer, llm_answer):
     # Calculate RAG reward
     rag_reward = calculate_reward(evaluation_results)
     evaluation_results["rag_reward"] = rag_reward
+    timings["total"] = round(time.time() - start_time, 3)
+    evaluation_results["timings"] = timings
 
     print(f"[{datetime.now()}] Finished comprehensive_evaluation", file=sys.stderr)
     return evaluation_results
@@ -0,0 +1,43 @@
+import os
+import time
+
+# Remaining-time thresholds below which the pipelines drop optional stages
+SCRAPE_MIN_BUDGET_SECONDS = float(os.getenv("SCRAPE_MIN_BUDGET_SECONDS", "25"))
+EVAL_MIN_BUDGET_SECONDS = float(os.getenv("EVAL_MIN_BUDGET_SECONDS", "20"))
+# Time kept back for retrieval and generation when sizing the scrape deadline
+GENERATION_RESERVE_SECONDS = float(os.getenv("GENERATION_RESERVE_SECONDS", "15"))
+
+class Deadline:
+    """
+    Request-level time budget passed down from the Node route.
+
+    `expires_at` is an absolute time.time() value; None means no deadline.
+    The pipelines check it between stages to degrade step by step (skip
+    scraping, then skip or defer evaluation) instead of timing out outright.
+    """
+
+    def __init__(self, expires_at=None):
+        self.expires_at = expires_at
+
+    @classmethod
+    def from_request(cls, request):
+        return cls(request.get("deadline"))
+
+    def remaining(self):
+        if self.expires_at is None:
+            return float("inf")
+        return max(0.0, self.expires_at - time.time())
+
+    def allows(self, seconds):
+        """True if at least `seconds` of budget are left."""
+        return self.remaining() >= seconds
+
+    def allows_scraping(self):
+        return self.allows(SCRAPE_MIN_BUDGET_SECONDS)
+
+    def allows_evaluation(self):
+        return self.allows(EVAL_MIN_BUDGET_SECONDS)
+
+    def scrape_deadline(self, default):
+        """Seconds scraping may take while leaving room for generation."""
+        return max(1.0, min(default, self.remaining() - GENERATION_RESERVE_SECONDS))
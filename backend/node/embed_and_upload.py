@@ -1,85 +1,207 @@
+import argparse
 import json
 import dotenv
-from sentence_transformers import SentenceTransformer
-from pinecone import Pinecone, ServerlessSpec
 import os
-
-# ======== STEP 1: LOAD ENVIRONMENT VARIABLES ========
-dotenv.load_dotenv()
-
-PINECONE_API_KEY = dotenv.get_key(dotenv.find_dotenv(), "PINECONE_API_KEY")
-
-# ======== STEP 2: INITIALIZE PINECONE ========
-pc = Pinecone(api_key=PINECONE_API_KEY)
-index_name = "rag-knowledge-384"
-
-# Delete Pinecone index if it exists
-if index_name in [i.name for i in pc.list_indexes()]:
-    pc.delete_index(index_name)
-    print(f"Deleted existing Pinecone index: {index_name}")
-
-# Create Pinecone index
-pc.create_index(
-    name=index_name,
-    dimension=384,  # Hugging Face MiniLM outputs 384-dim embeddings
-    metric="cosine",
-    spec=ServerlessSpec(cloud="aws", region="us-east-1")
-)
-print(f"Created Pinecone index: {index_name}")
-
-index = pc.Index(index_name)
-print(f"Connected to Pinecone index: {index_name}")
-
-# ======== STEP 3: LOAD SCRAPED DATA ========
-DATA_PATH = "backend/node/scraped_data.json"
-
-if not os.path.exists(DATA_PATH):
-    raise FileNotFoundError(f"Could not find scraped data file: {DATA_PATH}")
-
-with open(DATA_PATH, "r", encoding="utf-8") as f:
-    all_results = json.load(f)
-
-print(f"Loaded {len(all_results)} documents from scraped_data.json")
-
-# ======== STEP 4: EMBEDDING FUNCTION (Hugging Face MiniLM) ========
-model = SentenceTransformer("all-MiniLM-L6-v2")  # Free, local 384-dim model
-
-def generate_embedding(text):
-    try:
-        return model.encode(text).tolist()
-    except Exception as e:
-        print(f"Error generating embedding: {e}")
-        return [0.0] * 384
-
-# ======== STEP 5: PREPARE & UPLOAD TO PINECONE ========
-vectors = []
-
-for i, item in enumerate(all_results):
-    text = item.get("content", "")[:4000]  # Truncate overly long text
-    emb = generate_embedding(text)
-    
-    vector = {
-        "id": str(i),
-        "values": emb,
-        "metadata": {
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from embedding_service import EmbeddingService
+from ingestion import document_id, content_hash, filter_new_documents, UPSERT_BATCH_SIZE
+from chunking import chunk_document
+from vector_store import open_index, INDEX_NAME, VECTOR_BACKEND
+from answer_cache import invalidate_cached_answers
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scraped_data.json")
+DOCUMENT_BATCH_SIZE = 64  # Documents chunked and embedded together
+UPSERT_WORKERS = 4  # Upsert requests in flight at once
+
+# ======== STEP 1: STREAM DOCUMENTS ========
+def iter_json_array(path, chunk_size=1 << 16):
+    """Yield the items of a top-level JSON array one at a time without loading the whole file."""
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buffer = ""
+        started = False
+        while True:
+            chunk = f.read(chunk_size)
+            buffer += chunk
+            pos = 0
+            while True:
+                while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                    pos += 1
+                if pos >= len(buffer):
+                    break
+                if not started:
+                    if buffer[pos] != "[":
+                        raise ValueError(f"{path} does not contain a JSON array")
+                    started = True
+                    pos += 1
+                    continue
+                if buffer[pos] == "]":
+                    return
+                try:
+                    item, pos_end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if not chunk:
+                        raise
+                    break  # Item continues in the next chunk
+                yield item
+                pos = pos_end
+            buffer = buffer[pos:]
+            if not chunk:
+                return
+
+def iter_jsonl(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+def iter_documents(path):
+    return iter_jsonl(path) if path.endswith(".jsonl") else iter_json_array(path)
+
+def iter_batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+# ======== STEP 2: CHECKPOINTING ========
+def checkpoint_path(data_path):
+    return data_path + ".checkpoint.json"
+
+def load_checkpoint(data_path):
+    """Return the number of documents already uploaded from this exact file, or None."""
+    path = checkpoint_path(data_path)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        checkpoint = json.load(f)
+    stat = os.stat(data_path)
+    if checkpoint.get("size") != stat.st_size or checkpoint.get("mtime") != stat.st_mtime:
+        print("Data file changed since the last run; ignoring the old checkpoint.")
+        return None
+    return checkpoint["processed"]
+
+def save_checkpoint(data_path, processed):
+    stat = os.stat(data_path)
+    path = checkpoint_path(data_path)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"processed": processed, "size": stat.st_size, "mtime": stat.st_mtime}, f)
+    os.replace(tmp_path, path)
+
+# ======== STEP 3: CHUNK, EMBED & UPLOAD ========
+def build_documents(batch, offset):
+    """Chunk a batch of scraped items using the same ID scheme as live ingestion."""
+    documents = []
+    for i, item in enumerate(batch, start=offset):
+        url = item.get("url", "")
+        content = item.get("content", "")
+        doc_id = document_id(url) if url else str(i)
+        chunks = chunk_document(doc_id, content, {
             "title": item.get("title", ""),
-            "url": item.get("url", ""),
+            "url": url,
             "snippet": item.get("snippet", ""),
-            "query": item.get("query", "")
-        }
-    }
-    vectors.append(vector)
-
-# Upload all vectors to Pinecone
-if vectors:
-    index.upsert(vectors=vectors)
-    print(f"Uploaded {len(vectors)} documents to Pinecone successfully!")
-else:
-    print("No vectors found to upload.")
-
-# ======== STEP 6: VERIFY INDEX ========
-
-stats = index.describe_index_stats()
-print("Pinecone Index Stats:")
-print(stats.to_dict())
-
+            "query": item.get("query", ""),
+            "content_hash": content_hash(content)
+        })
+        if chunks:
+            documents.append({"id": doc_id, "chunks": chunks})
+    return documents
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream scraped documents into the vector index.")
+    parser.add_argument("--data", default=DATA_PATH, help="JSON array or JSONL file of scraped documents")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Keep the existing index and only upload new or changed documents")
+    parser.add_argument("--restart", action="store_true", help="Ignore any checkpoint and start from the beginning")
+    parser.add_argument("--batch-size", type=int, default=DOCUMENT_BATCH_SIZE)
+    parser.add_argument("--upsert-workers", type=int, default=UPSERT_WORKERS)
+    args = parser.parse_args()
+
+    dotenv.load_dotenv()
+
+    if not os.path.exists(args.data):
+        raise FileNotFoundError(f"Could not find scraped data file: {args.data}")
+
+    resume_from = None if args.restart else load_checkpoint(args.data)
+
+    # A full run wipes and recreates the index, unless it is resuming an interrupted run
+    recreate = not args.incremental and resume_from is None
+    index = open_index(recreate=recreate)
+    print(f"Connected to vector index: {INDEX_NAME} ({VECTOR_BACKEND})")
+    if resume_from:
+        print(f"Resuming after {resume_from} documents from the last checkpoint.")
+
+    embedder = EmbeddingService()  # Free, local 384-dim model, batched encode calls
+
+    processed = 0
+    uploaded_chunks = 0
+    skipped_documents = 0
+    pending = []  # (documents processed once these upserts finish, their URLs, futures)
+
+    def drain(until):
+        """Wait for queued upserts, drop cached answers built from those pages and checkpoint."""
+        while len(pending) > until:
+            done_through, urls, futures = pending.pop(0)
+            for future in futures:
+                future.result()
+            invalidate_cached_answers(urls)
+            save_checkpoint(args.data, done_through)
+
+    with ThreadPoolExecutor(max_workers=args.upsert_workers) as executor:
+        for batch in iter_batches(iter_documents(args.data), args.batch_size):
+            offset = processed
+            processed += len(batch)
+            if resume_from and processed <= resume_from:
+                continue
+
+            documents = build_documents(batch, offset)
+            stale_ids = []
+            if args.incremental:
+                new_documents, stale_ids = filter_new_documents(index, documents)
+                skipped_documents += len(documents) - len(new_documents)
+                documents = new_documents
+
+            chunks = [chunk for doc in documents for chunk in doc["chunks"]]
+            embeddings = embedder.encode([chunk["text"] for chunk in chunks])
+            vectors = [
+                {"id": chunk["id"], "values": emb.tolist(), "metadata": chunk["metadata"]}
+                for chunk, emb in zip(chunks, embeddings)
+            ]
+
+            # Upserts for this batch run while the next batch is being embedded
+            futures = [
+                executor.submit(index.upsert, vectors=vectors[start:start + UPSERT_BATCH_SIZE])
+                for start in range(0, len(vectors), UPSERT_BATCH_SIZE)
+            ]
+            if stale_ids:
+                futures.append(executor.submit(index.delete, ids=stale_ids))
+            urls = [doc["chunks"][0]["metadata"]["url"] for doc in documents if doc["chunks"]]
+            pending.append((processed, [url for url in urls if url], futures))
+            uploaded_chunks += len(vectors)
+            drain(until=1)
+            print(f"Processed {processed} documents ({uploaded_chunks} chunks uploaded)", file=sys.stderr)
+
+        drain(until=0)
+
+    # The run completed, so the next one starts fresh
+    if os.path.exists(checkpoint_path(args.data)):
+        os.remove(checkpoint_path(args.data))
+
+    print(f"Uploaded {uploaded_chunks} chunks from {processed} documents successfully!")
+    if args.incremental:
+        print(f"Skipped {skipped_documents} unchanged documents.")
+
+    # ======== STEP 4: VERIFY INDEX ========
+    stats = index.describe_index_stats()
+    print("Index Stats:")
+    print(stats.to_dict())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import hashlib
+import os
+import time
+import numpy as np
+from disk_cache import DiskCache
+from tracing import span, count
+
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "50000"))  # 0 disables the cache
+
+class EmbeddingService:
+    """
+    Shared wrapper around the MiniLM embedder.
+
+    Callers collect every text they need for a request (scraped documents plus
+    the query) or a bulk job and embed them with one encode() call, which the
+    model splits into batches of `batch_size`. Results are float32 NumPy arrays.
+
+    Embeddings are cached on disk keyed by model name plus a hash of the text,
+    so a text that was embedded before never reaches the model again.
+    """
+
+    def __init__(self, model_name=EMBEDDING_MODEL, batch_size=EMBEDDING_BATCH_SIZE, cache_size=EMBEDDING_CACHE_SIZE):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        # Imported here so that importing this module does not pull in torch
+        from sentence_transformers import SentenceTransformer
+        start = time.time()
+        self.model = SentenceTransformer(model_name)
+        count("model_load_seconds", time.time() - start, model=model_name)
+        self.dimension = self.model.get_sentence_embedding_dimension()
+        self.cache = DiskCache("embeddings", cache_size) if cache_size > 0 else None
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def _cache_key(self, text):
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{self.model_name}:{digest}"
+
+    def encode(self, texts):
+        """Embed a list of texts; returns an array of shape (len(texts), dimension)."""
+        texts = list(texts)
+        with span("embed", texts=len(texts)):
+            return self._encode(texts)
+
+    def _encode(self, texts):
+        result = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        if not texts:
+            return result
+
+        keys = [self._cache_key(text) for text in texts]
+        cached = self.cache.get_many(keys) if self.cache else {}
+
+        missing = [i for i, key in enumerate(keys) if key not in cached]
+        self.cache_hits += len(texts) - len(missing)
+        self.cache_misses += len(missing)
+        count("cache_hits", len(texts) - len(missing), cache="embedding")
+        count("cache_misses", len(missing), cache="embedding")
+
+        for i, key in enumerate(keys):
+            if key in cached:
+                result[i] = np.frombuffer(cached[key], dtype=np.float32)
+
+        if missing:
+            # Embed each distinct uncached text once, even if it repeats within the batch
+            unique_missing = list(dict.fromkeys(texts[i] for i in missing))
+            embeddings = np.asarray(self.model.encode(
+                unique_missing,
+                batch_size=self.batch_size,
+                convert_to_numpy=True,
+                show_progress_bar=False
+            ), dtype=np.float32)
+            by_text = dict(zip(unique_missing, embeddings))
+            for i in missing:
+                result[i] = by_text[texts[i]]
+            if self.cache:
+                self.cache.set_many({self._cache_key(text): emb.tobytes() for text, emb in by_text.items()})
+
+        return result
+
+    def encode_one(self, text):
+        """Embed a single text; returns a 1-D array."""
+        return self.encode([text])[0]
+
+def cosine_similarity(a, b):
+    """Cosine similarity between two 1-D vectors."""
+    denom = float(np.linalg.norm(a) * np.linalg.norm(b))
+    if denom == 0.0:
+        return 0.0
+    return float(np.dot(a, b) / denom)
@@ -0,0 +1,98 @@
+import json
+import os
+import sqlite3
+import sys
+import time
+
+QUEUE_PATH = os.getenv("EVAL_QUEUE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "eval_queue.sqlite3"))
+LEASE_SECONDS = 600  # A claimed job is handed out again if its worker dies without finishing
+MAX_ATTEMPTS = 3
+
+class EvaluationQueue:
+    """
+    Durable SQLite job queue for deferred answer evaluations.
+
+    Jobs are keyed by query id and move pending -> running -> done/failed.
+    Claims are atomic, so any number of evaluator processes can drain the
+    same queue, and results stay in the table to be fetched later.
+    """
+
+    def __init__(self, path=QUEUE_PATH):
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "query_id TEXT PRIMARY KEY, payload TEXT NOT NULL, status TEXT NOT NULL, "
+            "result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+            "lease_expires REAL, created REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created)")
+
+    def enqueue(self, query_id, payload):
+        now = time.time()
+        self._db.execute(
+            "INSERT INTO jobs (query_id, payload, status, created, updated) VALUES (?, ?, 'pending', ?, ?)",
+            (query_id, json.dumps(payload), now, now)
+        )
+
+    def claim(self):
+        """Atomically take the oldest runnable job; returns (query_id, payload, attempts) or None."""
+        now = time.time()
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._db.execute(
+                "SELECT query_id, payload, attempts FROM jobs "
+                "WHERE status = 'pending' OR (status = 'running' AND lease_expires < ?) "
+                "ORDER BY created LIMIT 1",
+                (now,)
+            ).fetchone()
+            if row:
+                self._db.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_expires = ?, updated = ? "
+                    "WHERE query_id = ?",
+                    (now + LEASE_SECONDS, now, row[0])
+                )
+            self._db.execute("COMMIT")
+        except Exception:
+            self._db.execute("ROLLBACK")
+            raise
+        if not row:
+            return None
+        return row[0], json.loads(row[1]), row[2] + 1
+
+    def complete(self, query_id, result):
+        self._db.execute(
+            "UPDATE jobs SET status = 'done', result = ?, error = NULL, updated = ? WHERE query_id = ?",
+            (json.dumps(result), time.time(), query_id)
+        )
+
+    def fail(self, query_id, error, attempts):
+        """Put the job back for another try, or mark it failed after MAX_ATTEMPTS."""
+        status = "failed" if attempts >= MAX_ATTEMPTS else "pending"
+        self._db.execute(
+            "UPDATE jobs SET status = ?, error = ?, updated = ? WHERE query_id = ?",
+            (status, str(error), time.time(), query_id)
+        )
+
+    def get(self, query_id):
+        row = self._db.execute(
+            "SELECT status, result, error FROM jobs WHERE query_id = ?", (query_id,)
+        ).fetchone()
+        if not row:
+            return None
+        status, result, error = row
+        return {
+            "query_id": query_id,
+            "status": status,
+            "evaluation": json.loads(result) if result else None,
+            "error": error
+        }
+
+if __name__ == "__main__":
+    # Used by the Node route: python eval_queue.py get <query_id>
+    if len(sys.argv) == 3 and sys.argv[1] == "get":
+        job = EvaluationQueue().get(sys.argv[2])
+        print(json.dumps(job if job else {"query_id": sys.argv[2], "status": "not_found"}))
+    else:
+        print("Usage: python eval_queue.py get <query_id>", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,69 @@
+import argparse
+import multiprocessing
+import sys
+import time
+from datetime import datetime
+from eval_queue import EvaluationQueue
+from tracing import start_trace, finish_trace
+
+POLL_INTERVAL_SECONDS = 1.0
+
+def evaluate_job(query_id, payload):
+    """Evaluate one deferred comparison and feed its reward to the RL agent."""
+    # Imported here so the parent process never loads the models
+    from comprehensive_evaluate import comprehensive_evaluation
+    from rl_agent import RLAgent
+
+    evaluation = comprehensive_evaluation(payload["query"], payload["rag_answer"], payload["llm_answer"])
+    # Jobs queued before the bandit carry a bare top_k instead of an action
+    action = payload.get("action", payload.get("top_k"))
+    if "rag_reward" in evaluation and action is not None:
+        rl_agent = RLAgent()
+        rl_agent.learn(action, evaluation["rag_reward"], payload.get("features"))
+        print(f"[{datetime.now()}] RL Agent learned: {action}, reward={evaluation['rag_reward']} ({query_id})", file=sys.stderr)
+    return evaluation
+
+def worker_loop(worker_index, exit_when_empty):
+    queue = EvaluationQueue()
+    print(f"[{datetime.now()}] Evaluator {worker_index} started", file=sys.stderr)
+    while True:
+        job = queue.claim()
+        if job is None:
+            if exit_when_empty:
+                # Pool processes skip atexit, so write out buffered bandit updates here
+                from rl_agent import get_policy_state
+                get_policy_state().flush()
+                return
+            time.sleep(POLL_INTERVAL_SECONDS)
+            continue
+
+        query_id, payload, attempts = job
+        start = time.time()
+        start_trace(query_id)
+        try:
+            evaluation = evaluate_job(query_id, payload)
+            finish_trace()
+            queue.complete(query_id, evaluation)
+            print(f"[{datetime.now()}] Evaluator {worker_index} finished {query_id} in {time.time() - start:.2f} seconds", file=sys.stderr)
+        except Exception as e:
+            finish_trace()
+            queue.fail(query_id, e, attempts)
+            print(f"[{datetime.now()}] Evaluator {worker_index} failed {query_id} (attempt {attempts}): {e}", file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description="Drain the deferred evaluation queue.")
+    parser.add_argument("--processes", type=int, default=2, help="Evaluator processes to run")
+    parser.add_argument("--once", action="store_true", help="Exit once the queue is empty")
+    args = parser.parse_args()
+
+    processes = [
+        multiprocessing.Process(target=worker_loop, args=(i, args.once), daemon=True)
+        for i in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+import os
+import re
+from bs4 import BeautifulSoup, NavigableString
+from chunking import CHUNK_WORDS, CHUNK_OVERLAP, MAX_CHUNKS_PER_DOCUMENT
+
+# Fast parsers are optional; BeautifulSoup's html.parser is the fallback
+try:
+    from selectolax.lexbor import LexborHTMLParser as SelectolaxParser
+except ImportError:
+    SelectolaxParser = None
+
+try:
+    import lxml.etree
+    import lxml.html
+except ImportError:
+    lxml = None
+
+# auto picks the fastest installed backend: selectolax, then lxml, then bs4
+HTML_EXTRACTOR = os.getenv("HTML_EXTRACTOR", "auto")
+# Stop collecting text once the chunker could not use any more of it
+EXTRACT_MAX_WORDS = int(os.getenv(
+    "EXTRACT_MAX_WORDS",
+    str(CHUNK_WORDS + (MAX_CHUNKS_PER_DOCUMENT - 1) * (CHUNK_WORDS - CHUNK_OVERLAP))
+))
+# Main-content extraction is only trusted if it yields at least this many words
+EXTRACT_MIN_WORDS = int(os.getenv("EXTRACT_MIN_WORDS", "50"))
+
+DROP_TAGS = frozenset([
+    "script", "style", "noscript", "iframe", "template", "svg", "canvas", "form", "button", "select",
+    "nav", "header", "footer", "aside", "head"
+])
+# Class/id tokens of navigation, cookie banners, share widgets and the like
+BOILERPLATE = re.compile(
+    r"(?:^|[-_])(?:nav|navbar|menu|footer|sidebar|cookies?|consent|banner|advert|ads|promo|share|social|"
+    r"subscribe|newsletter|related|breadcrumbs?|comments?|popup|modal)(?:$|[-_])"
+)
+MAIN_SELECTORS = ("main", "article", "[role=main]")
+META_CHARSET = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?([A-Za-z0-9_:.-]+)""", re.IGNORECASE)
+BOMS = ((b"\xef\xbb\xbf", "utf-8"), (b"\xff\xfe", "utf-16-le"), (b"\xfe\xff", "utf-16-be"))
+
+def decode_html(data, encoding=None):
+    """
+    Decode page bytes: byte-order mark, then the given (HTTP header) encoding,
+    then a <meta charset> in the first 2 KB, then UTF-8, then cp1252.
+    """
+    if isinstance(data, str):
+        return data
+    for bom, bom_encoding in BOMS:
+        if data.startswith(bom):
+            return data[len(bom):].decode(bom_encoding, errors="replace")
+    candidates = [encoding]
+    match = META_CHARSET.search(data[:2048])
+    if match:
+        candidates.append(match.group(1).decode("ascii"))
+    for candidate in candidates + ["utf-8"]:
+        if not candidate:
+            continue
+        try:
+            return data.decode(candidate)
+        except (LookupError, UnicodeDecodeError):
+            continue
+    return data.decode("cp1252", errors="replace")
+
+def _is_boilerplate(class_attr, id_attr):
+    tokens = f"{class_attr or ''} {id_attr or ''}".lower().split()
+    return any(BOILERPLATE.search(token) for token in tokens)
+
+class _Collector:
+    """Accumulates stripped text pieces until max_words is reached."""
+
+    def __init__(self, max_words):
+        self.max_words = max_words
+        self.pieces = []
+        self.words = 0
+
+    def add(self, text):
+        """Add a piece of text; returns False once enough has been collected."""
+        if text:
+            text = text.strip()
+            if text:
+                self.pieces.append(text)
+                self.words += len(text.split())
+        return self.words < self.max_words
+
+    def text(self):
+        return " ".join(self.pieces)
+
+# Each backend walks the tree depth-first with an explicit stack, skipping dropped
+# subtrees instead of deleting them and returning as soon as the collector is full.
+
+def _walk_lxml(root, collector, filter_boilerplate):
+    stack = [(root, False)]
+    while stack:
+        node, tail_only = stack.pop()
+        if tail_only:
+            if not collector.add(node.tail):
+                return
+            continue
+        tag = node.tag if isinstance(node.tag, str) else None
+        skip = tag is None or tag in DROP_TAGS or (
+            filter_boilerplate and node is not root and _is_boilerplate(node.get("class"), node.get("id"))
+        )
+        if node is not root:
+            stack.append((node, True))
+        if skip:
+            continue
+        if not collector.add(node.text):
+            return
+        stack.extend((child, False) for child in reversed(node))
+
+def _walk_selectolax(root, collector, filter_boilerplate):
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        tag = node.tag
+        if tag == "-text":
+            if not collector.add(node.text_content):
+                return
+            continue
+        if tag.startswith("-") or tag in DROP_TAGS:  # -comment, -doctype
+            continue
+        if filter_boilerplate and node is not root:
+            attributes = node.attributes
+            if _is_boilerplate(attributes.get("class"), attributes.get("id")):
+                continue
+        stack.extend(reversed(list(node.iter(include_text=True))))
+
+def _walk_bs4(root, collector, filter_boilerplate):
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, NavigableString):
+            # Comments, doctypes and CDATA are NavigableString subclasses
+            if type(node) is NavigableString and not collector.add(str(node)):
+                return
+            continue
+        if node.name in DROP_TAGS:
+            continue
+        if filter_boilerplate and node is not root:
+            class_attr = node.get("class")
+            if isinstance(class_attr, list):
+                class_attr = " ".join(class_attr)
+            if _is_boilerplate(class_attr, node.get("id")):
+                continue
+        stack.extend(reversed(node.contents))
+
+# lxml's CSS selectors need the separate cssselect package, so the same lookups as XPath
+MAIN_XPATHS = ("//main", "//article", "//*[@role='main']")
+
+def _parse_lxml(html):
+    # lxml rejects str input with an XML declaration, so it always gets UTF-8 bytes
+    try:
+        tree = lxml.html.document_fromstring(html.encode("utf-8"), parser=lxml.html.HTMLParser(encoding="utf-8"))
+    except lxml.etree.ParserError:  # nothing but comments or whitespace
+        return None, None
+    main = next((found[0] for found in (tree.xpath(xpath) for xpath in MAIN_XPATHS) if found), None)
+    body = tree.find("body")
+    return main, body if body is not None else tree
+
+def _parse_selectolax(html):
+    tree = SelectolaxParser(html)
+    main = next((node for node in (tree.css_first(s) for s in MAIN_SELECTORS) if node is not None), None)
+    return main, tree.body or tree.root
+
+def _parse_bs4(html):
+    soup = BeautifulSoup(html, "html.parser")
+    main = next((node for node in (soup.select_one(s) for s in MAIN_SELECTORS) if node is not None), None)
+    return main, soup.body or soup
+
+BACKENDS = {
+    "selectolax": (_parse_selectolax, _walk_selectolax),
+    "lxml": (_parse_lxml, _walk_lxml),
+    "bs4": (_parse_bs4, _walk_bs4),
+}
+
+def available_backends():
+    """Names of the extractor backends importable in this environment, fastest first."""
+    installed = {"selectolax": SelectolaxParser is not None, "lxml": lxml is not None, "bs4": True}
+    return [name for name in BACKENDS if installed[name]]
+
+def resolve_backend(name=HTML_EXTRACTOR):
+    if name == "auto":
+        return available_backends()[0]
+    if name not in available_backends():
+        raise ValueError(f"HTML extractor '{name}' is not available (installed: {', '.join(available_backends())})")
+    return name
+
+def extract_text(html, backend=None, max_words=EXTRACT_MAX_WORDS, encoding=None):
+    """
+    Return the readable main text of an HTML document (bytes or str).
+
+    Scripts, styles, navigation, headers, footers and elements whose class or
+    id looks like boilerplate are skipped. The <main>/<article> element is
+    used when it holds at least EXTRACT_MIN_WORDS words, otherwise the whole
+    body; if filtering leaves too little, the body is read again without the
+    class/id filter.
+    Collection stops once max_words words have been gathered. Bytes are
+    decoded with decode_html(), `encoding` being the HTTP header charset.
+    """
+    parse, walk = BACKENDS[resolve_backend(backend or HTML_EXTRACTOR)]
+    html = decode_html(html, encoding)
+    if not html.strip():
+        return ""
+    main, body = parse(html)
+    if body is None:
+        return ""
+
+    attempts = [(main, True)] if main is not None else []
+    attempts += [(body, True), (body, False)]
+    best = None
+    for node, filter_boilerplate in attempts:
+        collector = _Collector(max_words)
+        walk(node, collector, filter_boilerplate)
+        if collector.words >= min(EXTRACT_MIN_WORDS, max_words):
+            return collector.text()
+        if best is None or collector.words > best.words:
+            best = collector
+    return best.text()
@@ -0,0 +1,131 @@
+import os
+import sys
+import numpy as np
+from tracing import span, count
+
+# Weight of the vector ranking in the fusion; 1.0 is vector-only, 0.0 BM25-only
+HYBRID_ALPHA = float(os.getenv("HYBRID_ALPHA", "0.5"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+# Each side contributes this many times top_k candidates to the fusion
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "4"))
+
+def reciprocal_rank_fusion(rankings, weights, k=RRF_K):
+    """Fuse ranked id lists: score(d) = sum of weight / (k + rank). Returns [(id, score)], best first."""
+    scores = {}
+    for ranking, weight in zip(rankings, weights):
+        if weight <= 0:
+            continue
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + weight / (k + rank)
+    return sorted(scores.items(), key=lambda item: -item[1])
+
+def plain_match(match, include_metadata=True):
+    """
+    Copy a vector index match into a dict. Pinecone returns ScoredVector
+    objects, which support match["id"] but are not mappings, and leave out
+    "metadata" when it was not requested.
+    """
+    metadata = None
+    if include_metadata:
+        try:
+            metadata = match["metadata"]
+        except (KeyError, AttributeError):  # Pinecone raises an AttributeError subclass
+            pass
+    return {"id": match["id"], "score": float(match["score"]), "metadata": metadata or {}}
+
+def lexical_text(metadata):
+    """What BM25 indexes for a chunk: its title, search snippet and passage text."""
+    return " ".join(filter(None, (metadata.get("title"), metadata.get("snippet"), metadata.get("text"))))
+
+class HybridIndex:
+    """
+    Vector index wrapper that adds BM25 retrieval over the same chunks.
+
+    Upserts and deletes go to both the vector index and the LexicalIndex.
+    query() takes an extra `text` argument. When it is given, the top
+    candidates from both sides are fused with reciprocal rank fusion, with
+    weight alpha on the vector ranking and 1 - alpha on BM25. Chunks found
+    only by BM25 are fetched from the vector index. Every match keeps its
+    cosine similarity as "score", so coverage thresholds mean the same
+    thing, and also carries "rrf_score" and "lexical_score". Fused matches
+    are plain dicts, whatever type the wrapped index returns. Everything
+    else is passed through to the wrapped index.
+    """
+
+    def __init__(self, index, lexical=None, alpha=HYBRID_ALPHA):
+        self.index = index
+        self.lexical = lexical
+        self.alpha = alpha
+
+    def __getattr__(self, name):
+        return getattr(self.index, name)
+
+    def upsert(self, vectors, **kwargs):
+        result = self.index.upsert(vectors=vectors, **kwargs)
+        if self.lexical is not None:
+            try:
+                self.lexical.upsert([(vector["id"], lexical_text(vector.get("metadata") or {})) for vector in vectors])
+            except Exception as e:
+                # The vectors are stored; only exact-term matching misses these chunks
+                print(f"Could not update the lexical index: {e}", file=sys.stderr)
+        return result
+
+    def delete(self, ids=None, delete_all=False, **kwargs):
+        if self.lexical is not None:
+            if delete_all:
+                self.lexical.clear()
+            else:
+                self.lexical.delete(ids)
+        return self.index.delete(ids=ids, delete_all=delete_all, **kwargs)
+
+    def clear(self):
+        if self.lexical is not None:
+            self.lexical.clear()
+        if hasattr(self.index, "clear"):
+            return self.index.clear()
+        return self.index.delete(delete_all=True)  # Pinecone has no clear()
+
+    def query(self, vector, top_k=10, include_metadata=False, text=None, **kwargs):
+        if self.lexical is None or not text or self.alpha >= 1.0:
+            return self.index.query(vector=vector, top_k=top_k, include_metadata=include_metadata, **kwargs)
+
+        candidates = top_k * HYBRID_CANDIDATES
+        dense = [
+            plain_match(match, include_metadata)
+            for match in self.index.query(vector=vector, top_k=candidates, include_metadata=include_metadata, **kwargs)["matches"]
+        ]
+        with span("lexical", top_k=candidates):
+            lexical = self.lexical.search(text, top_k=candidates)
+
+        with span("fuse", dense=len(dense), lexical=len(lexical)):
+            fused = reciprocal_rank_fusion(
+                [[match["id"] for match in dense], [hit["id"] for hit in lexical]],
+                [self.alpha, 1.0 - self.alpha]
+            )[:top_k]
+            by_id = {match["id"]: match for match in dense}
+            lexical_scores = {hit["id"]: hit["score"] for hit in lexical}
+
+            # Chunks only BM25 found still need their metadata and a cosine score
+            missing = [doc_id for doc_id, _ in fused if doc_id not in by_id]
+            if missing:
+                count("lexical_only_matches", len(missing))
+                query_vector = np.asarray(vector, dtype=np.float32)
+                query_vector /= np.linalg.norm(query_vector) or 1.0
+                for doc_id, stored in self.index.fetch(ids=missing).vectors.items():
+                    values = np.asarray(stored.values, dtype=np.float32)
+                    by_id[doc_id] = {
+                        "id": doc_id,
+                        "score": float(values @ query_vector / (np.linalg.norm(values) or 1.0)),
+                        "metadata": (getattr(stored, "metadata", None) or {}) if include_metadata else {}
+                    }
+
+            matches = []
+            for doc_id, rrf_score in fused:
+                if doc_id not in by_id:
+                    continue  # deleted from the vector index since it was indexed
+                matches.append({
+                    **by_id[doc_id],
+                    "rrf_score": round(rrf_score, 6),
+                    "lexical_score": lexical_scores.get(doc_id, 0.0)
+                })
+        return {"matches": matches}
@@ -0,0 +1,94 @@
+import hashlib
+import sys
+from chunking import chunk_document, MAX_CHUNKS_PER_DOCUMENT
+from tracing import span
+from answer_cache import invalidate_cached_answers
+
+MIN_CONTENT_LENGTH = 200
+UPSERT_BATCH_SIZE = 100  # Keep each upsert request well under Pinecone's payload limit
+
+def document_id(url):
+    """Deterministic document ID for a URL, so re-ingesting a page overwrites its vectors."""
+    return "web-" + hashlib.sha1(url.encode("utf-8")).hexdigest()[:24]
+
+def content_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+def collect_documents(query, search_results, scraped_pages, max_chunks=MAX_CHUNKS_PER_DOCUMENT):
+    """Turn scraped search results into chunked documents keyed by URL and content hash."""
+    documents = []
+    for result, page in zip(search_results, scraped_pages):
+        url = result.get('link')
+        content = page["content"]
+        if not url or len(content) < MIN_CONTENT_LENGTH:
+            print(f"Skipping '{url}' — content too short.", file=sys.stderr)
+            continue
+
+        doc_id = document_id(url)
+        documents.append({
+            "id": doc_id,
+            "chunks": chunk_document(doc_id, content, {
+                "title": result.get('title'),
+                "url": url,
+                "snippet": result.get('snippet', ''),
+                "query": query, # Associate with the current user query
+                "content_hash": content_hash(content)
+            }, max_chunks=max_chunks)
+        })
+    return documents
+
+def filter_new_documents(index, documents):
+    """
+    Drop documents whose stored chunks already carry the same content hash.
+
+    Returns (new_documents, stale_ids), where stale_ids are trailing chunks left
+    over from an older, longer version of a changed document.
+    """
+    if not documents:
+        return [], []
+    try:
+        existing = index.fetch(ids=[f"{doc['id']}#0" for doc in documents]).vectors
+    except Exception as e:
+        print(f"Could not check existing vectors, re-ingesting all: {e}", file=sys.stderr)
+        return documents, []
+
+    new_documents = []
+    stale_ids = []
+    for doc in documents:
+        stored = existing.get(f"{doc['id']}#0")
+        stored_meta = (getattr(stored, "metadata", None) or {}) if stored else {}
+        # Unchanged and stored with at least as many chunks as this pass would write
+        if stored_meta.get("content_hash") == doc["chunks"][0]["metadata"]["content_hash"] \
+                and int(stored_meta.get("chunk_count", 0)) >= len(doc["chunks"]):
+            continue
+        new_documents.append(doc)
+        stored_count = int(stored_meta.get("chunk_count", 0))
+        stale_ids.extend(f"{doc['id']}#{i}" for i in range(len(doc["chunks"]), stored_count))
+    return new_documents, stale_ids
+
+def ingest_documents(index, embedder, documents, query):
+    """
+    Embed and upsert the chunks of documents that are not already in the index.
+
+    All chunks and the query are embedded in one batch; returns
+    (query_embedding, upserted_documents, skipped_documents). Cached answers
+    built from the documents that were (re)written are invalidated.
+    """
+    new_documents, stale_ids = filter_new_documents(index, documents)
+    skipped = len(documents) - len(new_documents)
+
+    chunks = [chunk for doc in new_documents for chunk in doc["chunks"]]
+    embeddings = embedder.encode([chunk["text"] for chunk in chunks] + [query])
+    vectors = [
+        {"id": chunk["id"], "values": emb.tolist(), "metadata": chunk["metadata"]}
+        for chunk, emb in zip(chunks, embeddings[:-1])
+    ]
+    with span("upsert", vectors=len(vectors), deleted=len(stale_ids)):
+        for start in range(0, len(vectors), UPSERT_BATCH_SIZE):
+            index.upsert(vectors=vectors[start:start + UPSERT_BATCH_SIZE])
+        if stale_ids:
+            index.delete(ids=stale_ids)
+    if new_documents:
+        invalidate_cached_answers([doc["chunks"][0]["metadata"]["url"] for doc in new_documents])
+
+    return embeddings[-1].tolist(), len(new_documents), skipped
@@ -0,0 +1,303 @@
+import json
+import math
+import os
+import re
+import sqlite3
+import sys
+import threading
+import numpy as np
+from vector_store import LOCAL_INDEX_DIR
+
+# "" disables the lexical side of hybrid retrieval
+LEXICAL_INDEX_DIR = os.getenv("LEXICAL_INDEX_DIR", os.path.join(LOCAL_INDEX_DIR, "lexical"))
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+# A term's posting segments are merged once it has more than this many
+LEXICAL_MAX_SEGMENTS = int(os.getenv("LEXICAL_MAX_SEGMENTS", "16"))
+
+# Words with dots, dashes or underscores inside ("gpt-4o", "3.11", "node_modules") stay whole
+TOKEN = re.compile(r"[^\W_]+(?:[.\-_][^\W_]+)*")
+TOKEN_PARTS = re.compile(r"[.\-_]")
+MAX_TOKEN_LENGTH = 64
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have in is it its of on or that the this to was were "
+    "will with what which who how when where why".split()
+)
+
+def tokenize(text):
+    """Lowercased word tokens without stopwords; compound tokens also yield their parts."""
+    tokens = []
+    for token in TOKEN.findall(text.lower()):
+        if len(token) > MAX_TOKEN_LENGTH or token in STOPWORDS:
+            continue
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(part for part in TOKEN_PARTS.split(token) if part not in STOPWORDS)
+    return tokens
+
+class LexicalIndex:
+    """
+    BM25 index over chunk text, updated incrementally as documents are upserted.
+
+    Postings are packed arrays (uint32 document rows, uint16 term
+    frequencies) stored as SQLite blobs. Every upsert appends one segment
+    per term, and a term's segments are merged once there are more than
+    LEXICAL_MAX_SEGMENTS of them. A query only reads the segments of its own
+    terms. The only per-document state kept in memory is a uint32 array of
+    document lengths, where 0 marks a deleted document. Rows are never
+    reused, so workers sharing the directory catch up by loading the rows
+    and deletions added since their last look.
+    """
+
+    def __init__(self, path=LEXICAL_INDEX_DIR):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(os.path.join(path, "lexical.sqlite3"), timeout=30,
+                                   check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS docs (row INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT NOT NULL UNIQUE, length INTEGER NOT NULL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS postings (term TEXT NOT NULL, rows BLOB NOT NULL, tfs BLOB NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS postings_term ON postings (term)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS deletions (seq INTEGER PRIMARY KEY AUTOINCREMENT, row INTEGER NOT NULL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._version = None
+        self._generation = None
+        self._lengths = np.zeros(0, dtype=np.uint32)
+        self._max_row = 0
+        self._last_deletion = 0
+        with self._lock:
+            self._refresh()
+
+    # ---- internal state ----
+
+    def _state(self, key):
+        row = self._db.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0
+
+    def _add_state(self, key, amount):
+        self._db.execute(
+            "INSERT INTO state (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = value + excluded.value",
+            (key, amount)
+        )
+
+    def _refresh(self):
+        """Load the rows and deletions other processes (or our own writes) added since the last look."""
+        version = self._state("version")
+        if version == self._version:
+            return
+        generation = self._state("generation")
+        if generation != self._generation:
+            self._lengths = np.zeros(0, dtype=np.uint32)
+            self._max_row = 0
+            self._last_deletion = 0
+            self._generation = generation
+
+        added = self._db.execute("SELECT row, length FROM docs WHERE row > ? ORDER BY row", (self._max_row,)).fetchall()
+        if added:
+            self._max_row = added[-1][0]
+            if self._max_row >= len(self._lengths):
+                grown = np.zeros(max(self._max_row + 1, 2 * len(self._lengths), 1024), dtype=np.uint32)
+                grown[:len(self._lengths)] = self._lengths
+                self._lengths = grown
+            rows, lengths = zip(*added)
+            self._lengths[list(rows)] = lengths
+
+        deleted = self._db.execute("SELECT seq, row FROM deletions WHERE seq > ? ORDER BY seq", (self._last_deletion,)).fetchall()
+        if deleted:
+            self._last_deletion = deleted[-1][0]
+            rows = [row for _, row in deleted if row < len(self._lengths)]
+            self._lengths[rows] = 0
+        self._version = version
+
+    def _write(self, apply):
+        """Run apply() inside a write transaction with up-to-date lengths."""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._refresh()
+                result = apply()
+                self._add_state("version", 1)
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                # Rolled-back rows will be handed out again, so start over from scratch
+                self._version = self._generation = None
+                raise
+            self._refresh()
+            return result
+
+    def _remove(self, ids):
+        removed = []
+        for start in range(0, len(ids), 500):
+            part = ids[start:start + 500]
+            placeholders = ",".join("?" * len(part))
+            removed += self._db.execute(f"SELECT row, length FROM docs WHERE id IN ({placeholders})", part).fetchall()
+            self._db.execute(f"DELETE FROM docs WHERE id IN ({placeholders})", part)
+        if removed:
+            self._db.executemany("INSERT INTO deletions (row) VALUES (?)", [(row,) for row, _ in removed])
+            self._add_state("doc_count", -len(removed))
+            self._add_state("total_length", -sum(length for _, length in removed))
+
+    def _segments(self, term):
+        rows, tfs = [], []
+        for row_blob, tf_blob in self._db.execute("SELECT rows, tfs FROM postings WHERE term = ?", (term,)):
+            rows.append(np.frombuffer(row_blob, dtype=np.uint32))
+            tfs.append(np.frombuffer(tf_blob, dtype=np.uint16))
+        if not rows:
+            return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.uint16)
+        return np.concatenate(rows), np.concatenate(tfs)
+
+    def _merge(self, terms):
+        """Rewrite each term's segments as one, dropping deleted rows."""
+        for term in terms:
+            rows, tfs = self._segments(term)
+            alive = self._lengths[rows] > 0
+            self._db.execute("DELETE FROM postings WHERE term = ?", (term,))
+            if alive.any():
+                self._db.execute("INSERT INTO postings (term, rows, tfs) VALUES (?, ?, ?)",
+                                 (term, rows[alive].tobytes(), tfs[alive].tobytes()))
+
+    # ---- public API ----
+
+    def upsert(self, documents):
+        """Index (id, text) pairs, replacing earlier versions of the same ids."""
+        documents = [(doc_id, tokenize(text or "")) for doc_id, text in dict(documents).items()]
+
+        def apply():
+            self._remove([doc_id for doc_id, _ in documents])
+            postings = {}
+            total_length = 0
+            added = 0
+            for doc_id, tokens in documents:
+                if not tokens:
+                    continue
+                row = self._db.execute("INSERT INTO docs (id, length) VALUES (?, ?)", (doc_id, len(tokens))).lastrowid
+                total_length += len(tokens)
+                added += 1
+                frequencies = {}
+                for token in tokens:
+                    frequencies[token] = frequencies.get(token, 0) + 1
+                for term, tf in frequencies.items():
+                    entry = postings.setdefault(term, ([], []))
+                    entry[0].append(row)
+                    entry[1].append(min(tf, 65535))
+            self._db.executemany(
+                "INSERT INTO postings (term, rows, tfs) VALUES (?, ?, ?)",
+                [(term, np.asarray(rows, dtype=np.uint32).tobytes(), np.asarray(tfs, dtype=np.uint16).tobytes())
+                 for term, (rows, tfs) in postings.items()]
+            )
+            self._add_state("doc_count", added)
+            self._add_state("total_length", total_length)
+
+            # Keep reads short: merge the terms this batch pushed over the segment limit
+            terms = list(postings)
+            crowded = []
+            for start in range(0, len(terms), 500):
+                part = terms[start:start + 500]
+                placeholders = ",".join("?" * len(part))
+                crowded += [term for term, in self._db.execute(
+                    f"SELECT term FROM postings WHERE term IN ({placeholders}) GROUP BY term HAVING COUNT(*) > ?",
+                    part + [LEXICAL_MAX_SEGMENTS]
+                )]
+            if crowded:
+                # Load this transaction's own rows and deletions before dropping dead postings
+                self._version = None
+                self._refresh()
+                self._merge(crowded)
+            return {"indexed": added}
+        return self._write(apply)
+
+    def delete(self, ids):
+        ids = list(ids or [])
+        if ids:
+            self._write(lambda: self._remove(ids))
+
+    def clear(self):
+        def apply():
+            self._db.execute("DELETE FROM docs")
+            self._db.execute("DELETE FROM postings")
+            self._db.execute("DELETE FROM deletions")
+            self._db.execute("DELETE FROM state WHERE key IN ('doc_count', 'total_length')")
+            self._add_state("generation", 1)
+        self._write(apply)
+
+    def compact(self):
+        """Merge every term's segments and drop postings of deleted documents."""
+        def apply():
+            terms = [term for term, in self._db.execute("SELECT DISTINCT term FROM postings")]
+            self._merge(terms)
+            return len(terms)
+        return self._write(apply)
+
+    def search(self, text, top_k=10):
+        """BM25 top-k as [{"id", "score"}], best first."""
+        terms = sorted(set(tokenize(text)))
+        if not terms or top_k <= 0:
+            return []
+        with self._lock:
+            # One read transaction, so postings and lengths come from the same snapshot
+            self._db.execute("BEGIN")
+            try:
+                self._refresh()
+                doc_count = self._state("doc_count")
+                if doc_count <= 0:
+                    return []
+                avg_length = self._state("total_length") / doc_count
+                row_parts, score_parts = [], []
+                for term in terms:
+                    rows, tfs = self._segments(term)
+                    lengths = self._lengths[rows]
+                    alive = lengths > 0
+                    df = int(alive.sum())
+                    if df == 0:
+                        continue
+                    rows, tfs, lengths = rows[alive], tfs[alive].astype(np.float32), lengths[alive]
+                    idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / avg_length)
+                    row_parts.append(rows)
+                    score_parts.append(idf * tfs * (BM25_K1 + 1) / (tfs + norm))
+                if not row_parts:
+                    return []
+
+                rows, inverse = np.unique(np.concatenate(row_parts), return_inverse=True)
+                scores = np.bincount(inverse, weights=np.concatenate(score_parts))
+                k = min(top_k, len(rows))
+                top = np.argpartition(-scores, k - 1)[:k]
+                top = top[np.argsort(-scores[top])]
+                top_rows = [int(row) for row in rows[top]]
+                placeholders = ",".join("?" * len(top_rows))
+                ids = dict(self._db.execute(f"SELECT row, id FROM docs WHERE row IN ({placeholders})", top_rows))
+            finally:
+                self._db.execute("COMMIT")
+        return [
+            {"id": ids[row], "score": round(float(score), 4)}
+            for row, score in zip(top_rows, scores[top]) if row in ids
+        ]
+
+    def stats(self):
+        with self._lock:
+            self._refresh()
+            return {
+                "documents": self._state("doc_count"),
+                "terms": self._db.execute("SELECT COUNT(DISTINCT term) FROM postings").fetchone()[0],
+                "segments": self._db.execute("SELECT COUNT(*) FROM postings").fetchone()[0],
+                "avg_length": round(self._state("total_length") / max(1, self._state("doc_count")), 1),
+                "disk_bytes": sum(
+                    os.path.getsize(os.path.join(self.path, name)) for name in os.listdir(self.path)
+                    if name.startswith("lexical.sqlite3")
+                ),
+                "memory_bytes": int(self._lengths.nbytes)
+            }
+
+if __name__ == "__main__":
+    # python lexical_index.py stats|compact
+    if len(sys.argv) == 2 and sys.argv[1] in ("stats", "compact") and LEXICAL_INDEX_DIR:
+        index = LexicalIndex()
+        if sys.argv[1] == "compact":
+            print(f"Merged postings of {index.compact()} terms", file=sys.stderr)
+        print(json.dumps(index.stats(), indent=2))
+    else:
+        print("Usage: python lexical_index.py stats|compact  (LEXICAL_INDEX_DIR must be set)", file=sys.stderr)
+        sys.exit(1)
@@ -1,117 +1,195 @@
 import json
 import dotenv
-from sentence_transformers import SentenceTransformer, util
-from pinecone import Pinecone, ServerlessSpec
-import os
 from groq import Groq
 from datetime import datetime
 import sys
 import codecs
-
-# Reconfigure stdout to use UTF-8 encoding
-sys.stdout = codecs.getwriter("utf-8")(sys.stdout.detach())
+import time
 
 
 # Import search and scrape functions
 from searchurl import search_serper
-from webscrap import scrape_webpage
+from webscrap import scrape_many, SCRAPE_DEADLINE_SECONDS
+from worker import serve
+from embedding_service import EmbeddingService, cosine_similarity
+from ingestion import collect_documents, ingest_documents
+from vector_store import open_index
+from deadline import Deadline
+from reward_log import RewardLog, migrate_legacy
+from retrieval_gate import RetrievalGate, RETRIEVAL_FIRST
+from answer_cache import get_answer_cache
+from rl_agent import query_features
+from tracing import span, count_tokens
 
 # ======== STEP 1: SETUP ========
-dotenv.load_dotenv()
-PINECONE_API_KEY = dotenv.get_key(dotenv.find_dotenv(), "PINECONE_API_KEY")
-GROQ_API_KEY = dotenv.get_key(dotenv.find_dotenv(), "GROQ_API_KEY")
-
-pc = Pinecone(api_key=PINECONE_API_KEY)
-index_name = "rag-knowledge-384"
-
-# Ensure Pinecone index exists (or create it if not)
-if index_name not in [i.name for i in pc.list_indexes()]:
-    pc.create_index(
-        name=index_name,
-        dimension=384,  # Hugging Face MiniLM outputs 384-dim embeddings
-        metric="cosine",
-        spec=ServerlessSpec(cloud="aws", region="us-east-1")
-    )
-index = pc.Index(index_name)
-
-embedder = SentenceTransformer("all-MiniLM-L6-v2")
-groq_client = Groq(api_key=GROQ_API_KEY)
-
-# ======== STEP 2: GET USER QUESTION ========
-query = sys.stdin.read().strip()
-
-# ======== STEP 3: DYNAMIC DATA INGESTION (Search, Scrape, Embed, Upsert) ========
-print(f"Searching for relevant information for: '{query}'")
-search_results = search_serper(query, num_results=5) # Get top 5 results
-
-dynamic_vectors = []
-dynamic_contexts = []
-vector_id_counter = 0 # To ensure unique IDs for dynamically added vectors
-
-if not search_results:
-    print("No search results found. Proceeding with existing knowledge.")
-
-for result in search_results:
-    url = result.get('link')
-    title = result.get('title')
-    snippet = result.get('snippet')
-
-    print(f"Scraping content from: '{title}' ({url})")
-    content = scrape_webpage(url)
-
-    if len(content) < 200:
-        print(f"Skipping '{url}' — content too short.")
-        continue
-
-    text_to_embed = content[:4000] # Truncate for embedding
-    emb = embedder.encode(text_to_embed).tolist()
-
-    dynamic_vectors.append({
-        "id": f"dynamic-{vector_id_counter}", # Unique ID for dynamic vectors
-        "values": emb,
-        "metadata": {
-            "title": title,
-            "url": url,
-            "snippet": snippet,
-            "query": query # Associate with the current user query
-        }
-    })
-    dynamic_contexts.append(f"{title}: {snippet}")
-    vector_id_counter += 1
-
-if dynamic_vectors:
-    print(f"Embedding and storing {len(dynamic_vectors)} new documents in Pinecone.")
-    index.upsert(vectors=dynamic_vectors)
-    print(f"Successfully updated knowledge base with new information.")
-else:
-    print("No new documents to embed and upload.")
-
-# ======== STEP 4: EMBED THE QUESTION ========
-print("Embedding user query.")
-query_emb = embedder.encode(query).tolist()
-
-# ======== STEP 5: RETRIEVE SIMILAR DOCUMENTS (including newly added) ========
-print("Retrieving most relevant documents from knowledge base.")
-results = index.query(vector=query_emb, top_k=5, include_metadata=True) # Increased top_k
-
-context_texts = []
-retrieved_contexts = []
-
-if not results["matches"]:
-    print("No relevant documents found in knowledge base.")
-
-for match in results["matches"]:
-    meta = match["metadata"]
-    snippet = meta.get("snippet", "")
-    title = meta.get("title", "No Title")
-    url = meta.get("url", "No URL")
-
-    retrieved_contexts.append({"title": title, "url": url, "snippet": snippet})
-    context_texts.append(f"{title}: {snippet}")
-
-# ======== STEP 6: BUILD CONTEXT FOR LLM ========
-context = "\n\n".join(context_texts)
-prompt = f"""
+def load_resources():
+    """Open the vector index and create the embedder and Groq client once per process."""
+    dotenv.load_dotenv()
+    GROQ_API_KEY = dotenv.get_key(dotenv.find_dotenv(), "GROQ_API_KEY")
+
+    # Fold the old reward_memory.json array into the JSONL log the first time we start
+    reward_log = RewardLog()
+    migrate_legacy(log=reward_log)
+
+    return {
+        "index": open_index(),  # Pinecone by default, LocalVectorStore with VECTOR_BACKEND=local
+        "embedder": EmbeddingService(),
+        "groq_client": Groq(api_key=GROQ_API_KEY),
+        "reward_log": reward_log,
+        "retrieval_gate": RetrievalGate(),
+        "answer_cache": get_answer_cache(),
+    }
+
+# ======== STEP 8: COMPUTE REWARD SIGNAL ========
+def compute_reward(embedder, answer_text, contexts):
+    """Compute semantic similarity between the answer and retrieved context."""
+    if not answer_text or not contexts:
+        return 0.0
+    context_text = " ".join([c["snippet"] for c in contexts])
+    emb_answer, emb_context = embedder.encode([answer_text, context_text])
+    similarity = cosine_similarity(emb_answer, emb_context)
+    return round(float(similarity), 3)
+
+# ======== STEP 9: LOG REWARD MEMORY ========
+def log_reward(query, contexts, answer, reward, reward_log=None):
+    """Append one reward entry; O(1) per query and safe across concurrent workers."""
+    entry = {
+        "query": query,
+        "contexts": [c["url"] for c in contexts],
+        "answer": answer,
+        "reward_score": reward,
+        "timestamp": datetime.now().isoformat()
+    }
+    (reward_log or RewardLog()).append(entry)
+
+def generate_answer(groq_client, prompt, emit, stream=False):
+    """
+    Generate the answer with Groq. With stream=True each token batch is emitted
+    as an {"type": "answer_delta"} message as soon as it arrives.
+    """
+    if not stream:
+        response = groq_client.chat.completions.create(
+            model="llama-3.3-70b-versatile",
+            messages=[{"role": "user", "content": prompt}]
+        )
+        count_tokens(response, "rag")
+        return response.choices[0].message.content.strip()
+
+    parts = []
+    for chunk in groq_client.chat.completions.create(
+        model="llama-3.3-70b-versatile",
+        messages=[{"role": "user", "content": prompt}],
+        stream=True
+    ):
+        # Groq reports usage on the last chunk under x_groq
+        if getattr(chunk, "x_groq", None) is not None:
+            count_tokens(chunk.x_groq, "rag")
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if delta:
+            parts.append(delta)
+            emit({"type": "answer_delta", "delta": delta})
+    return "".join(parts).strip()
+
+def run_query(query, resources, emit, deadline=None, stream=False):
+    """
+    Answer one query; protocol messages go through emit(), progress goes to print().
+
+    With stream=True the answer is also emitted incrementally as answer_delta
+    messages; final_answer and reward_score still follow once it is complete.
+    """
+    index = resources["index"]
+    embedder = resources["embedder"]
+    groq_client = resources["groq_client"]
+    gate = resources["retrieval_gate"]
+    deadline = deadline or Deadline()
+
+    answer_cache = resources["answer_cache"]
+
+    # ======== STEP 3: SEMANTIC ANSWER CACHE, THEN RETRIEVAL FIRST ========
+    # A near-duplicate of a recent question is answered without touching the pipeline
+    query_emb = embedder.encode_one(query).tolist()
+    cached = answer_cache.lookup(query_emb)
+    if cached:
+        print(f"Answer cache hit ({cached['similarity']}) for earlier question: '{cached['query']}'")
+        emit({"type": "answer_cache", "hit": True, "similarity": cached["similarity"], "age_seconds": cached["age_seconds"]})
+        emit({"type": "final_answer", "answer": cached["answer"]})
+        emit({"type": "reward_score", "score": cached["reward"]})
+        return
+
+    # Check what the index already knows; the web is only searched when it falls short
+    decision = {"ingest": True, "reason": "retrieval_first_disabled", "top_score": 0.0, "sources": 0}
+    if RETRIEVAL_FIRST:
+        with span("query", top_k=5):
+            results = index.query(vector=query_emb, top_k=5, include_metadata=True, text=query)
+        decision = gate.assess(query, results["matches"])
+
+    if decision["ingest"] and not deadline.allows_scraping():
+        # Not enough budget left for the web: answer from the existing index
+        print(f"Skipping web ingestion: only {deadline.remaining():.1f}s left before the deadline.")
+        emit({"type": "degraded", "stages": ["scrape"]})
+        decision = {**decision, "ingest": False, "reason": "deadline"}
+
+    if not decision["ingest"]:
+        gate.record(query, decision)
+        if not RETRIEVAL_FIRST:
+            with span("query", top_k=5):
+                results = index.query(vector=query_emb, top_k=5, include_metadata=True, text=query)
+    else:
+        # ======== STEP 4: DYNAMIC DATA INGESTION (Search, Scrape, Embed, Upsert) ========
+        ingest_start = time.time()
+        print(f"Searching for relevant information for: '{query}'")
+        search_results = search_serper(query, num_results=5) # Get top 5 results
+
+        if not search_results:
+            print("No search results found. Proceeding with existing knowledge.")
+
+        # Scrape all search results in parallel under a single per-query deadline
+        print(f"Scraping content from {len(search_results)} pages concurrently.")
+        scraped_pages = scrape_many([result.get('link') for result in search_results],
+                                    deadline=deadline.scrape_deadline(SCRAPE_DEADLINE_SECONDS))
+
+        for result, page in zip(search_results, scraped_pages):
+            print(f"Scraped '{result.get('title')}' ({result.get('link')}) in {page['seconds']:.2f}s [{page['status']}]")
+
+        # Embed new documents and the question in one batch, then upsert.
+        # Vector IDs are derived from the URL, and pages whose content hash is unchanged are skipped
+        dynamic_documents = collect_documents(query, search_results, scraped_pages)
+        # Cached answers built from a page that just changed are dropped by ingest_documents
+        query_emb, upserted, skipped = ingest_documents(index, embedder, dynamic_documents, query)
+
+        if upserted:
+            print(f"Successfully updated knowledge base with {upserted} new or changed documents.")
+        if skipped:
+            print(f"Skipped {skipped} documents already stored with identical content.")
+        if not dynamic_documents:
+            print("No new documents to embed and upload.")
+        gate.record(query, decision, ingest_seconds=time.time() - ingest_start)
+
+        # ======== STEP 5: RETRIEVE SIMILAR DOCUMENTS (including newly added) ========
+        print("Retrieving most relevant documents from knowledge base.")
+        # Passing the query text fuses dense results with BM25 exact-term matches (hybrid_index.py)
+        with span("query", top_k=5):
+            results = index.query(vector=query_emb, top_k=5, include_metadata=True, text=query) # Increased top_k
+
+    context_texts = []
+    retrieved_contexts = []
+
+    if not results["matches"]:
+        print("No relevant documents found in knowledge base.")
+
+    for match in results["matches"]:
+        meta = match["metadata"]
+        # Chunked vectors carry their passage text; older vectors only have the search snippet
+        snippet = meta.get("text") or meta.get("snippet", "")
+        title = meta.get("title", "No Title")
+        url = meta.get("url", "No URL")
+
+        retrieved_contexts.append({"title": title, "url": url, "snippet": snippet})
+        context_texts.append(f"{title}: {snippet}")
+
+    # ======== STEP 6: BUILD CONTEXT FOR LLM ========
+    context = "\n\n".join(context_texts)
+    prompt = f"""
 You are an expert assistant. Using only the information provided in the context below,
 compose a single, clear, and well-structured answer to the question.
 
@@ -131,59 +209,45 @@ Question:
 Answer:
 """
 
-# ======== STEP 7: GENERATE LLM RESPONSE ======== 
-print("Generating response using Groq LLM.")
-try:
-    response = groq_client.chat.completions.create(
-        model="llama-3.3-70b-versatile",
-        messages=[{"role": "user", "content": prompt}]
-    )
-
-    answer = response.choices[0].message.content.strip()
-    print("LLM response generated.")
-    # Final answer and reward score will be printed in a specific format for Node.js to parse
-    print(json.dumps({"type": "final_answer", "answer": answer}))
-
-except Exception as e:
-    print(f"Error generating answer: {e}")
-    answer = None
-
-# ======== STEP 8: COMPUTE REWARD SIGNAL ======== 
-def compute_reward(answer_text, contexts):
-    """Compute semantic similarity between the answer and retrieved context."""
-    if not answer_text or not contexts:
-        return 0.0
-    context_text = " ".join([c["snippet"] for c in contexts])
-    emb_answer = embedder.encode(answer_text, convert_to_tensor=True)
-    emb_context = embedder.encode(context_text, convert_to_tensor=True)
-    similarity = util.pytorch_cos_sim(emb_answer, emb_context).item()
-    return round(float(similarity), 3)
-
-reward_score = compute_reward(answer, retrieved_contexts)
-print(json.dumps({"type": "reward_score", "score": reward_score}))
-
-# ======== STEP 9: LOG REWARD MEMORY ========
-def log_reward(query, contexts, answer, reward, log_file=os.path.join(os.path.dirname(__file__), 'reward_memory.json')):
-    entry = {
-        "query": query,
-        "contexts": [c["url"] for c in contexts],
-        "answer": answer,
-        "reward_score": reward,
-        "timestamp": datetime.now().isoformat()
-    }
-
-    # Load old data or create new
+    # ======== STEP 7: GENERATE LLM RESPONSE ========
+    print("Generating response using Groq LLM.")
     try:
-        with open(log_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
-    except FileNotFoundError:
-        data = []
-
-    data.append(entry)
-
-    with open(log_file, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
-
-# Save to log
-if answer:
-    log_reward(query, retrieved_contexts, answer, reward_score)
\ No newline at end of file
+        with span("generate", stream=stream):
+            answer = generate_answer(groq_client, prompt, emit, stream=stream)
+        print("LLM response generated.")
+        # Final answer and reward score are emitted in a specific format for Node.js to parse
+        emit({"type": "final_answer", "answer": answer})
+
+    except Exception as e:
+        print(f"Error generating answer: {e}")
+        # Fail the request instead of scoring nothing: a streaming client may
+        # already hold part of the answer and must get an error, not reward_score
+        raise RuntimeError(f"Answer generation failed: {e}") from e
+
+    reward_score = compute_reward(embedder, answer, retrieved_contexts)
+    emit({"type": "reward_score", "score": reward_score})
+
+    # Save to log
+    if answer:
+        log_reward(query, retrieved_contexts, answer, reward_score, resources.get("reward_log"))
+        answer_cache.store(query, query_emb, answer, reward_score, [c["url"] for c in retrieved_contexts],
+                           fresh=query_features(query)["fresh"])
+
+def main():
+    # Reconfigure stdout to use UTF-8 encoding
+    sys.stdout = codecs.getwriter("utf-8")(sys.stdout.detach())
+
+    resources = load_resources()
+
+    # Worker mode: keep the models warm and serve many queries over stdin/stdout
+    if "--worker" in sys.argv:
+        serve(lambda request, emit: run_query(request["query"], resources, emit, Deadline.from_request(request),
+                                              stream=request.get("stream", False)))
+        return
+
+    # ======== STEP 2: GET USER QUESTION ========
+    query = sys.stdin.read().strip()
+    run_query(query, resources, lambda message: print(json.dumps(message)))
+
+if __name__ == "__main__":
+    main()
@@ -1,155 +1,246 @@
 import json
 import dotenv
-from sentence_transformers import SentenceTransformer
-from pinecone import Pinecone, ServerlessSpec
 import os
 from groq import Groq
 from datetime import datetime
 import sys
 import codecs
 import time
-
-# Reconfigure stdout to use UTF-8 encoding
-sys.stdout = codecs.getwriter("utf-8")(sys.stdout.detach())
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
 # Import functions from other local scripts
 from searchurl import search_serper
-from webscrap import scrape_webpage
-from comprehensive_evaluate import comprehensive_evaluation
-from rl_agent import RLAgent # Import the RLAgent
-
-def main():
-    start_time = time.time()
-    print(f"[{datetime.now()}] Starting rag_query_compare.py", file=sys.stderr)
-
-    # ======== STEP 1: PARSE ARGUMENTS AND SETUP ========
-    if len(sys.argv) > 1:
-        query = sys.argv[1]
-    else:
-        query = sys.stdin.read().strip()
-    print(f"[{datetime.now()}] Query received: '{query}'", file=sys.stderr)
-
+from webscrap import scrape_many, SCRAPE_DEADLINE_SECONDS
+from comprehensive_evaluate import comprehensive_evaluation, set_semantic_model, preload_models
+from rl_agent import RLAgent, RETRIEVAL_ACTIONS, query_features # Import the RLAgent
+from worker import serve
+from eval_queue import EvaluationQueue
+from embedding_service import EmbeddingService
+from ingestion import collect_documents, ingest_documents
+from vector_store import open_index
+from tracing import span, count_tokens, bind
+from deadline import Deadline
+
+def load_resources():
+    """Open the vector index and create the embedder and Groq client once per process."""
     dotenv.load_dotenv()
-    PINECONE_API_KEY = dotenv.get_key(dotenv.find_dotenv(), "PINECONE_API_KEY")
     GROQ_API_KEY = dotenv.get_key(dotenv.find_dotenv(), "GROQ_API_KEY")
 
-    pc = Pinecone(api_key=PINECONE_API_KEY)
-    index_name = "rag-knowledge-384"
-
-    if index_name not in [i.name for i in pc.list_indexes()]:
-        pc.create_index(
-            name=index_name,
-            dimension=384,
-            metric="cosine",
-            spec=ServerlessSpec(cloud="aws", region="us-east-1")
-        )
-    index = pc.Index(index_name)
+    embedder = EmbeddingService()
+    # The evaluator reuses this MiniLM instance instead of loading its own
+    set_semantic_model(embedder)
 
-    embedder = SentenceTransformer("all-MiniLM-L6-v2")
-    groq_client = Groq(api_key=GROQ_API_KEY)
-
-    # Initialize RL Agent and choose top_k
-    rl_agent = RLAgent()
-    available_top_ks = [3, 5, 7] # Define possible actions for top_k
-    chosen_top_k = rl_agent.choose_action(available_top_ks)
-    print(f"[{datetime.now()}] RL Agent chose top_k: {chosen_top_k}", file=sys.stderr)
+    return {
+        "index": open_index(),  # Pinecone by default, LocalVectorStore with VECTOR_BACKEND=local
+        "embedder": embedder,
+        "groq_client": Groq(api_key=GROQ_API_KEY),
+    }
 
-    # ======== STEP 2: DYNAMIC DATA INGESTION ========
-    ingestion_start_time = time.time()
-    search_results = search_serper(query, num_results=5)
-    
-    dynamic_vectors = []
-    if search_results:
-        for result in search_results:
-            url = result.get('link')
-            title = result.get('title')
-            content = scrape_webpage(url)
-            if len(content) < 200:
-                continue
-            
-            text_to_embed = content[:4000]
-            emb = embedder.encode(text_to_embed).tolist()
-            
-            dynamic_vectors.append({
-                "id": f"dynamic-{datetime.now().timestamp()}",
-                "values": emb,
-                "metadata": {
-                    "title": title,
-                    "url": url,
-                    "snippet": result.get('snippet', ''),
-                    "query": query
-                }
-            })
-        
-        if dynamic_vectors:
-            index.upsert(vectors=dynamic_vectors)
-    ingestion_end_time = time.time()
-    print(f"[{datetime.now()}] Dynamic Data Ingestion took {ingestion_end_time - ingestion_start_time:.2f} seconds", file=sys.stderr)
-
-    # ======== STEP 3: EMBED & RETRIEVE ========
-    embed_retrieve_start_time = time.time()
-    query_emb = embedder.encode(query).tolist()
-    results = index.query(vector=query_emb, top_k=chosen_top_k, include_metadata=True) # Use chosen_top_k
-    
-    context_texts = [match["metadata"].get("snippet", "") for match in results["matches"]]
-    context = "\n\n".join(context_texts)
-    embed_retrieve_end_time = time.time()
-    print(f"[{datetime.now()}] Embed & Retrieve took {embed_retrieve_end_time - embed_retrieve_start_time:.2f} seconds", file=sys.stderr)
+# Shared by every comparison in this process; the plain-LLM call runs here alongside the RAG path
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="compare")
 
-    # ======== STEP 4: GENERATE RAG ANSWER ========
-    rag_start_time = time.time()
-    rag_answer = None
+@contextmanager
+def stage(timings, name):
+    """Record how long a pipeline stage took, in `timings`, as a trace span and on stderr."""
+    start = time.time()
+    try:
+        with span(f"stage.{name}"):
+            yield
+    finally:
+        elapsed = time.time() - start
+        timings[name] = round(elapsed, 3)
+        print(f"[{datetime.now()}] {name} took {elapsed:.2f} seconds", file=sys.stderr)
+
+def generate_rag_answer(groq_client, context, query):
+    with span("generate", kind="rag"):
+        return _generate_rag_answer(groq_client, context, query)
+
+def _generate_rag_answer(groq_client, context, query):
     try:
         prompt = f"Based on the following context, generate a comprehensive answer to the question.\\n\\nContext:\\n{context}\\n\\nQuestion: {query}"
         response = groq_client.chat.completions.create(
             model="llama-3.3-70b-versatile",
             messages=[{"role": "user", "content": prompt}]
         )
-        rag_answer = response.choices[0].message.content.strip()
+        count_tokens(response, "rag")
+        return response.choices[0].message.content.strip()
     except Exception as e:
         print(f"[{datetime.now()}] Error generating RAG answer: {e}", file=sys.stderr)
-        rag_answer = "Error generating RAG answer."
-    rag_end_time = time.time()
-    print(f"[{datetime.now()}] RAG Answer Generation took {rag_end_time - rag_start_time:.2f} seconds", file=sys.stderr)
+        return "Error generating RAG answer."
+
+def generate_llm_answer(groq_client, query):
+    with span("generate", kind="llm"):
+        return _generate_llm_answer(groq_client, query)
 
-    # ======== STEP 5: GENERATE LLM ANSWER (NO RAG) ========
-    llm_start_time = time.time()
-    llm_answer = None
+def _generate_llm_answer(groq_client, query):
     try:
         response = groq_client.chat.completions.create(
             model="llama-3.3-70b-versatile",
             messages=[{"role": "user", "content": query}]
         )
-        llm_answer = response.choices[0].message.content.strip()
+        count_tokens(response, "llm")
+        return response.choices[0].message.content.strip()
     except Exception as e:
         print(f"[{datetime.now()}] Error generating LLM answer: {e}", file=sys.stderr)
-        llm_answer = "Error generating LLM answer."
-    llm_end_time = time.time()
-    print(f"[{datetime.now()}] LLM Answer Generation took {llm_end_time - llm_start_time:.2f} seconds", file=sys.stderr)
+        return "Error generating LLM answer."
+
+def run_comparison(query, resources, defer_evaluation=False, deadline=None):
+    """
+    Run the RAG vs. plain LLM comparison for one query and return the output payload.
+
+    The plain-LLM answer depends only on the query, so it is generated in the
+    background while search, scraping, ingestion, retrieval and the RAG answer
+    run. Per-stage durations are returned under "timings".
+
+    With defer_evaluation the answers are returned straight away and the
+    evaluation is queued for eval_worker.py; fetch it later by "query_id".
+
+    Under a tight `deadline` the pipeline degrades instead of timing out:
+    first web scraping is skipped, then evaluation is deferred to the queue.
+    Dropped stages are listed under "degraded".
+    """
+    start_time = time.time()
+    print(f"[{datetime.now()}] Query received: '{query}'", file=sys.stderr)
+
+    index = resources["index"]
+    embedder = resources["embedder"]
+    groq_client = resources["groq_client"]
+    deadline = deadline or Deadline()
+    timings = {}
+    degraded = []
+
+    # ======== STEP 5 (CONCURRENT): GENERATE LLM ANSWER (NO RAG) ========
+    def timed_llm_answer():
+        with stage(timings, "llm_generation"):
+            return generate_llm_answer(groq_client, query)
+    llm_future = _executor.submit(bind(timed_llm_answer))
+
+    # The RL agent picks the retrieval configuration from cheap query features
+    # (the query embedding is cached, so ingestion reuses it)
+    rl_agent = RLAgent()
+    features = query_features(query, embedder.encode_one(query))
+    action = rl_agent.choose_action(RETRIEVAL_ACTIONS, features)
+    print(f"[{datetime.now()}] RL Agent chose {action} for {features}", file=sys.stderr)
+
+    # ======== STEP 2: DYNAMIC DATA INGESTION ========
+    if action["scrape"] and not deadline.allows_scraping():
+        # Not enough budget left for the web: answer from what is already indexed
+        print(f"[{datetime.now()}] Skipping search and scraping: {deadline.remaining():.1f}s left", file=sys.stderr)
+        degraded.append("scrape")
+        action = {**action, "num_results": 0, "max_chunks": 0, "scrape": False}
+
+    if action["scrape"]:
+        with stage(timings, "search"):
+            search_results = search_serper(query, num_results=action["num_results"])
+
+        with stage(timings, "scrape"):
+            scrape_deadline = deadline.scrape_deadline(SCRAPE_DEADLINE_SECONDS)
+            scraped_pages = scrape_many([result.get('link') for result in search_results], deadline=scrape_deadline) if search_results else []
+    else:
+        search_results, scraped_pages = [], []
+
+    # Stable URL-derived IDs; unchanged pages skip both the embedding and the upsert
+    with stage(timings, "ingest"):
+        dynamic_documents = collect_documents(query, search_results, scraped_pages, max_chunks=action["max_chunks"])
+        query_emb, upserted, skipped = ingest_documents(index, embedder, dynamic_documents, query)
+    print(f"[{datetime.now()}] Upserted {upserted} documents, skipped {skipped} unchanged", file=sys.stderr)
+
+    # ======== STEP 3: RETRIEVE ========
+    # Dense and BM25 rankings are fused; `text` enables the lexical side
+    with stage(timings, "retrieve"):
+        with span("query", top_k=action["top_k"]):
+            results = index.query(vector=query_emb, top_k=action["top_k"], include_metadata=True, text=query)
+
+    # Prefer the retrieved chunk text; fall back to the search snippet for older vectors
+    context_texts = [match["metadata"].get("text") or match["metadata"].get("snippet", "") for match in results["matches"]]
+    context = "\n\n".join(context_texts)
+
+    # ======== STEP 4: GENERATE RAG ANSWER ========
+    with stage(timings, "rag_generation"):
+        rag_answer = generate_rag_answer(groq_client, context, query)
+
+    # Usually already finished by now; this records any remaining wait
+    with stage(timings, "llm_wait"):
+        llm_answer = llm_future.result()
 
     # ======== STEP 6: EVALUATE ANSWERS ========
-    evaluation_start_time = time.time()
+    query_id = uuid.uuid4().hex
     evaluation = None
-    if rag_answer and llm_answer and "Error" not in rag_answer and "Error" not in llm_answer:
-        evaluation = comprehensive_evaluation(query, rag_answer, llm_answer)
-    evaluation_end_time = time.time()
-    print(f"[{datetime.now()}] Evaluation took {evaluation_end_time - evaluation_start_time:.2f} seconds", file=sys.stderr)
+    evaluation_status = "skipped"
+    answers_ok = rag_answer and llm_answer and "Error" not in rag_answer and "Error" not in llm_answer
+    if answers_ok and not defer_evaluation and not deadline.allows_evaluation():
+        print(f"[{datetime.now()}] Deferring evaluation: {deadline.remaining():.1f}s left", file=sys.stderr)
+        degraded.append("evaluation")
+        defer_evaluation = True
+    if answers_ok and defer_evaluation:
+        # The background evaluators compute the reward and update the RL agent
+        EvaluationQueue().enqueue(query_id, {
+            "query": query,
+            "rag_answer": rag_answer,
+            "llm_answer": llm_answer,
+            "action": action,
+            "features": features
+        })
+        evaluation_status = "queued"
+    elif answers_ok:
+        with stage(timings, "evaluation"):
+            evaluation = comprehensive_evaluation(query, rag_answer, llm_answer)
+        evaluation_status = "done"
 
     # Learn from the reward
     if evaluation and "rag_reward" in evaluation:
-        rl_agent.learn(chosen_top_k, evaluation["rag_reward"])
-        print(f"[{datetime.now()}] RL Agent learned: top_k={chosen_top_k}, reward={evaluation['rag_reward']}", file=sys.stderr)
+        rl_agent.learn(action, evaluation["rag_reward"], features)
+        print(f"[{datetime.now()}] RL Agent learned: {action}, reward={evaluation['rag_reward']}", file=sys.stderr)
 
     # ======== STEP 7: FINAL OUTPUT ========
+    end_time = time.time()
+    timings["total"] = round(end_time - start_time, 3)
     final_output = {
+        "query_id": query_id,
         "rag_answer": rag_answer,
         "llm_answer": llm_answer,
-        "evaluation": evaluation
+        "evaluation": evaluation,
+        "evaluation_status": evaluation_status,
+        "timings": timings,
+        "retrieval": action,
+        "degraded": degraded
     }
-    print(json.dumps(final_output), flush=True)
-    
-    end_time = time.time()
     print(f"[{datetime.now()}] Total execution time: {end_time - start_time:.2f} seconds", file=sys.stderr)
+    return final_output
+
+def main():
+    # Reconfigure stdout to use UTF-8 encoding
+    sys.stdout = codecs.getwriter("utf-8")(sys.stdout.detach())
+
+    print(f"[{datetime.now()}] Starting rag_query_compare.py", file=sys.stderr)
+
+    # ======== STEP 1: PARSE ARGUMENTS AND SETUP ========
+    worker_mode = "--worker" in sys.argv[1:]
+    defer_evaluation = "--defer-eval" in sys.argv[1:] or os.getenv("RAG_DEFER_EVALUATION") == "1"
+    if not worker_mode:
+        args = [arg for arg in sys.argv[1:] if arg != "--defer-eval"]
+        if args:
+            query = args[0]
+        else:
+            query = sys.stdin.read().strip()
+
+    resources = load_resources()
+
+    # Worker mode: keep the models warm and serve many comparisons over stdin/stdout
+    if worker_mode:
+        # Evaluation models load lazily; warm them in the background so the first request doesn't wait
+        if not defer_evaluation:
+            threading.Thread(target=preload_models, daemon=True).start()
+        serve(lambda request, emit: emit({"type": "result", "result": run_comparison(
+            request["query"], resources, defer_evaluation=request.get("defer_evaluation", defer_evaluation),
+            deadline=Deadline.from_request(request))}))
+        return
+
+    final_output = run_comparison(query, resources, defer_evaluation=defer_evaluation)
+    print(json.dumps(final_output), flush=True)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,79 @@
+import os
+import sys
+import time
+from datetime import datetime
+from reward_log import RewardLog
+from rl_agent import query_features
+
+RETRIEVAL_FIRST = os.getenv("RETRIEVAL_FIRST", "1") == "1"
+# The index "covers" a query when its best match clears COVERAGE_MIN_SCORE and at
+# least COVERAGE_MIN_SOURCES distinct pages have a match above COVERAGE_MATCH_SCORE
+COVERAGE_MIN_SCORE = float(os.getenv("COVERAGE_MIN_SCORE", "0.6"))
+COVERAGE_MATCH_SCORE = float(os.getenv("COVERAGE_MATCH_SCORE", "0.45"))
+COVERAGE_MIN_SOURCES = int(os.getenv("COVERAGE_MIN_SOURCES", "2"))
+RETRIEVAL_LOG_PATH = os.getenv("RETRIEVAL_LOG_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "retrieval_decisions.jsonl"))
+# Starting guess for search + scrape + ingest, refined from observed runs
+INITIAL_INGEST_SECONDS = 8.0
+EWMA_ALPHA = 0.2
+
+class RetrievalGate:
+    """
+    Decides whether a query needs live web ingestion.
+
+    The pipeline queries the index first; search and scraping only run when
+    the matches are too weak or too few, or the query looks time-sensitive.
+    Each decision is appended to RETRIEVAL_LOG_PATH with the ingestion time
+    it saved, estimated as a moving average of the ingestions that did run.
+    """
+
+    def __init__(self, log_path=RETRIEVAL_LOG_PATH):
+        self.log = RewardLog(log_path)
+        self.ingest_seconds = INITIAL_INGEST_SECONDS
+
+    def assess(self, query, matches):
+        """Return a decision dict; decision["ingest"] says whether to search and scrape."""
+        scores = [match["score"] for match in matches]
+        sources = {
+            match["metadata"].get("url") or match["metadata"].get("parent_id") or match["id"]
+            for match in matches if match["score"] >= COVERAGE_MATCH_SCORE
+        }
+        top_score = max(scores) if scores else 0.0
+        time_sensitive = query_features(query)["fresh"]
+
+        if time_sensitive:
+            reason = "time_sensitive"
+        elif top_score < COVERAGE_MIN_SCORE:
+            reason = "low_score"
+        elif len(sources) < COVERAGE_MIN_SOURCES:
+            reason = "low_coverage"
+        else:
+            reason = "covered"
+        return {
+            "ingest": reason != "covered",
+            "reason": reason,
+            "top_score": round(top_score, 3),
+            "sources": len(sources)
+        }
+
+    def record(self, query, decision, ingest_seconds=None):
+        """Log a decision; pass ingest_seconds when ingestion ran so the estimate learns from it."""
+        if ingest_seconds is not None:
+            self.ingest_seconds += EWMA_ALPHA * (ingest_seconds - self.ingest_seconds)
+            saved = 0.0
+        else:
+            saved = self.ingest_seconds
+
+        entry = {
+            **decision,
+            "query": query,
+            "ingest_seconds": round(ingest_seconds, 3) if ingest_seconds is not None else None,
+            "saved_seconds": round(saved, 3),
+            "timestamp": time.time()
+        }
+        try:
+            self.log.append(entry)
+        except OSError as e:
+            print(f"[{datetime.now()}] Could not write retrieval decision: {e}", file=sys.stderr)
+        print(f"[{datetime.now()}] Retrieval gate: {decision['reason']} (top score {decision['top_score']}, "
+              f"{decision['sources']} sources), saved ~{saved:.2f}s", file=sys.stderr)
+        return entry
@@ -0,0 +1,160 @@
+import json
+import os
+import sys
+from contextlib import contextmanager
+from datetime import datetime
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+NODE_DIR = os.path.dirname(os.path.abspath(__file__))
+REWARD_LOG_PATH = os.getenv("REWARD_LOG_PATH", os.path.join(NODE_DIR, "reward_log.jsonl"))
+REWARD_LOG_MAX_BYTES = int(os.getenv("REWARD_LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+REWARD_LOG_BACKUPS = int(os.getenv("REWARD_LOG_BACKUPS", "5"))
+# The old read-modify-write log: one JSON array rewritten on every query
+LEGACY_REWARD_FILE = os.getenv("REWARD_LEGACY_FILE", os.path.join(NODE_DIR, "reward_memory.json"))
+
+@contextmanager
+def file_lock(path):
+    """Exclusive advisory lock on `path + '.lock'`, shared by every process that writes `path`."""
+    with open(path + ".lock", "a+") as lock_file:
+        if os.name == "nt":
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if os.name == "nt":
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+def write_json_atomic(path, data):
+    """Write JSON to a temp file and swap it in, so readers never see a partial file."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+class RewardLog:
+    """
+    Append-only JSON-lines log of per-query rewards.
+
+    Each append writes one line under an exclusive file lock, so concurrent
+    workers never lose entries and the cost no longer grows with the history.
+    When the file passes `max_bytes` it is rotated to `.1`, `.2`, ... and only
+    `backups` old files are kept; compact() folds everything back into one file.
+    """
+
+    def __init__(self, path=REWARD_LOG_PATH, max_bytes=REWARD_LOG_MAX_BYTES, backups=REWARD_LOG_BACKUPS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+
+    def append(self, entry):
+        self.extend([entry])
+
+    def extend(self, entries):
+        lines = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries)
+        with file_lock(self.path):
+            self._rotate_if_needed()
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(lines)
+
+    def _rotate_if_needed(self):
+        if self.max_bytes <= 0:
+            return
+        try:
+            if os.path.getsize(self.path) < self.max_bytes:
+                return
+        except FileNotFoundError:
+            return
+        for n in range(self.backups, 0, -1):
+            source = self.path if n == 1 else f"{self.path}.{n - 1}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{n}")
+        if self.backups == 0:
+            os.remove(self.path)
+
+    def _files(self):
+        """Rotated files oldest first, then the live file."""
+        rotated = [f"{self.path}.{n}" for n in range(self.backups, 0, -1)]
+        return [path for path in rotated + [self.path] if os.path.exists(path)]
+
+    def __iter__(self):
+        for path in self._files():
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn line from a crashed writer; skip it
+                        continue
+
+    def compact(self, keep_last=None):
+        """Merge rotated files into the live file, dropping torn lines and, optionally, old entries."""
+        with file_lock(self.path):
+            entries = list(self)
+            if keep_last is not None:
+                entries = entries[-keep_last:]
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for entry in entries:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, self.path)
+            for n in range(1, self.backups + 1):
+                if os.path.exists(f"{self.path}.{n}"):
+                    os.remove(f"{self.path}.{n}")
+        return len(entries)
+
+def migrate_legacy(legacy_path=LEGACY_REWARD_FILE, log=None):
+    """
+    One-time import of the old JSON-array reward file into the JSONL log.
+
+    The legacy file is renamed to `<name>.migrated` afterwards, so running this
+    again is a no-op. Returns the number of entries imported.
+    """
+    log = log or RewardLog()
+    if not os.path.exists(legacy_path):
+        return 0
+    # Workers starting together must not import the same array twice
+    with file_lock(legacy_path):
+        if not os.path.exists(legacy_path):
+            return 0
+        with open(legacy_path, "r", encoding="utf-8") as f:
+            try:
+                data = json.load(f)
+            except json.JSONDecodeError:
+                print(f"[{datetime.now()}] {legacy_path} is not valid JSON; leaving it in place", file=sys.stderr)
+                return 0
+        if not isinstance(data, list):
+            print(f"[{datetime.now()}] {legacy_path} is not a reward array; leaving it in place", file=sys.stderr)
+            return 0
+        log.extend(data)
+        os.replace(legacy_path, legacy_path + ".migrated")
+    print(f"[{datetime.now()}] Migrated {len(data)} reward entries from {legacy_path} to {log.path}", file=sys.stderr)
+    return len(data)
+
+if __name__ == "__main__":
+    # python reward_log.py migrate [legacy_file] | compact [keep_last] | count
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command == "migrate":
+        migrate_legacy(*sys.argv[2:3])
+    elif command == "compact":
+        kept = RewardLog().compact(int(sys.argv[2]) if len(sys.argv) > 2 else None)
+        print(f"{kept} entries kept")
+    elif command == "count":
+        print(sum(1 for _ in RewardLog()))
+    else:
+        print("Usage: python reward_log.py migrate [legacy_file] | compact [keep_last] | count", file=sys.stderr)
+        sys.exit(1)
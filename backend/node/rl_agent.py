@@ -1,72 +1,276 @@
+import atexit
 import json
+import math
 import os
-from collections import defaultdict
+import random
+import re
+import threading
+import time
+import numpy as np
+from reward_log import file_lock, write_json_atomic
 
-POLICY_FILE = "reward_memory.json" # This file already exists and is used for reward scores.
+# Policy state lives in its own file; reward_memory.json is the old per-query reward log
+POLICY_FILE = os.getenv("RL_POLICY_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "rl_policy.json"))
+# Where earlier versions kept the policy: a cwd-relative file sharing the reward log's name
+LEGACY_POLICY_FILE = "reward_memory.json"
 
-class RLAgent:
-    def __init__(self):
-        self.policy = self._load_policy()
+RL_STRATEGY = os.getenv("RL_STRATEGY", "ucb1")  # ucb1 | thompson | epsilon
+RL_EPSILON = float(os.getenv("RL_EPSILON", "0.1"))
+# rag_reward is a weighted mix of 1-10 judge scores, so rewards live roughly on [0, 10]
+RL_REWARD_SCALE = float(os.getenv("RL_REWARD_SCALE", "10"))
+# Reward points given up per unit of retrieval cost (0 = ignore cost)
+RL_COST_WEIGHT = float(os.getenv("RL_COST_WEIGHT", "1.0"))
+# Below this many pulls in a context the agent falls back to the global statistics
+RL_MIN_CONTEXT_PULLS = int(os.getenv("RL_MIN_CONTEXT_PULLS", "3"))
+RL_FLUSH_EVERY = int(os.getenv("RL_FLUSH_EVERY", "20"))
+RL_FLUSH_INTERVAL_SECONDS = float(os.getenv("RL_FLUSH_INTERVAL_SECONDS", "30"))
+
+GLOBAL_CONTEXT = "*"
+FRESHNESS_KEYWORDS = {
+    "latest", "today", "current", "currently", "now", "news", "recent", "recently",
+    "yesterday", "tomorrow", "tonight", "this week", "this year", "live", "price", "score", "update"
+}
+LSH_BITS = 3  # 8 coarse embedding clusters
+
+def _retrieval_actions():
+    """
+    The default action space: how much to retrieve for a query.
+
+    top_k is the number of chunks given to the LLM, num_results the number of
+    search hits to scrape, max_chunks the chunks ingested per page. Without
+    scraping only top_k matters, so those arms skip the other two knobs.
+    """
+    actions = []
+    for top_k in (3, 5, 7):
+        for num_results in (3, 5):
+            for max_chunks in (10, 40):
+                actions.append({"top_k": top_k, "num_results": num_results, "max_chunks": max_chunks, "scrape": True})
+        actions.append({"top_k": top_k, "num_results": 0, "max_chunks": 0, "scrape": False})
+    return actions
+
+RETRIEVAL_ACTIONS = _retrieval_actions()
+_MAX_TOP_K = max(a["top_k"] for a in RETRIEVAL_ACTIONS)
+_MAX_FETCH = max(a["num_results"] * a["max_chunks"] for a in RETRIEVAL_ACTIONS)
+
+def action_key(action):
+    """Stable string key for an action; plain top_k ints keep their old keys."""
+    if isinstance(action, dict):
+        return f"k={action['top_k']};n={action['num_results']};c={action['max_chunks']};s={int(action['scrape'])}"
+    return str(action)
+
+def action_cost(action):
+    """Relative cost in [0, 1]; scraping dominates, more pages and chunks cost more."""
+    if not isinstance(action, dict):
+        return 0.0
+    cost = 0.1 * action["top_k"] / _MAX_TOP_K
+    if action["scrape"]:
+        cost += 0.4 + 0.5 * action["num_results"] * action["max_chunks"] / _MAX_FETCH
+    return min(cost, 1.0)
+
+_hyperplanes = {}
+
+def _embedding_cluster(embedding):
+    """Random-hyperplane LSH bucket of the query embedding (same planes in every process)."""
+    embedding = np.asarray(embedding, dtype=np.float32)
+    dim = embedding.shape[0]
+    if dim not in _hyperplanes:
+        _hyperplanes[dim] = np.random.default_rng(42).standard_normal((LSH_BITS, dim)).astype(np.float32)
+    bits = (_hyperplanes[dim] @ embedding) > 0
+    return int(sum(1 << i for i, bit in enumerate(bits) if bit))
 
-    def _load_policy(self):
-        if os.path.exists(POLICY_FILE):
-            with open(POLICY_FILE, 'r') as f:
+def query_features(query, embedding=None):
+    """Cheap context features for the bandit: length bucket, freshness keywords and embedding cluster."""
+    words = query.split()
+    lowered = query.lower()
+    fresh = any(keyword in lowered for keyword in FRESHNESS_KEYWORDS if " " in keyword) or \
+        any(word in FRESHNESS_KEYWORDS for word in re.findall(r"[a-z]+", lowered)) or \
+        re.search(r"\b20\d\d\b", query) is not None
+    return {
+        "length": "short" if len(words) <= 6 else "medium" if len(words) <= 15 else "long",
+        "fresh": fresh,
+        "cluster": _embedding_cluster(embedding) if embedding is not None else None
+    }
+
+def context_key(features):
+    if not features:
+        return GLOBAL_CONTEXT
+    return f"len={features['length']}|fresh={int(features['fresh'])}|cluster={features.get('cluster')}"
+
+class PolicyState:
+    """
+    In-memory arm statistics shared by every RLAgent in the process.
+
+    Each arm is [pulls, reward_sum, reward_sq_sum] per context key, so an
+    update is O(1). Updates are also collected as deltas and merged into
+    POLICY_FILE under a file lock every RL_FLUSH_EVERY rewards, every
+    RL_FLUSH_INTERVAL_SECONDS and at exit, with an atomic replace. Merging
+    deltas rather than overwriting keeps concurrent processes' updates.
+    """
+
+    def __init__(self, path=POLICY_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self.contexts = self._read()
+        self._pending = {}
+        self._pending_count = 0
+        self._last_flush = time.time()
+        self._timer = None
+
+    def _read(self):
+        for path in (self.path, LEGACY_POLICY_FILE):
+            if not os.path.exists(path):
+                continue
+            with open(path, "r") as f:
                 try:
-                    return json.load(f)
+                    policy = json.load(f)
                 except json.JSONDecodeError:
-                    return {"top_k_rewards": defaultdict(lambda: {"sum": 0, "count": 0})}
-        return {"top_k_rewards": defaultdict(lambda: {"sum": 0, "count": 0})}
-
-    def _save_policy(self):
-        # Convert defaultdict to dict for JSON serialization
-        serializable_policy = {
-            "top_k_rewards": {k: dict(v) for k, v in self.policy["top_k_rewards"].items()}
-        }
-        with open(POLICY_FILE, 'w') as f:
-            json.dump(serializable_policy, f, indent=2)
-
-    def choose_action(self, available_actions):
-        """
-        Chooses an action (top_k) based on the current policy.
-        For simplicity, chooses the top_k with the highest average reward.
-        If no history, chooses randomly.
-        """
-        best_top_k = None
-        max_avg_reward = -1
-
-        # Ensure available_actions are strings for consistent key comparison
-        available_actions_str = [str(k) for k in available_actions]
-
-        for top_k_str in available_actions_str:
-            if top_k_str in self.policy["top_k_rewards"] and self.policy["top_k_rewards"][top_k_str]["count"] > 0:
-                avg_reward = self.policy["top_k_rewards"][top_k_str]["sum"] / self.policy["top_k_rewards"][top_k_str]["count"]
-                if avg_reward > max_avg_reward:
-                    max_avg_reward = avg_reward
-                    best_top_k = int(top_k_str)
-        
-        if best_top_k is None:
-            # If no history or all average rewards are 0, choose randomly
-            import random
-            best_top_k = random.choice(available_actions)
-        
-        return best_top_k
-
-    def learn(self, action, reward):
+                    continue
+            if isinstance(policy, dict) and "contexts" in policy:
+                return policy["contexts"]
+            # The old {"top_k_rewards": {"5": {"sum", "count"}}} format becomes the global context
+            if isinstance(policy, dict) and "top_k_rewards" in policy:
+                arms = {}
+                for key, stats in policy["top_k_rewards"].items():
+                    count, total = stats.get("count", 0), stats.get("sum", 0.0)
+                    arms[key] = [count, total, total * total / count if count else 0.0]
+                return {GLOBAL_CONTEXT: arms}
+        return {}
+
+    def arm(self, context, key):
+        return self.contexts.get(context, {}).get(key)
+
+    def record(self, context, key, reward):
+        with self._lock:
+            for ctx in {context, GLOBAL_CONTEXT}:
+                for table in (self.contexts, self._pending):
+                    stats = table.setdefault(ctx, {}).setdefault(key, [0, 0.0, 0.0])
+                    stats[0] += 1
+                    stats[1] += reward
+                    stats[2] += reward * reward
+            self._pending_count += 1
+            due = self._pending_count >= RL_FLUSH_EVERY or time.time() - self._last_flush >= RL_FLUSH_INTERVAL_SECONDS
+        if due:
+            self.flush()
+        else:
+            self._schedule_flush()
+
+    def _schedule_flush(self):
+        with self._lock:
+            if self._timer is not None:
+                return
+            self._timer = threading.Timer(RL_FLUSH_INTERVAL_SECONDS, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            pending, self._pending = self._pending, {}
+            self._pending_count = 0
+            self._last_flush = time.time()
+        if not pending:
+            return
+        with file_lock(self.path):
+            merged = self._read()
+            for ctx, arms in pending.items():
+                for key, delta in arms.items():
+                    stats = merged.setdefault(ctx, {}).setdefault(key, [0, 0.0, 0.0])
+                    for i in range(3):
+                        stats[i] += delta[i]
+            write_json_atomic(self.path, {"version": 2, "contexts": merged})
+        with self._lock:
+            # Pick up other processes' updates, keeping anything recorded during the write
+            for ctx, arms in self._pending.items():
+                for key, delta in arms.items():
+                    stats = merged.setdefault(ctx, {}).setdefault(key, [0, 0.0, 0.0])
+                    for i in range(3):
+                        stats[i] += delta[i]
+            self.contexts = merged
+
+_state = None
+_state_lock = threading.Lock()
+
+def get_policy_state():
+    global _state
+    with _state_lock:
+        if _state is None:
+            _state = PolicyState()
+            atexit.register(_state.flush)
+        return _state
+
+class RLAgent:
+    """
+    Contextual multi-armed bandit over retrieval configurations.
+
+    Actions are either plain top_k ints (the original interface) or dicts from
+    RETRIEVAL_ACTIONS. Arms are scored on reward minus RL_COST_WEIGHT times
+    their relative cost, so among configurations with similar reward the
+    cheapest wins. Strategies: "ucb1", "thompson" and "epsilon" (greedy).
+    """
+
+    def __init__(self, strategy=RL_STRATEGY, state=None):
+        self.strategy = strategy
+        self.state = state or get_policy_state()
+
+    def _stats(self, context, key):
+        """Context statistics once they are trustworthy, otherwise the global ones."""
+        stats = self.state.arm(context, key)
+        if stats and stats[0] >= RL_MIN_CONTEXT_PULLS:
+            return stats
+        return self.state.arm(GLOBAL_CONTEXT, key)
+
+    def _score(self, stats, cost, total_pulls):
+        pulls, total, sq_total = stats
+        mean = total / pulls
+        if self.strategy == "thompson":
+            variance = max(sq_total / pulls - mean * mean, (0.1 * RL_REWARD_SCALE) ** 2)
+            mean = random.gauss(mean, math.sqrt(variance / pulls))
+        elif self.strategy == "ucb1":
+            mean += RL_REWARD_SCALE * math.sqrt(2 * math.log(max(total_pulls, 1)) / pulls)
+        return mean - RL_COST_WEIGHT * cost
+
+    def choose_action(self, available_actions, features=None):
         """
-        Updates the policy based on the action taken and the reward received.
+        Pick an action for a query with the given context features.
+
+        Arms that were never tried are explored first (Thompson draws them
+        from a wide prior instead); epsilon-greedy also explores at random
+        with probability RL_EPSILON.
         """
-        action_str = str(action) # Ensure action is string for consistent key
-        if action_str not in self.policy["top_k_rewards"]:
-            self.policy["top_k_rewards"][action_str] = {"sum": 0, "count": 0}
-        
-        self.policy["top_k_rewards"][action_str]["sum"] += reward
-        self.policy["top_k_rewards"][action_str]["count"] += 1
-        self._save_policy()
+        context = context_key(features)
+        arms = [(action, self._stats(context, action_key(action))) for action in available_actions]
+
+        if self.strategy == "epsilon" and random.random() < RL_EPSILON:
+            return random.choice(available_actions)
+        untried = [action for action, stats in arms if not stats or stats[0] == 0]
+        if untried and self.strategy != "thompson":
+            return random.choice(untried)
+
+        total_pulls = sum(stats[0] for _, stats in arms if stats)
+        best_action, best_score = None, -math.inf
+        for action, stats in arms:
+            if not stats or stats[0] == 0:
+                # Thompson prior: centred mid-scale and wide enough to get tried
+                score = random.gauss(RL_REWARD_SCALE / 2, RL_REWARD_SCALE) - RL_COST_WEIGHT * action_cost(action)
+            else:
+                score = self._score(stats, action_cost(action), total_pulls)
+            if score > best_score:
+                best_action, best_score = action, score
+        return best_action
+
+    def learn(self, action, reward, features=None):
+        """Record the reward for an action; persisted in batches by PolicyState."""
+        self.state.record(context_key(features), action_key(action), reward)
+
+    def flush(self):
+        self.state.flush()
 
 if __name__ == "__main__":
     # Example usage:
     agent = RLAgent()
-    
+
     # Simulate choosing an action
     available_top_ks = [3, 5, 7]
     chosen_top_k = agent.choose_action(available_top_ks)
@@ -77,6 +281,7 @@ if __name__ == "__main__":
     agent.learn(chosen_top_k, sample_reward)
     print(f"Learned from action {chosen_top_k} with reward {sample_reward}")
 
-    # Choose another action after learning
-    chosen_top_k_again = agent.choose_action(available_top_ks)
-    print(f"Chosen top_k after learning: {chosen_top_k_again}")
+    # Choose a full retrieval configuration for a time-sensitive query
+    features = query_features("latest news on reinforcement learning")
+    chosen_config = agent.choose_action(RETRIEVAL_ACTIONS, features)
+    print(f"Chosen configuration for {context_key(features)}: {chosen_config}")
@@ -1,18 +1,117 @@
 import requests
+from requests.adapters import HTTPAdapter
 import dotenv
 import json
-import sys
+import os
+import re
+import time
+from disk_cache import DiskCache
+from tracing import span, count
 
 dotenv.load_dotenv()
 SERPER_API_KEY = dotenv.get_key(dotenv.find_dotenv(), 'SERPER_API_KEY')
+SERPER_URL = os.getenv("SERPER_URL", "https://google.serper.dev/search")
+
+# Results are cached per normalized query so near-identical questions share one paid API call
+SEARCH_CACHE_TTL_SECONDS = float(os.getenv("SEARCH_CACHE_TTL_SECONDS", "21600"))
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "5000"))  # 0 disables the cache
+
+# Interrogatives (how, why, when, where, who) are kept: "how does X work" and
+# "why does X work" are different questions
+STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "be", "what", "which", "of", "in", "on",
+    "at", "for", "by", "with", "about", "and", "or", "do", "does", "did", "me", "tell",
+    "please", "i", "you",
+    # Search results are already recent within the cache TTL, so these add nothing to the key
+    "latest", "current"
+}
+# Words that give the query a direction; the terms on either side of them keep their order
+DIRECTION_WORDS = {"to", "from", "into", "vs", "versus", "than"}
+# Words ending in "s" that are not plurals of the word without it
+NOT_PLURALS = {
+    "news", "series", "species", "always", "perhaps", "lens", "gas", "yes", "has", "was",
+    "this", "its", "plus", "canvas", "atlas", "chaos", "windows", "aws", "ios", "macos",
+    "kubernetes", "postgres", "pandas", "sales", "means", "thanks"
+}
+NOT_PLURAL_SUFFIXES = ("ss", "us", "is", "ics", "ous")
+# Plurals in "-ies" whose singular ends in "ie" rather than "y"
+IE_PLURALS = {"movies", "cookies", "calories", "zombies", "selfies", "rookies", "hoodies", "ties", "lies", "pies"}
+
+search_stats = {"hits": 0, "misses": 0}
+
+_session = None
+_search_cache = None
+
+def get_session():
+    """Pooled session reused for every Serper call."""
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        _session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        _session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+    return _session
+
+def _get_search_cache():
+    global _search_cache
+    if _search_cache is None and SEARCH_CACHE_SIZE > 0:
+        _search_cache = DiskCache("search", SEARCH_CACHE_SIZE)
+    return _search_cache
+
+def _fold_plural(token):
+    """Singularize a plural ("libraries" -> "library"), leaving words like "news", "bus" and "analysis" alone."""
+    if len(token) <= 3 or not token.endswith("s") or token in NOT_PLURALS or token.endswith(NOT_PLURAL_SUFFIXES):
+        return token
+    if token.endswith("ies") and token not in IE_PLURALS:
+        return token[:-3] + "y"
+    return token[:-1]
+
+def normalize_query(query):
+    """
+    Reduce a query to a cache key: lowercase, punctuation and stopwords dropped,
+    plurals folded and repeated terms dropped. Terms are sorted, so "latest
+    trends in reinforcement learning 2025" and "what is reinforcement learning
+    trend in 2025" share a key, but only between direction words: "python to
+    java" and "java to python" stay different queries.
+    """
+    groups = [[]]
+    for token in re.findall(r"[a-z0-9]+", query.lower()):
+        if token in DIRECTION_WORDS:
+            groups.append([token])
+            groups.append([])
+            continue
+        if token in STOPWORDS:
+            continue
+        token = _fold_plural(token)
+        if token not in groups[-1]:
+            groups[-1].append(token)
+    terms = [term for group in groups for term in sorted(group)]
+    if not any(term not in DIRECTION_WORDS for term in terms):
+        # Nothing but stopwords: fall back to the whitespace-normalized query
+        return " ".join(query.lower().split())
+    return " ".join(terms)
 
 def search_serper(query, num_results=5):
     """
     Perform a Google-style search via Serper.dev API
     and return a list of top search results.
     """
+    with span("search", num_results=num_results):
+        return _search(query, num_results)
+
+def _search(query, num_results):
+    cache = _get_search_cache()
+    cache_key = f"{num_results}:{normalize_query(query)}"
+    if cache is not None:
+        raw = cache.get(cache_key)
+        if raw:
+            entry = json.loads(raw)
+            if time.time() - entry["fetched_at"] < SEARCH_CACHE_TTL_SECONDS:
+                search_stats["hits"] += 1
+                count("cache_hits", cache="search")
+                return entry["results"]
+    search_stats["misses"] += 1
+    count("cache_misses", cache="search")
 
-    url = "https://google.serper.dev/search"
     headers = {
         "X-API-KEY": SERPER_API_KEY,
         "Content-Type": "application/json"
@@ -22,7 +121,7 @@ def search_serper(query, num_results=5):
         "num": num_results  # optional: limit number of results
     }
 
-    response = requests.post(url, headers=headers, json=payload)
+    response = get_session().post(SERPER_URL, headers=headers, json=payload, timeout=15)
 
     if response.status_code != 200:
         print("Error:", response.status_code, response.text)
@@ -39,4 +138,13 @@ def search_serper(query, num_results=5):
             "snippet": item.get("snippet")
         })
 
+    if cache is not None and results:
+        cache.set(cache_key, json.dumps({"results": results, "fetched_at": time.time()}).encode("utf-8"))
+
     return results
+
+def get_search_stats():
+    """Cache hit/miss counters for this process."""
+    total = search_stats["hits"] + search_stats["misses"]
+    hit_rate = search_stats["hits"] / total if total else 0.0
+    return {**search_stats, "hit_rate": round(hit_rate, 3)}
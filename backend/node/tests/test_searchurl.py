@@ -0,0 +1,42 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from searchurl import normalize_query
+
+class NormalizeQueryTest(unittest.TestCase):
+    def assertSameKey(self, first, second):
+        self.assertEqual(normalize_query(first), normalize_query(second))
+
+    def assertDifferentKey(self, first, second):
+        self.assertNotEqual(normalize_query(first), normalize_query(second))
+
+    def test_rephrasings_share_a_key(self):
+        self.assertSameKey("latest trends in reinforcement learning 2025",
+                           "what is reinforcement learning trend in 2025")
+        self.assertSameKey("What is the capital of France?", "capital of france")
+        self.assertSameKey("best python libraries", "best python library")
+        self.assertSameKey("new movies", "new movie")
+        self.assertSameKey("python tips python", "python tips")
+
+    def test_interrogatives_are_kept(self):
+        self.assertDifferentKey("How does Python work", "Why does Python work")
+        self.assertDifferentKey("when was the iphone released", "who released the iphone")
+
+    def test_direction_is_kept(self):
+        self.assertDifferentKey("python to java", "java to python")
+        self.assertDifferentKey("convert celsius from fahrenheit", "convert fahrenheit from celsius")
+        self.assertEqual(normalize_query("GPU prices vs CPU prices"), "gpu price vs cpu price")
+
+    def test_words_ending_in_s_that_are_not_plurals(self):
+        self.assertDifferentKey("tech news", "tech new")
+        for word in ("news", "analysis", "bus", "series", "species", "physics", "status"):
+            self.assertEqual(normalize_query(word), word)
+
+    def test_only_stopwords_falls_back_to_the_query(self):
+        self.assertEqual(normalize_query("What  is The"), "what is the")
+
+if __name__ == "__main__":
+    unittest.main()
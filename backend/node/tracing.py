@@ -0,0 +1,137 @@
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from reward_log import RewardLog
+
+# Spans and counters of every finished request are appended here as JSON lines ("" disables it)
+TRACE_LOG_PATH = os.getenv("TRACE_LOG_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "traces.jsonl"))
+
+class Trace:
+    """Spans and counters collected for one request."""
+
+    def __init__(self, request_id):
+        self.request_id = request_id
+        self.started = time.time()
+        self.spans = []
+        self.counters = {}
+        self.finished = False
+
+    def add_counter(self, name, value, labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def to_dict(self):
+        return {
+            "request_id": self.request_id,
+            "started": self.started,
+            "duration": round(time.time() - self.started, 4),
+            "spans": self.spans,
+            "counters": [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in self.counters.items()
+            ]
+        }
+
+# Worker processes serve one request at a time, so a single current trace is
+# enough; the lock covers spans recorded from executor threads.
+_lock = threading.Lock()
+_current = None
+# Trace an executor thread was bound to by bind(), see _target()
+_bound = threading.local()
+# Counters recorded between requests (e.g. a background model load) go to the next trace
+_pending = Trace(None)
+_log = RewardLog(TRACE_LOG_PATH) if TRACE_LOG_PATH else None
+
+def start_trace(request_id=None):
+    """Begin collecting for a request; the id normally comes from the Node route."""
+    global _current, _pending
+    with _lock:
+        trace = Trace(request_id or uuid.uuid4().hex)
+        trace.counters, _pending = _pending.counters, Trace(None)
+        _current = trace
+    return trace
+
+def finish_trace():
+    """Stop collecting, append the trace to TRACE_LOG_PATH and return it as a dict."""
+    global _current
+    with _lock:
+        trace, _current = _current, None
+        if trace is not None:
+            trace.finished = True
+    if trace is None:
+        return None
+    data = trace.to_dict()
+    if _log is not None:
+        try:
+            _log.append(data)
+        except OSError as e:
+            print(f"[{datetime.now()}] Could not write trace: {e}", file=sys.stderr)
+    return data
+
+def bind(fn):
+    """
+    Wrap fn for an executor thread so what it records goes to the trace current
+    at submit time. A thread that outlives its request (e.g. a scrape past the
+    scrape_many deadline) has its spans and counters dropped instead of landing
+    in the next request's trace.
+    """
+    trace = _current
+
+    def run(*args, **kwargs):
+        _bound.trace, _bound.active = trace, True
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _bound.trace, _bound.active = None, False
+    return run
+
+def _target(fallback=None):
+    """Trace to record into from this thread, or None to drop it. Caller holds _lock."""
+    if getattr(_bound, "active", False):
+        trace = _bound.trace
+        return trace if trace is not None and not trace.finished else None
+    return _current or fallback
+
+@contextmanager
+def span(name, **attributes):
+    """Time a pipeline stage; attributes are stored with the span."""
+    start = time.time()
+    error = None
+    try:
+        yield attributes
+    except Exception as e:
+        error = str(e)
+        raise
+    finally:
+        record = {
+            "name": name,
+            "start": round(start, 4),
+            "duration": round(time.time() - start, 4),
+            "attributes": attributes
+        }
+        if error:
+            record["error"] = error
+        with _lock:
+            trace = _target()
+            if trace is not None:
+                trace.spans.append(record)
+
+def count(name, value=1, **labels):
+    """Add to a counter, e.g. count("cache_hits", 3, cache="embedding")."""
+    if not value:
+        return
+    with _lock:
+        trace = _target(_pending)
+        if trace is not None:
+            trace.add_counter(name, value, labels)
+
+def count_tokens(response, kind):
+    """Record token usage from a Groq completion (no-op if usage is missing)."""
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        count("tokens", getattr(usage, "prompt_tokens", 0) or 0, kind=kind, direction="prompt")
+        count("tokens", getattr(usage, "completion_tokens", 0) or 0, kind=kind, direction="completion")
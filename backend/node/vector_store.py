@@ -0,0 +1,308 @@
+"""
+Vector store backends behind the `index` object used by the RAG scripts.
+
+Both backends expose the subset of the Pinecone Index API the scripts rely on:
+upsert(vectors=[...]), query(vector=..., top_k=..., include_metadata=...),
+fetch(ids=[...]).vectors, delete(ids=[...]) and describe_index_stats().
+
+Set VECTOR_BACKEND=local to use LocalVectorStore, which keeps everything on
+disk next to the scripts and needs no network access. Either backend is
+wrapped in a HybridIndex that adds BM25 retrieval over the same chunks.
+"""
+import json
+import os
+import sqlite3
+import sys
+import threading
+from types import SimpleNamespace
+import dotenv
+import numpy as np
+
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone")
+INDEX_NAME = "rag-knowledge-384"
+DIMENSION = 384  # Hugging Face MiniLM outputs 384-dim embeddings
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".index"))
+
+# Approximate search is only worth it for larger corpora, and only if hnswlib is installed
+LOCAL_ANN_THRESHOLD = int(os.getenv("LOCAL_ANN_THRESHOLD", "50000"))
+LOCAL_ANN_REBUILD_VERSIONS = 100
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+def open_index(recreate=False):
+    """Return the configured vector store, creating it if needed (or wiping it with recreate=True)."""
+    from hybrid_index import HybridIndex
+    from lexical_index import LexicalIndex, LEXICAL_INDEX_DIR
+
+    lexical = LexicalIndex(LEXICAL_INDEX_DIR) if LEXICAL_INDEX_DIR else None
+    if recreate and lexical is not None:
+        lexical.clear()
+    return HybridIndex(_open_vector_index(recreate), lexical)
+
+def _open_vector_index(recreate):
+    if VECTOR_BACKEND == "local":
+        store = LocalVectorStore(LOCAL_INDEX_DIR, DIMENSION)
+        if recreate:
+            store.clear()
+            print(f"Cleared local vector index: {LOCAL_INDEX_DIR}", file=sys.stderr)
+        return store
+
+    from pinecone import Pinecone, ServerlessSpec
+
+    dotenv.load_dotenv()
+    PINECONE_API_KEY = dotenv.get_key(dotenv.find_dotenv(), "PINECONE_API_KEY")
+    pc = Pinecone(api_key=PINECONE_API_KEY)
+
+    existing = [i.name for i in pc.list_indexes()]
+    if recreate and INDEX_NAME in existing:
+        pc.delete_index(INDEX_NAME)
+        existing.remove(INDEX_NAME)
+        print(f"Deleted existing Pinecone index: {INDEX_NAME}", file=sys.stderr)
+
+    # Ensure Pinecone index exists (or create it if not)
+    if INDEX_NAME not in existing:
+        pc.create_index(
+            name=INDEX_NAME,
+            dimension=DIMENSION,
+            metric="cosine",
+            spec=ServerlessSpec(cloud="aws", region="us-east-1")
+        )
+        print(f"Created Pinecone index: {INDEX_NAME}", file=sys.stderr)
+
+    return pc.Index(INDEX_NAME)
+
+class IndexStats(dict):
+    def to_dict(self):
+        return dict(self)
+
+class LocalVectorStore:
+    """
+    In-process cosine-similarity index.
+
+    Vectors are L2-normalized and kept in a memory-mapped float32 matrix, one
+    row per ID; IDs, row numbers and metadata live in SQLite. Queries are a
+    single matrix-vector product plus a top-k partition. With hnswlib
+    installed and more than LOCAL_ANN_THRESHOLD vectors, an HNSW graph proposes
+    candidates that are then re-scored exactly against the matrix.
+
+    Several worker processes may share one directory: writes are serialized by
+    SQLite and every reader reloads its row map when the store version changes.
+    """
+
+    def __init__(self, path, dimension):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.dimension = dimension
+        self._matrix_path = os.path.join(path, "vectors.f32")
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(os.path.join(path, "index.sqlite3"), timeout=30,
+                                   check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS vectors (id TEXT PRIMARY KEY, row INTEGER NOT NULL UNIQUE, metadata TEXT NOT NULL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._version = None
+        self._matrix = None
+        self._ids = []
+        self._row_of = {}
+        self._ann = None
+        with self._lock:
+            self._refresh()
+
+    # ---- internal state ----
+
+    def _read_version(self):
+        row = self._db.execute("SELECT value FROM state WHERE key = 'version'").fetchone()
+        return row[0] if row else 0
+
+    def _bump_version(self):
+        self._db.execute(
+            "INSERT INTO state (key, value) VALUES ('version', 1) "
+            "ON CONFLICT(key) DO UPDATE SET value = value + 1"
+        )
+        return self._read_version()
+
+    def _refresh(self):
+        """Reload the row map if another process (or a rollback) changed the store."""
+        version = self._read_version()
+        if version == self._version:
+            return
+        rows = self._db.execute("SELECT id, row FROM vectors ORDER BY row").fetchall()
+        self._ids = [vector_id for vector_id, _ in rows]
+        self._row_of = {vector_id: row for vector_id, row in rows}
+        self._ensure_capacity(len(self._ids))
+        self._version = version
+
+    def _ensure_capacity(self, rows):
+        row_bytes = self.dimension * 4
+        size = os.path.getsize(self._matrix_path) if os.path.exists(self._matrix_path) else 0
+        capacity = size // row_bytes
+        if capacity < max(rows, 1):
+            capacity = max(rows, 2 * capacity, 1024)
+            with open(self._matrix_path, "ab") as f:
+                f.truncate(capacity * row_bytes)
+            self._matrix = None
+        if self._matrix is None or self._matrix.shape[0] != capacity:
+            self._matrix = np.memmap(self._matrix_path, dtype=np.float32, mode="r+", shape=(capacity, self.dimension))
+
+    @staticmethod
+    def _normalize(values):
+        vector = np.asarray(values, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _metadata_for(self, ids):
+        found = {}
+        for start in range(0, len(ids), 500):
+            part = ids[start:start + 500]
+            placeholders = ",".join("?" * len(part))
+            found.update(
+                (vector_id, json.loads(meta)) for vector_id, meta in
+                self._db.execute(f"SELECT id, metadata FROM vectors WHERE id IN ({placeholders})", part)
+            )
+        return found
+
+    def _write(self, apply):
+        """Run apply() inside a write transaction with an up-to-date row map."""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._refresh()
+                result = apply()
+                self._matrix.flush()
+                self._version = self._bump_version()
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                self._version = None
+                raise
+            return result
+
+    # ---- Pinecone-compatible API ----
+
+    def upsert(self, vectors, **kwargs):
+        def apply():
+            rows, values, records = [], [], []
+            for vector in vectors:
+                vector_id = vector["id"]
+                row = self._row_of.get(vector_id)
+                if row is None:
+                    row = len(self._ids)
+                    self._ids.append(vector_id)
+                    self._row_of[vector_id] = row
+                rows.append(row)
+                values.append(self._normalize(vector["values"]))
+                records.append((vector_id, row, json.dumps(vector.get("metadata") or {})))
+            self._ensure_capacity(len(self._ids))
+            if rows:
+                self._matrix[rows] = np.stack(values)
+            self._db.executemany("INSERT OR REPLACE INTO vectors (id, row, metadata) VALUES (?, ?, ?)", records)
+            return {"upserted_count": len(records)}
+        return self._write(apply)
+
+    def delete(self, ids=None, delete_all=False, **kwargs):
+        """Delete by ID, moving the last row into each freed slot so the matrix stays dense."""
+        if delete_all:
+            return self.clear()
+
+        def apply():
+            for vector_id in ids or []:
+                row = self._row_of.pop(vector_id, None)
+                if row is None:
+                    continue
+                self._db.execute("DELETE FROM vectors WHERE id = ?", (vector_id,))
+                last = len(self._ids) - 1
+                moved_id = self._ids.pop()
+                if row != last:
+                    self._matrix[row] = self._matrix[last]
+                    self._ids[row] = moved_id
+                    self._row_of[moved_id] = row
+                    self._db.execute("UPDATE vectors SET row = ? WHERE id = ?", (row, moved_id))
+            return {}
+        return self._write(apply)
+
+    def clear(self):
+        def apply():
+            self._db.execute("DELETE FROM vectors")
+            self._ids = []
+            self._row_of = {}
+            self._ann = None
+            return {}
+        return self._write(apply)
+
+    def fetch(self, ids, **kwargs):
+        with self._lock:
+            self._refresh()
+            present = [vector_id for vector_id in ids if vector_id in self._row_of]
+            metadata = self._metadata_for(present)
+            return SimpleNamespace(vectors={
+                vector_id: SimpleNamespace(
+                    id=vector_id,
+                    values=self._matrix[self._row_of[vector_id]].tolist(),
+                    metadata=metadata.get(vector_id, {})
+                )
+                for vector_id in present
+            })
+
+    def query(self, vector, top_k=10, include_metadata=False, include_values=False, **kwargs):
+        with self._lock:
+            self._refresh()
+            count = len(self._ids)
+            if count == 0 or top_k <= 0:
+                return {"matches": []}
+
+            query_vector = self._normalize(vector)
+            candidates = self._ann_candidates(query_vector, top_k, count)
+            if candidates is None:
+                scores = self._matrix[:count] @ query_vector
+                candidates = np.arange(count)
+            else:
+                scores = self._matrix[candidates] @ query_vector
+
+            k = min(top_k, len(candidates))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            rows = candidates[top]
+
+            ids = [self._ids[row] for row in rows]
+            metadata = self._metadata_for(ids) if include_metadata else {}
+            matches = []
+            for vector_id, row, score in zip(ids, rows, scores[top]):
+                match = {"id": vector_id, "score": float(score), "metadata": metadata.get(vector_id, {})}
+                if include_values:
+                    match["values"] = self._matrix[row].tolist()
+                matches.append(match)
+            return {"matches": matches}
+
+    def describe_index_stats(self, **kwargs):
+        with self._lock:
+            self._refresh()
+            return IndexStats(dimension=self.dimension, total_vector_count=len(self._ids), backend="local")
+
+    # ---- optional approximate search ----
+
+    def _ann_candidates(self, query_vector, top_k, count):
+        """Candidate rows from the HNSW graph plus rows added since it was built, or None for exact search."""
+        if hnswlib is None or count < LOCAL_ANN_THRESHOLD:
+            return None
+
+        ann = self._ann
+        stale = (
+            ann is None
+            or abs(count - ann["count"]) > 0.1 * ann["count"]
+            or self._version - ann["version"] > LOCAL_ANN_REBUILD_VERSIONS
+        )
+        if stale:
+            graph = hnswlib.Index(space="ip", dim=self.dimension)
+            graph.init_index(max_elements=count, ef_construction=200, M=16)
+            graph.add_items(np.asarray(self._matrix[:count]), np.arange(count))
+            graph.set_ef(max(64, top_k * 4))
+            ann = self._ann = {"graph": graph, "count": count, "version": self._version}
+
+        labels, _ = ann["graph"].knn_query(query_vector, k=min(top_k * 4, ann["count"]))
+        # Graph labels are row numbers; rows beyond the current count were deleted since the build
+        candidates = [row for row in labels[0] if row < count]
+        candidates.extend(range(ann["count"], count))
+        return np.unique(np.asarray(candidates, dtype=np.int64))
@@ -1,32 +1,230 @@
-from bs4 import BeautifulSoup
 import requests
+from requests.adapters import HTTPAdapter
 import json
-from searchurl import search_serper
+from concurrent.futures import ThreadPoolExecutor, wait
+from disk_cache import DiskCache
+from html_extract import extract_text
+from tracing import span, count, bind
 import os
 import sys
+import time
 
-def scrape_webpage(url):
-    """Scrape clean text content from a webpage."""
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/109.0.0.0 Safari/537.36'
-    }
-    try:
-        response = requests.get(url, timeout=15, headers=headers)
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/109.0.0.0 Safari/537.36'
+}
+
+# Concurrency and per-query deadline for scrape_many
+SCRAPE_WORKERS = int(os.getenv("SCRAPE_WORKERS", "8"))
+SCRAPE_DEADLINE_SECONDS = float(os.getenv("SCRAPE_DEADLINE_SECONDS", "20"))
+
+# Cleaned page text is cached with its validators; within the TTL no request is made,
+# after it the page is revalidated with If-None-Match / If-Modified-Since.
+PAGE_CACHE_TTL_SECONDS = float(os.getenv("PAGE_CACHE_TTL_SECONDS", "3600"))
+PAGE_CACHE_SIZE = int(os.getenv("PAGE_CACHE_SIZE", "2000"))  # 0 disables the cache
+
+# Downloads stop after this many bytes; the extractor copes with the truncated HTML.
+# Responses that declare a larger Content-Length are not downloaded at all.
+SCRAPE_MAX_BYTES = int(os.getenv("SCRAPE_MAX_BYTES", str(2 * 1024 * 1024)))
+# Wall-clock budget for one page: connect, headers and body together
+SCRAPE_PAGE_BUDGET_SECONDS = float(os.getenv("SCRAPE_PAGE_BUDGET_SECONDS", "15"))
+
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml", "text/plain")
+# Magic numbers of documents that are sometimes served without a Content-Type
+BINARY_SIGNATURES = (b"%PDF", b"PK\x03\x04", b"\x89PNG", b"GIF8", b"\xff\xd8\xff", b"\x1f\x8b", b"\xd0\xcf\x11\xe0")
+
+_session = None
+_executor = None
+_page_cache = None
+
+def get_session():
+    """Shared HTTP session so scrapes reuse pooled keep-alive connections."""
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=SCRAPE_WORKERS, pool_maxsize=SCRAPE_WORKERS)
+        _session.mount("http://", adapter)
+        _session.mount("https://", adapter)
+        _session.headers.update(HEADERS)
+    return _session
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=SCRAPE_WORKERS, thread_name_prefix="scrape")
+    return _executor
+
+def _get_page_cache():
+    global _page_cache
+    if _page_cache is None and PAGE_CACHE_SIZE > 0:
+        _page_cache = DiskCache("pages", PAGE_CACHE_SIZE)
+    return _page_cache
+
+def _load_cached_page(url):
+    cache = _get_page_cache()
+    if cache is None:
+        return None
+    raw = cache.get(url)
+    return json.loads(raw) if raw else None
+
+def _store_cached_page(url, entry):
+    cache = _get_page_cache()
+    if cache is not None:
+        cache.set(url, json.dumps(entry).encode("utf-8"))
+
+def _parse_content_type(value):
+    """Split a Content-Type header into (media type, charset or None)."""
+    media_type, _, params = (value or "").partition(";")
+    charset = None
+    for param in params.split(";"):
+        name, _, param_value = param.partition("=")
+        if name.strip().lower() == "charset":
+            charset = param_value.strip().strip("\"'") or None
+    return media_type.strip().lower(), charset
+
+def _looks_like_html(head):
+    if head.startswith((b"\xef\xbb\xbf", b"\xff\xfe", b"\xfe\xff")):
+        return True
+    return not head.startswith(BINARY_SIGNATURES) and b"\x00" not in head[:1024]
+
+def fetch_page(url, budget=SCRAPE_PAGE_BUDGET_SECONDS, headers=None, max_bytes=SCRAPE_MAX_BYTES):
+    """
+    Stream an HTML page within a byte cap and a wall-clock budget.
+
+    Returns a dict with the response "status" and "headers", the "body" bytes,
+    the header "charset", a "skipped" reason ("content_type", "too_large",
+    "not_html") when the body was not read, and "truncated" ("max_bytes" or
+    "budget") when the body was cut short. Content-Type and Content-Length are
+    checked before any of the body is read, and a body without a Content-Type
+    is sniffed from its first bytes. The budget is checked between reads; a
+    single stalled read can overrun it by at most the time that was left when
+    the request started.
+    """
+    deadline = time.monotonic() + budget
+    result = {"status": None, "headers": {}, "body": b"", "charset": None, "skipped": None, "truncated": None}
+    with get_session().get(url, timeout=(min(5, budget), budget), headers=headers, stream=True) as response:
+        result["status"] = response.status_code
+        result["headers"] = response.headers
         if response.status_code != 200:
-            print(f"Failed to retrieve {url} | Status code: {response.status_code}", file=sys.stderr)
-            return ""
+            return result
+
+        media_type, result["charset"] = _parse_content_type(response.headers.get("Content-Type"))
+        if media_type and media_type not in HTML_CONTENT_TYPES:
+            result["skipped"] = "content_type"
+            return result
+        length = response.headers.get("Content-Length", "")
+        if length.isdigit() and int(length) > max_bytes:
+            result["skipped"] = "too_large"
+            return result
+
+        # read1 returns whatever has arrived, so a server trickling bytes cannot
+        # hold a fixed-size read past the budget (urllib3 1.x lacks it)
+        raw = response.raw
+        read = (lambda: raw.read1(64 * 1024, decode_content=True)) if hasattr(raw, "read1") else \
+            (lambda: raw.read(16 * 1024, decode_content=True))
+        chunks = []
+        size = 0
+        while True:
+            chunk = read()
+            if not chunk:
+                break
+            if not chunks and not media_type and not _looks_like_html(chunk):
+                result["skipped"] = "not_html"
+                return result
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= max_bytes:
+                result["truncated"] = "max_bytes"
+                break
+            if time.monotonic() > deadline:
+                result["truncated"] = "budget"
+                break
+        result["body"] = b"".join(chunks)[:max_bytes]
+    return result
+
+def scrape_webpage(url, budget=SCRAPE_PAGE_BUDGET_SECONDS):
+    """Scrape clean text content from a webpage, reusing the local page cache when possible."""
+    cached = _load_cached_page(url)
+    if cached and time.time() - cached["fetched_at"] < PAGE_CACHE_TTL_SECONDS:
+        count("cache_hits", cache="page")
+        return cached["text"]
+
+    headers = {}
+    if cached:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    try:
+        page = fetch_page(url, budget=budget, headers=headers)
+        if page["status"] == 304 and cached:
+            # Unchanged since the last fetch: refresh the TTL and skip the parse entirely
+            count("cache_hits", cache="page_revalidated")
+            cached["fetched_at"] = time.time()
+            _store_cached_page(url, cached)
+            return cached["text"]
 
-        soup = BeautifulSoup(response.content, 'html.parser')
+        count("cache_misses", cache="page")
+        count("bytes_scraped", len(page["body"]))
+        if page["status"] != 200:
+            print(f"Failed to retrieve {url} | Status code: {page['status']}", file=sys.stderr)
+            return ""
+        if page["skipped"]:
+            count("pages_skipped", reason=page["skipped"])
+            print(f"Skipped {url} ({page['skipped']}: {page['headers'].get('Content-Type')})", file=sys.stderr)
+            return ""
+        if page["truncated"]:
+            count("pages_truncated", reason=page["truncated"])
 
-        # Remove unwanted elements
-        for tag in soup(['script', 'style', 'noscript', 'iframe']):
-            tag.decompose()
+        # Main content only, and no more of it than the chunker will keep
+        text = extract_text(page["body"], encoding=page["charset"])
 
-        # Extract readable text
-        text = soup.get_text(separator=' ', strip=True)
+        # A page cut short by a slow server is not cached, the next fetch may get all of it
+        if text and page["truncated"] != "budget":
+            _store_cached_page(url, {
+                "text": text,
+                "etag": page["headers"].get("ETag"),
+                "last_modified": page["headers"].get("Last-Modified"),
+                "fetched_at": time.time()
+            })
         return text
 
     except Exception as e:
         print(f"Error scraping {url}: {e}", file=sys.stderr)
         return ""
 
+def _timed_scrape(url, budget):
+    start = time.time()
+    content = scrape_webpage(url, budget=budget)
+    return content, time.time() - start
+
+def scrape_many(urls, deadline=SCRAPE_DEADLINE_SECONDS):
+    """
+    Scrape several URLs in parallel and stop waiting once the deadline passes.
+
+    Returns one dict per URL, in input order, with the scraped "content", the
+    "seconds" it took and a "status" of "ok", "empty" or "timeout". Pages that
+    finished in time are kept even when others are still outstanding.
+    """
+    with span("scrape", urls=len(urls)):
+        return _scrape_many(urls, deadline)
+
+def _scrape_many(urls, deadline):
+    start = time.time()
+    executor = _get_executor()
+    futures = [(url, executor.submit(bind(_timed_scrape), url, min(SCRAPE_PAGE_BUDGET_SECONDS, deadline))) for url in urls]
+    wait([future for _, future in futures], timeout=deadline)
+
+    results = []
+    for url, future in futures:
+        if future.done():
+            content, seconds = future.result()
+            status = "ok" if content else "empty"
+        else:
+            future.cancel()
+            content, seconds, status = "", time.time() - start, "timeout"
+        print(f"Scraped {url} in {seconds:.2f}s ({status})", file=sys.stderr)
+        results.append({"url": url, "content": content, "seconds": round(seconds, 3), "status": status})
+
+    print(f"Scraped {len(urls)} pages concurrently in {time.time() - start:.2f}s", file=sys.stderr)
+    return results
@@ -0,0 +1,57 @@
+import contextlib
+import io
+import json
+import sys
+import traceback
+from datetime import datetime
+from tracing import start_trace, finish_trace
+
+
+def serve(handler):
+    """
+    Run a long-lived worker loop over stdin/stdout.
+
+    Each request is one JSON line on stdin, e.g. {"id": "42", "query": "..."}.
+    Every message the handler emits is written back as one JSON line tagged with
+    the request id, then a {"type": "trace"} frame with the request's spans and
+    counters, then a {"type": "done"} frame. Plain progress prints are
+    redirected to stderr so stdout only ever carries protocol frames.
+    """
+    protocol_out = sys.stdout
+    requests_in = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8")
+
+    def write_frame(frame):
+        protocol_out.write(json.dumps(frame) + "\n")
+        protocol_out.flush()
+
+    print(f"[{datetime.now()}] Worker ready", file=sys.stderr)
+    write_frame({"type": "ready"})
+
+    for line in requests_in:
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError as e:
+            write_frame({"type": "error", "id": None, "error": f"Malformed request: {e}"})
+            continue
+
+        request_id = request.get("id")
+
+        def emit(message):
+            frame = dict(message)
+            frame["id"] = request_id
+            write_frame(frame)
+
+        start_trace(request.get("request_id"))
+        try:
+            with contextlib.redirect_stdout(sys.stderr):
+                handler(request, emit)
+            emit({"type": "trace", "trace": finish_trace()})
+            emit({"type": "done"})
+        except Exception as e:
+            traceback.print_exc(file=sys.stderr)
+            emit({"type": "trace", "trace": finish_trace()})
+            emit({"type": "error", "error": str(e)})
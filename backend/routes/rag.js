@@ -1,80 +1,178 @@
 const express = require('express');
 const router = express.Router();
-const { spawn } = require('child_process');
 const path = require('path');
+const crypto = require('crypto');
+const { execFile } = require('child_process');
+const PythonWorkerPool = require('../services/pythonWorkerPool');
+const metrics = require('../services/metrics');
+
+// Warm Python workers keep the embedder, Pinecone and Groq clients loaded between requests.
+// The pool size is the ceiling on concurrent pipelines; RAG_MAX_QUEUE bounds how many may wait.
+const POOL_SIZE = parseInt(process.env.RAG_WORKER_POOL_SIZE, 10) || 2;
+const MAX_QUEUE = parseInt(process.env.RAG_MAX_QUEUE, 10) || 16;
+const QUERY_DEADLINE_MS = parseInt(process.env.RAG_QUERY_DEADLINE_MS, 10) || 60000;
+const COMPARE_DEADLINE_MS = parseInt(process.env.RAG_COMPARE_DEADLINE_MS, 10) || 120000;
+const queryPool = new PythonWorkerPool(path.join(__dirname, '..', 'node', 'rag_query.py'), { size: POOL_SIZE, maxQueue: MAX_QUEUE, name: 'rag_query' });
+const comparePool = new PythonWorkerPool(path.join(__dirname, '..', 'node', 'rag_query_compare.py'), { size: POOL_SIZE, maxQueue: MAX_QUEUE, name: 'rag_query_compare' });
+
+for (const [field, help] of [['busy', 'Workers running a request'], ['queued', 'Requests waiting for a worker'], ['workers', 'Live worker processes']]) {
+    metrics.registerGauge(`pool_${field}`, help, () => [queryPool, comparePool].map((pool) => ({ labels: { pool: pool.name }, value: pool.stats()[field] })));
+}
+
+// Every request gets an id (the caller's X-Request-Id if set) that is passed to Python
+// and tagged on its trace, and its duration is recorded per route and status.
+router.use((req, res, next) => {
+    req.requestId = req.get('X-Request-Id') || crypto.randomUUID();
+    res.set('X-Request-Id', req.requestId);
+    const start = process.hrtime.bigint();
+    res.on('finish', () => {
+        const seconds = Number(process.hrtime.bigint() - start) / 1e9;
+        const route = req.route ? req.baseUrl + req.route.path : 'unmatched';
+        metrics.observe('http_request_duration_seconds', { route, status: res.statusCode }, seconds, 'HTTP request duration');
+    });
+    next();
+});
 
-router.post('/query', (req, res) => {
-    const { query } = req.body;
+// Worker message handler that files trace frames in the metrics registry and passes the rest on.
+function withTraces(script, forward = () => {}) {
+    return (frame) => {
+        if (frame.type === 'trace') {
+            metrics.recordTrace(script, frame.trace);
+        } else {
+            forward(frame);
+        }
+    };
+}
+
+// Map admission-control failures to HTTP statuses: 429 when the queue is full,
+// 503 when a request never got a worker in time, 504 when it ran out of time.
+// Anything else is a pipeline failure (a Python exception, a crashed worker) and a 500.
+function sendPoolError(res, err, message) {
+    const statuses = { QUEUE_FULL: 429, QUEUE_TIMEOUT: 503, DEADLINE_EXCEEDED: 504 };
+    const status = statuses[err.code] || 500;
+    if (err.code in statuses) {
+        metrics.inc('pool_rejections_total', { code: err.code }, 1, 'Requests rejected by worker pool admission control or deadlines');
+    } else {
+        metrics.inc('pipeline_errors_total', {}, 1, 'Requests that failed inside the Python pipeline');
+    }
+    if (status === 429 || status === 503) {
+        res.set('Retry-After', '5');
+    }
+    res.status(status).json({ error: message, details: err.message });
+}
+// When set, /compare returns the answers immediately and queues the evaluation for node/eval_worker.py
+const DEFER_EVALUATION = process.env.RAG_DEFER_EVALUATION === '1';
+
+// Server-Sent Events writer. Headers go out with the first event, so errors raised
+// before the worker produced anything can still use a normal HTTP status.
+function eventStream(res) {
+    return (event, data) => {
+        if (res.writableEnded) {
+            return;
+        }
+        if (!res.headersSent) {
+            res.writeHead(200, {
+                'Content-Type': 'text/event-stream',
+                'Cache-Control': 'no-cache',
+                Connection: 'keep-alive',
+                'X-Accel-Buffering': 'no',
+            });
+        }
+        res.write(`event: ${event}\ndata: ${JSON.stringify(data)}\n\n`);
+    };
+}
+
+// Streaming variant of /query: answer_delta events as tokens arrive, then
+// final_answer, then reward_score as the trailing event, then done. If the
+// request fails midway the last event is error, with incomplete set when part
+// of the answer was already sent.
+async function streamQuery(req, res, query) {
+    const write = eventStream(res);
+    let closed = false;
+    let sentDeltas = false;
+    // res rather than req: req emits close as soon as the JSON body is read
+    res.on('close', () => { closed = true; });
+    const send = (event, data) => {
+        if (!closed) {
+            write(event, data);
+        }
+    };
+    try {
+        await queryPool.run(
+            { query, stream: true, request_id: req.requestId },
+            withTraces('rag_query', ({ type, ...data }) => {
+                delete data.id;
+                sentDeltas = sentDeltas || type === 'answer_delta';
+                send(type, data);
+            }),
+            { deadline: Date.now() + QUERY_DEADLINE_MS }
+        );
+        send('done', {});
+    } catch (e) {
+        console.error('Error streaming Python output:', e.message);
+        if (closed) {
+            return;
+        }
+        if (!res.headersSent) {
+            return sendPoolError(res, e, 'Failed to process query');
+        }
+        send('error', { error: 'Failed to process query', details: e.message, incomplete: sentDeltas });
+    }
+    res.end();
+}
+
+router.post('/query', async (req, res) => {
+    const { query, stream } = req.body;
     console.log('Received query:', query);
 
     if (!query) {
         return res.status(400).json({ error: 'Query is required' });
     }
 
-    const pythonProcess = spawn('python', [path.join(__dirname, '..', 'node', 'rag_query.py')]);
+    if (stream === true || (req.get('Accept') || '').includes('text/event-stream')) {
+        return streamQuery(req, res, query);
+    }
+
+    let messages;
+    try {
+        messages = await queryPool.run(
+            { query, request_id: req.requestId },
+            withTraces('rag_query'),
+            { deadline: Date.now() + QUERY_DEADLINE_MS }
+        );
+    } catch (e) {
+        console.error('Error executing Python script:', e.message);
+        return sendPoolError(res, e, 'Failed to process query');
+    }
 
-    let stdoutBuffer = '';
-    let stderr = '';
     let finalAnswer = null;
     let rewardScore = null;
-
-    pythonProcess.stdin.write(query);
-    pythonProcess.stdin.end();
-
-    pythonProcess.stdout.on('data', (data) => {
-        stdoutBuffer += data.toString();
-        let newlineIndex;
-        while ((newlineIndex = stdoutBuffer.indexOf('\n')) !== -1) {
-            const line = stdoutBuffer.substring(0, newlineIndex).trim();
-            stdoutBuffer = stdoutBuffer.substring(newlineIndex + 1);
-
-            if (line) {
-                // Only attempt to parse as JSON if it looks like JSON
-                if (line.startsWith('{') && line.endsWith('}')) {
-                    try {
-                        const jsonMessage = JSON.parse(line);
-                        if (jsonMessage.type === "final_answer") {
-                            finalAnswer = jsonMessage.answer;
-                        } else if (jsonMessage.type === "reward_score") {
-                            rewardScore = jsonMessage.score;
-                        }
-                    } catch (e) {
-                        // If JSON parsing fails, log it but don't treat as process update
-                        console.log('Python stdout (malformed JSON or non-JSON):', line);
-                    }
-                } else {
-                    // Log non-JSON lines but don't treat as process update
-                    console.log('Python stdout (non-JSON):', line);
-                }
-            }
-        }
-    });
-
-    pythonProcess.stderr.on('data', (data) => {
-        console.error('Python stderr:', data.toString());
-        stderr += data.toString();
-    });
-
-    pythonProcess.on('close', (code) => {
-        console.log(`Python script exited with code ${code}`);
-        if (code !== 0) {
-            console.error('Error executing Python script:', stderr);
-            return res.status(500).json({ error: 'Failed to process query', details: stderr });
+    let degraded = [];
+    let cached = false;
+    for (const message of messages) {
+        if (message.type === "final_answer") {
+            finalAnswer = message.answer;
+        } else if (message.type === "reward_score") {
+            rewardScore = message.score;
+        } else if (message.type === "degraded") {
+            degraded = message.stages;
+        } else if (message.type === "answer_cache") {
+            cached = message.hit;
         }
+    }
 
-        if (finalAnswer !== null && rewardScore !== null) {
-            console.log('Successfully processed query:', { finalAnswer, rewardScore });
-            res.json({ answer: finalAnswer, reward_score: rewardScore });
-        } else {
-            console.error('Failed to get final answer or reward score from Python script. Full stdout buffer:', stdoutBuffer);
-            res.status(500).json({ error: 'Failed to parse Python script output', details: stdoutBuffer });
-        }
-    });
+    if (finalAnswer !== null && rewardScore !== null) {
+        console.log('Successfully processed query:', { finalAnswer, rewardScore });
+        res.json({ answer: finalAnswer, reward_score: rewardScore, degraded, cached });
+    } else {
+        console.error('Failed to get final answer or reward score from Python worker. Messages:', messages);
+        res.status(500).json({ error: 'Failed to parse Python script output', details: messages });
+    }
 });
 
 
-router.post('/compare', (req, res) => {
-    const { query } = req.body;
+router.post('/compare', async (req, res) => {
+    const { query, deferEvaluation } = req.body;
     console.log('Received query for comparison:', query);
 
     if (!query) {
@@ -82,37 +180,57 @@ router.post('/compare', (req, res) => {
     }
 
     // The RL agent in rag_query_compare.py will now choose top_k
-    const pythonProcess = spawn('python', [path.join(__dirname, '..', 'node', 'rag_query_compare.py'), query]);
-
-    let stdoutBuffer = '';
-    let stderr = '';
+    let messages;
+    try {
+        messages = await comparePool.run(
+            { query, defer_evaluation: deferEvaluation ?? DEFER_EVALUATION, request_id: req.requestId },
+            withTraces('rag_query_compare'),
+            { deadline: Date.now() + COMPARE_DEADLINE_MS }
+        );
+    } catch (e) {
+        console.error('Error executing Python script for comparison:', e.message);
+        return sendPoolError(res, e, 'Failed to process query for comparison');
+    }
 
-    pythonProcess.stdout.on('data', (data) => {
-        stdoutBuffer += data.toString();
-    });
+    const resultMessage = messages.find((message) => message.type === 'result');
+    if (resultMessage) {
+        console.log('Successfully processed query for comparison:', resultMessage.result);
+        res.json(resultMessage.result);
+    } else {
+        console.error('Failed to get comparison result from Python worker. Messages:', messages);
+        res.status(500).json({ error: 'Failed to parse Python script output for comparison', details: messages });
+    }
+});
 
-    pythonProcess.stderr.on('data', (data) => {
-        console.error('Python stderr:', data.toString());
-        stderr += data.toString();
-    });
+// Prometheus text exposition of stage timings, Python counters, HTTP timings and pool state.
+router.get('/metrics', (req, res) => {
+    res.set('Content-Type', 'text/plain; version=0.0.4');
+    res.send(metrics.render());
+});
 
-    pythonProcess.on('close', (code) => {
-        console.log(`Python script for comparison exited with code ${code}`);
-        if (code !== 0) {
-            console.error('Error executing Python script for comparison:', stderr);
-            return res.status(500).json({ error: 'Failed to process query for comparison', details: stderr });
+// Fetch a deferred evaluation by the query_id returned from /compare.
+router.get('/evaluation/:queryId', (req, res) => {
+    const { queryId } = req.params;
+    const pythonBin = process.env.PYTHON_BIN || 'python';
+    execFile(pythonBin, [path.join(__dirname, '..', 'node', 'eval_queue.py'), 'get', queryId], (error, stdout, stderr) => {
+        if (error) {
+            console.error('Error reading evaluation queue:', stderr || error.message);
+            return res.status(500).json({ error: 'Failed to read evaluation', details: stderr || error.message });
         }
 
+        let job;
         try {
-            const result = JSON.parse(stdoutBuffer);
-            console.log('Successfully processed query for comparison:', result);
-            res.json(result);
+            job = JSON.parse(stdout);
         } catch (e) {
-            console.error('Failed to parse Python script output for comparison. Full stdout buffer:', stdoutBuffer);
-            res.status(500).json({ error: 'Failed to parse Python script output for comparison', details: stdoutBuffer });
+            return res.status(500).json({ error: 'Failed to parse evaluation output', details: stdout });
+        }
+
+        if (job.status === 'not_found') {
+            return res.status(404).json(job);
         }
+        // 202 while the evaluation is still pending or running
+        res.status(job.status === 'done' || job.status === 'failed' ? 200 : 202).json(job);
     });
 });
 
 module.exports = router;
-
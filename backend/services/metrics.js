@@ -0,0 +1,105 @@
+// Minimal Prometheus-style registry. The Python workers send a trace frame with
+// their spans and counters at the end of every request; the routes feed those
+// in here, along with HTTP timings, and GET /api/rag/metrics renders the text format.
+const PREFIX = 'mars_';
+const DURATION_BUCKETS = [0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120];
+
+function escapeLabel(value) {
+    return String(value).replace(/\\/g, '\\\\').replace(/"/g, '\\"').replace(/\n/g, '\\n');
+}
+
+function formatLabels(labels) {
+    const entries = Object.entries(labels);
+    if (entries.length === 0) {
+        return '';
+    }
+    return `{${entries.map(([key, value]) => `${key}="${escapeLabel(value)}"`).join(',')}}`;
+}
+
+class Metrics {
+    constructor() {
+        this.families = new Map();
+        this.gauges = [];
+    }
+
+    _family(name, type, help) {
+        if (!this.families.has(name)) {
+            this.families.set(name, { type, help, series: new Map() });
+        }
+        return this.families.get(name);
+    }
+
+    inc(name, labels = {}, value = 1, help = name) {
+        const family = this._family(PREFIX + name, 'counter', help);
+        const key = formatLabels(labels);
+        family.series.set(key, (family.series.get(key) || 0) + value);
+    }
+
+    observe(name, labels = {}, value, help = name) {
+        const family = this._family(PREFIX + name, 'histogram', help);
+        const key = formatLabels(labels);
+        let series = family.series.get(key);
+        if (!series) {
+            series = { labels, buckets: DURATION_BUCKETS.map(() => 0), sum: 0, count: 0 };
+            family.series.set(key, series);
+        }
+        DURATION_BUCKETS.forEach((bound, i) => {
+            if (value <= bound) {
+                series.buckets[i]++;
+            }
+        });
+        series.sum += value;
+        series.count++;
+    }
+
+    // `collect` returns [{ labels, value }] and is called on every scrape.
+    registerGauge(name, help, collect) {
+        this.gauges.push({ name: PREFIX + name, help, collect });
+    }
+
+    // Fold one Python trace ({ request_id, spans, counters }) into the registry.
+    recordTrace(script, trace) {
+        if (!trace) {
+            return;
+        }
+        for (const span of trace.spans || []) {
+            this.observe('stage_duration_seconds', { script, stage: span.name }, span.duration,
+                'Duration of pipeline stages reported by the Python workers');
+            if (span.error) {
+                this.inc('stage_errors_total', { script, stage: span.name }, 1, 'Pipeline stages that raised');
+            }
+        }
+        for (const counter of trace.counters || []) {
+            const name = counter.name.endsWith('_total') ? counter.name : `${counter.name}_total`;
+            this.inc(name, { script, ...counter.labels }, counter.value, `Python counter ${counter.name}`);
+        }
+    }
+
+    render() {
+        const lines = [];
+        for (const [name, family] of this.families) {
+            lines.push(`# HELP ${name} ${family.help}`, `# TYPE ${name} ${family.type}`);
+            for (const [key, series] of family.series) {
+                if (family.type === 'counter') {
+                    lines.push(`${name}${key} ${series}`);
+                    continue;
+                }
+                DURATION_BUCKETS.forEach((bound, i) => {
+                    lines.push(`${name}_bucket${formatLabels({ ...series.labels, le: bound })} ${series.buckets[i]}`);
+                });
+                lines.push(`${name}_bucket${formatLabels({ ...series.labels, le: '+Inf' })} ${series.count}`);
+                lines.push(`${name}_sum${key} ${series.sum}`, `${name}_count${key} ${series.count}`);
+            }
+        }
+        for (const gauge of this.gauges) {
+            lines.push(`# HELP ${gauge.name} ${gauge.help}`, `# TYPE ${gauge.name} gauge`);
+            for (const { labels, value } of gauge.collect()) {
+                lines.push(`${gauge.name}${formatLabels(labels)} ${value}`);
+            }
+        }
+        return lines.join('\n') + '\n';
+    }
+}
+
+// One registry per Node process, shared by every route.
+module.exports = new Metrics();
@@ -0,0 +1,238 @@
+const { spawn } = require('child_process');
+
+const PYTHON_BIN = process.env.PYTHON_BIN || 'python';
+const RESTART_DELAY_MS = 1000;
+const CRASH_WINDOW_MS = 5000;
+// Python degrades on its own as the deadline nears; this is the hard stop after it.
+const HARD_DEADLINE_GRACE_MS = 10000;
+
+function poolError(code, message) {
+    const err = new Error(message);
+    err.code = code;
+    return err;
+}
+
+// Keeps a small set of long-lived `python <script> --worker` processes warm and
+// hands them one job at a time over the newline-delimited JSON protocol
+// implemented in node/worker.py.
+//
+// Admission control: at most `size` jobs run at once, at most `maxQueue` wait,
+// and anything beyond that is rejected with code QUEUE_FULL. Jobs waiting for a
+// worker that is still starting (or not yet spawned) count as running, not
+// queued. A job with a deadline that is still queued when it passes fails with
+// QUEUE_TIMEOUT; one that overruns it while running fails with
+// DEADLINE_EXCEEDED and its worker is killed and replaced.
+class PythonWorkerPool {
+    constructor(scriptPath, { size = 2, maxQueue = 16, name = 'python', deadlineGraceMs = HARD_DEADLINE_GRACE_MS } = {}) {
+        this.scriptPath = scriptPath;
+        this.size = size;
+        this.maxQueue = maxQueue;
+        this.name = name;
+        this.deadlineGraceMs = deadlineGraceMs;
+        this.workers = [];
+        this.queue = [];
+        this.nextJobId = 1;
+        this.closed = false;
+    }
+
+    // Queue a job; resolves with every frame the worker emitted for it.
+    // `deadline` is an absolute epoch time in ms and is passed on to Python.
+    run(payload, onMessage = () => {}, { deadline = null } = {}) {
+        return new Promise((resolve, reject) => {
+            const freeSlots = this.size - this.workers.filter((w) => w.job || w.killed).length;
+            if (this.queue.length >= this.maxQueue + freeSlots) {
+                return reject(poolError('QUEUE_FULL', `${this.name} queue is full (${this.maxQueue} waiting)`));
+            }
+
+            const job = { id: String(this.nextJobId++), payload, onMessage, messages: [], deadline, timer: null, settled: false };
+            job.resolve = (value) => this._settle(job, () => resolve(value));
+            job.reject = (err) => this._settle(job, () => reject(err));
+            if (deadline !== null) {
+                job.payload = { ...payload, deadline: deadline / 1000 };
+                job.timer = setTimeout(() => this._expire(job), Math.max(0, deadline - Date.now()));
+            }
+
+            this.queue.push(job);
+            this._dispatch();
+        });
+    }
+
+    stats() {
+        return {
+            workers: this.workers.length,
+            busy: this.workers.filter((w) => w.job).length,
+            queued: this.queue.length,
+            size: this.size,
+            maxQueue: this.maxQueue,
+        };
+    }
+
+    close() {
+        this.closed = true;
+        for (const worker of this.workers) {
+            worker.process.kill();
+        }
+    }
+
+    _dispatch() {
+        for (const worker of this.workers) {
+            if (this.queue.length === 0) {
+                return;
+            }
+            if (worker.ready && !worker.killed && !worker.job) {
+                const job = this.queue.shift();
+                worker.job = job;
+                worker.process.stdin.write(JSON.stringify({ ...job.payload, id: job.id }) + '\n');
+            }
+        }
+
+        // Still waiting: start more workers, up to the pool size, for jobs no starting worker will take.
+        const starting = this.workers.filter((w) => !w.ready).length;
+        let needed = this.queue.length - starting;
+        while (needed > 0 && this.workers.length < this.size) {
+            this._spawn();
+            needed--;
+        }
+    }
+
+    _settle(job, finish) {
+        if (job.settled) {
+            return;
+        }
+        job.settled = true;
+        clearTimeout(job.timer);
+        finish();
+    }
+
+    _expire(job) {
+        const queuedIndex = this.queue.indexOf(job);
+        if (queuedIndex !== -1) {
+            this.queue.splice(queuedIndex, 1);
+            job.reject(poolError('QUEUE_TIMEOUT', `${this.name} request waited past its deadline`));
+            return;
+        }
+
+        // Running: give the pipeline's own degradation a grace period, then stop the worker.
+        job.timer = setTimeout(() => {
+            const worker = this.workers.find((w) => w.job === job);
+            job.reject(poolError('DEADLINE_EXCEEDED', `${this.name} request exceeded its deadline`));
+            if (worker) {
+                // Never hand it another job; _handleExit replaces it once the process is gone
+                worker.killed = true;
+                worker.job = null;
+                worker.process.kill('SIGKILL');
+            }
+        }, this.deadlineGraceMs);
+    }
+
+    _spawn() {
+        const child = spawn(PYTHON_BIN, [this.scriptPath, '--worker']);
+        const worker = { process: child, ready: false, exited: false, killed: false, job: null, buffer: '', startedAt: Date.now() };
+        this.workers.push(worker);
+        console.log(`[${this.name}] Started worker pid=${child.pid} (${this.workers.length}/${this.size})`);
+
+        child.stdout.on('data', (data) => {
+            worker.buffer += data.toString();
+            let newlineIndex;
+            while ((newlineIndex = worker.buffer.indexOf('\n')) !== -1) {
+                const line = worker.buffer.substring(0, newlineIndex).trim();
+                worker.buffer = worker.buffer.substring(newlineIndex + 1);
+                if (line) {
+                    this._handleLine(worker, line);
+                }
+            }
+        });
+
+        child.stdin.on('error', (err) => {
+            console.error(`[${this.name}] Worker stdin error:`, err.message);
+        });
+
+        child.stderr.on('data', (data) => {
+            console.error(`[${this.name}] Python stderr:`, data.toString());
+        });
+
+        child.on('error', (err) => {
+            console.error(`[${this.name}] Failed to start worker:`, err.message);
+            this._handleExit(worker, null);
+        });
+
+        child.on('close', (code) => this._handleExit(worker, code));
+    }
+
+    _handleLine(worker, line) {
+        let frame;
+        try {
+            frame = JSON.parse(line);
+        } catch (e) {
+            console.log(`[${this.name}] Python stdout (non-JSON):`, line);
+            return;
+        }
+
+        if (frame.type === 'ready') {
+            worker.ready = true;
+            this._dispatch();
+            return;
+        }
+
+        const job = worker.job;
+        if (!job || frame.id !== job.id) {
+            console.log(`[${this.name}] Ignoring frame for unknown job:`, line);
+            return;
+        }
+
+        if (frame.type === 'done') {
+            worker.job = null;
+            job.resolve(job.messages);
+            this._dispatch();
+        } else if (frame.type === 'error') {
+            worker.job = null;
+            job.reject(new Error(frame.error));
+            this._dispatch();
+        } else {
+            job.messages.push(frame);
+            job.onMessage(frame);
+        }
+    }
+
+    _handleExit(worker, code) {
+        if (worker.exited) {
+            return;
+        }
+        worker.exited = true;
+        console.log(`[${this.name}] Worker pid=${worker.process.pid} exited with code ${code}`);
+        this.workers = this.workers.filter((w) => w !== worker);
+
+        if (worker.job) {
+            worker.job.reject(new Error(`Python worker exited with code ${code} while processing the request`));
+            worker.job = null;
+        }
+
+        if (this.closed) {
+            return;
+        }
+
+        // A worker that never got ready is not replaced, so we don't loop on a broken setup;
+        // the next run() tries again. Queued jobs only fail if no other worker can serve them.
+        if (!worker.ready) {
+            if (this.workers.length > 0) {
+                return;
+            }
+            const pending = this.queue.splice(0);
+            for (const job of pending) {
+                job.reject(new Error(`Python worker failed to start (exit code ${code})`));
+            }
+            return;
+        }
+
+        // Replace the crashed worker so the pool stays warm; back off if it died during startup.
+        const crashedEarly = Date.now() - worker.startedAt < CRASH_WINDOW_MS;
+        setTimeout(() => {
+            if (!this.closed && this.workers.length < this.size) {
+                this._spawn();
+            }
+            this._dispatch();
+        }, crashedEarly ? RESTART_DELAY_MS : 0);
+    }
+}
+
+module.exports = PythonWorkerPool;
@@ -0,0 +1,12 @@
+import json
+import sys
+import time
+
+# Minimal worker for the pool tests: speaks the node/worker.py protocol and
+# sleeps for the request's "sleep" seconds before answering.
+print(json.dumps({"type": "ready"}), flush=True)
+for line in sys.stdin:
+    request = json.loads(line)
+    time.sleep(request.get("sleep", 0))
+    print(json.dumps({"type": "result", "id": request["id"], "echo": request.get("echo")}), flush=True)
+    print(json.dumps({"type": "done", "id": request["id"]}), flush=True)
@@ -0,0 +1,31 @@
+const test = require('node:test');
+const assert = require('node:assert');
+const path = require('path');
+const PythonWorkerPool = require('../services/pythonWorkerPool');
+
+const WORKER = path.join(__dirname, 'fixtures', 'sleep_worker.py');
+
+test('a job after one that exceeded its deadline waits for the replacement worker', async () => {
+    const pool = new PythonWorkerPool(WORKER, { size: 1, name: 'test', deadlineGraceMs: 50 });
+    try {
+        await assert.rejects(
+            pool.run({ sleep: 30 }, () => {}, { deadline: Date.now() + 200 }),
+            { code: 'DEADLINE_EXCEEDED' }
+        );
+        const messages = await pool.run({ echo: 'after' });
+        assert.deepStrictEqual(messages.map((m) => m.echo), ['after']);
+    } finally {
+        pool.close();
+    }
+});
+
+test('rejects with QUEUE_FULL once the running slots and the queue are taken', async () => {
+    const pool = new PythonWorkerPool(WORKER, { size: 2, maxQueue: 2, name: 'test' });
+    try {
+        const results = await Promise.allSettled([1, 2, 3, 4, 5].map((n) => pool.run({ sleep: 0.1, echo: n })));
+        assert.deepStrictEqual(results.map((r) => r.status), ['fulfilled', 'fulfilled', 'fulfilled', 'fulfilled', 'rejected']);
+        assert.strictEqual(results[4].reason.code, 'QUEUE_FULL');
+    } finally {
+        pool.close();
+    }
+});